@@ -1,23 +1,46 @@
 import os
+import base64
+import sqlite3
+import hashlib
 import tempfile
+import time
 import traceback
 from typing import Optional, List
 import asyncio
+import json
 import re
-from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Depends, WebSocket, WebSocketDisconnect, Query
+import signal
+import threading
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Depends, WebSocket, WebSocketDisconnect, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel, EmailStr, constr
-from backend.data_storage import (
-    get_pdf_text, get_text_chunks, get_or_load_vectorstore, clean_text,
-    format_history_from_db, generate_rag_response, generate_general_response
-)
-from langchain_community.tools import DuckDuckGoSearchRun
 from backend.database import add_pdf, get_all_pdfs, delete_pdf, create_chat, get_all_chats, get_chat_messages, add_message, update_chat_title, delete_chat, get_message_with_sender, search_registered_restaurants
 from . import database
 from . import auth
+from . import metrics
+from . import logs
+from .shards import shard_for, shards_for_user
+from .rec_scheduler import RecommendationScheduler
+from .fanout import Fanout
+from .ingestion import IngestionManager, UPLOAD_DIR, STATUS_QUEUED, STATUS_PROCESSED, STATUS_FAILED, upload_path
 from .auth import hash_password, verify_password, create_access_token, get_email_from_token
 
-index_path = os.path.join(os.path.dirname(__file__), "faiss_index")
+log = logs.get_logger(__name__)
+
+index_path = os.getenv("FAISS_INDEX_PATH", os.path.join(os.path.dirname(__file__), "faiss_index"))
+# On shutdown, how long to wait for queued/running @recme jobs and ingestion before stopping them
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+# On SIGTERM, how long /ready answers 503 while the worker still serves, before the server starts closing
+SHUTDOWN_PRESTOP_SECONDS = float(os.getenv("SHUTDOWN_PRESTOP_SECONDS", "5"))
+# Responses of at least this many bytes are gzip-compressed for clients that accept it
+GZIP_MIN_BYTES = int(os.getenv("GZIP_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
 
 app = FastAPI(title="Chatbot API", version="1.0.0")
 
@@ -29,9 +52,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-# Global vectorstore (shared across all chats)
-vectorstore = None
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
+# The PDF/OCR, vector-store and LLM stacks (data_storage, vector_store, recommendation) are
+# imported on first use, so a worker serves auth and chat without loading them; preload()
+# imports them up front where that pays off (the serve.py master, before fork).
+
+# Per-tenant index shards; each chat only searches the shards it can see.
+# Created on first use and loaded in the background on startup (see _load_vectorstore)
+_vectorstore = None
+_vectorstore_lock = threading.Lock()
+_vectorstore_loaded = threading.Event()
+
+def get_vectorstore():
+    global _vectorstore
+    with _vectorstore_lock:
+        if _vectorstore is None:
+            from .vector_store import ShardedVectorStore
+            _vectorstore = ShardedVectorStore(index_path)
+        return _vectorstore
+
+WS_CONNECTIONS = metrics.gauge("foodchat_ws_connections", "Open chat websockets")
+WS_BROADCAST_SECONDS = metrics.histogram("foodchat_ws_broadcast_seconds", "Time to fan a message out to every socket in a chat")
+WS_MESSAGES_SENT = metrics.counter("foodchat_ws_messages_sent_total", "Websocket frames sent by broadcasts")
 
 class ConnectionManager:
     def __init__(self):
@@ -42,17 +85,102 @@ class ConnectionManager:
         if chat_id not in self.active_connections:
             self.active_connections[chat_id] = []
         self.active_connections[chat_id].append(websocket)
+        WS_CONNECTIONS.inc()
 
     def disconnect(self, websocket: WebSocket, chat_id: int):
         if chat_id in self.active_connections:
             self.active_connections[chat_id].remove(websocket)
+            WS_CONNECTIONS.dec()
 
     async def broadcast(self, message: str, chat_id: int):
+        """Send to the chat's sockets in every worker process."""
+        await fanout.publish(chat_id, message)
+
+    async def deliver(self, chat_id: int, message: str):
+        """Send to the chat's sockets connected to this process."""
         if chat_id in self.active_connections:
-            for connection in self.active_connections[chat_id]:
-                await connection.send_text(message)
+            with WS_BROADCAST_SECONDS.time():
+                for connection in self.active_connections[chat_id]:
+                    await connection.send_text(message)
+                    WS_MESSAGES_SENT.inc()
 
 manager = ConnectionManager()
+# Relays broadcasts to the other workers when serve.py runs several (FANOUT_DIR)
+fanout = Fanout(manager.deliver)
+
+async def _summarize_and_broadcast(chat_id: int, data: str):
+    try:
+        from .recommendation import generate_recommendation
+
+        vectorstore = await asyncio.to_thread(get_vectorstore)
+        scope = await asyncio.to_thread(vectorstore.scoped, chat_id)
+        bot_text = await generate_recommendation(chat_id, data, scope)
+        # Save bot message and broadcast
+        bot_id = await asyncio.to_thread(database.add_message, chat_id, bot_text, "bot", None)
+        bot_msg = await asyncio.to_thread(database.get_message_with_sender, bot_id)
+        await manager.broadcast(json.dumps(bot_msg), chat_id)
+    except Exception:
+        # On any failure, send a safe fallback once; the scheduler logs and counts the failure
+        try:
+            fallback = (
+                "I encountered an error while finding recommendations. Please try again."
+            )
+            bot_id = await asyncio.to_thread(database.add_message, chat_id, fallback, "bot", None)
+            bot_msg = await asyncio.to_thread(database.get_message_with_sender, bot_id)
+            await manager.broadcast(json.dumps(bot_msg), chat_id)
+        except Exception:
+            log.exception("recommendation_fallback_failed", chat_id=chat_id)
+        raise
+
+def _index_chunks(pdf_id, chunks, progress, replace=True):
+    """Embed a window of a PDF's chunks and add them to their tenant's shard (`replace`: the first window)."""
+    from .data_storage import embed_chunks
+
+    text_embeddings = embed_chunks(chunks, progress)
+    # Resumed jobs can get here before startup has opened the index
+    _vectorstore_loaded.wait()
+    get_vectorstore().add(pdf_id, text_embeddings, replace=replace)
+
+def _discard_chunks(pdf_id):
+    """Tombstone what a failed ingestion already added, so a half-indexed PDF is never searched."""
+    _vectorstore_loaded.wait()
+    get_vectorstore().delete_pdf(pdf_id)
+
+def _load_vectorstore():
+    """Open the index shards (manifests and tombstones); runs in a thread so startup does not wait for it."""
+    try:
+        if os.path.exists(index_path):
+            log.info("vectorstore_loading", path=index_path)
+        vectorstore = get_vectorstore().load()
+        server_state["index"] = "ok"
+        log.info("vectorstore_ready", vectors=len(vectorstore), shards=len(vectorstore.shard_names()))
+    except Exception as e:
+        server_state["index"] = f"error: {e}"
+        log.exception("vectorstore_load_failed")
+    finally:
+        _vectorstore_loaded.set()
+
+async def _compact_vectorstore_periodically():
+    from .vector_store import VECTOR_COMPACT_INTERVAL_SECONDS
+
+    vectorstore = get_vectorstore()
+    while True:
+        await asyncio.sleep(VECTOR_COMPACT_INTERVAL_SECONDS)
+        try:
+            if vectorstore.needs_compaction():
+                await asyncio.to_thread(vectorstore.compact)
+        except Exception as e:
+            log.exception("vectorstore_compaction_failed")
+
+ingestion = IngestionManager(_index_chunks, _discard_chunks)
+
+# Bounded, per-chat single-flight runner for @recme jobs
+rec_scheduler = RecommendationScheduler(
+    _summarize_and_broadcast, claim_fn=database.claim_recme, finish_fn=database.finish_recme
+)
+metrics.gauge("foodchat_recme_queue_depth", "@recme jobs waiting for a worker").set_function(rec_scheduler.queue_depth)
+metrics.gauge("foodchat_recme_running", "@recme jobs currently running").set_function(rec_scheduler.running)
+metrics.gauge("foodchat_ingest_jobs_active", "PDF ingestion jobs queued or running").set_function(ingestion.active_count)
 
 class ChatMessage(BaseModel):
     message: str
@@ -99,26 +227,130 @@ class BiddingRulesRequest(BaseModel):
     bid_amount: float
     max_budget: float
 
+# What /ready reports; set by the startup and shutdown handlers below
+server_state = {"index": "loading", "draining": False, "maintenance": False}
+_maintenance_lock_fd = None
+
+def _claim_maintenance():
+    """
+    Whether this process runs index compaction and resumes interrupted ingestion jobs.
+    With several workers (serve.py) only the one holding <index>/.maintenance.lock does.
+    """
+    global _maintenance_lock_fd
+    if fcntl is None:
+        return True
+    os.makedirs(index_path, exist_ok=True)
+    fd = os.open(os.path.join(index_path, ".maintenance.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    # Held until the process exits
+    _maintenance_lock_fd = fd
+    return True
+
 @app.on_event("startup")
 def startup():
     """Initialize the app on startup"""
-    global vectorstore
     # Initialize database
     database.init_db()
     
-    # Try to load existing vectorstore if it exists
-    try:
-        if os.path.exists(index_path):
-            print("[STARTUP] Loading existing vectorstore...")
-            vectorstore = get_or_load_vectorstore([], path=index_path)  # Load without adding chunks
-            print("[STARTUP] Loaded existing vectorstore")
-        else:
-            print("[STARTUP] No existing vectorstore found")
-    except Exception as e:
-        print(f"[STARTUP] Error loading vectorstore: {e}")
-        vectorstore = None
-    
-    print("Backend started successfully!")
+    server_state["maintenance"] = _claim_maintenance()
+    log.info("backend_started", maintenance=server_state["maintenance"])
+
+def _begin_drain():
+    if not server_state["draining"]:
+        server_state["draining"] = True
+        log.info("shutdown_draining", prestop_seconds=SHUTDOWN_PRESTOP_SECONDS, drain_seconds=SHUTDOWN_DRAIN_SECONDS)
+
+@app.on_event("startup")
+async def install_drain_signal():
+    """
+    Report draining on /ready as soon as SIGTERM arrives.
+
+    The server's own SIGTERM handler closes the listening sockets, and lifespan shutdown
+    runs only after connections finish. A load balancer would never see the 503. So
+    SIGTERM first marks the worker draining. The worker keeps serving for
+    SHUTDOWN_PRESTOP_SECONDS, then the server's handler runs. A second SIGTERM skips
+    the wait.
+    """
+    loop = asyncio.get_running_loop()
+    # uvicorn installs its handlers before the startup handlers run
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return
+
+    def on_sigterm(signum, frame):
+        if server_state["draining"]:
+            previous(signum, frame)
+            return
+        _begin_drain()
+        loop.call_soon_threadsafe(loop.call_later, SHUTDOWN_PRESTOP_SECONDS, previous, signum, None)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+@app.on_event("shutdown")
+async def begin_drain():
+    # Shutdown without SIGTERM (e.g. SIGINT): /ready reports 503 while the rest drain
+    _begin_drain()
+
+_index_load_task = None
+
+@app.on_event("startup")
+async def start_vectorstore_load():
+    global _index_load_task
+    from .vector_store import check_embedding_model
+
+    # Vectors of another embedding model would return confident nonsense: raising here fails
+    # startup with EmbeddingModelMismatch's message (only the manifests are read)
+    await asyncio.to_thread(check_embedding_model, index_path)
+    # /ready answers 503 ("loading") until the index is open
+    _index_load_task = asyncio.create_task(asyncio.to_thread(_load_vectorstore))
+
+@app.on_event("startup")
+async def start_rec_scheduler():
+    await rec_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_rec_scheduler():
+    # Running jobs still save their reply, even if its sockets have already closed
+    await rec_scheduler.stop(timeout=SHUTDOWN_DRAIN_SECONDS)
+
+@app.on_event("startup")
+async def start_ingestion():
+    await ingestion.start(resume=server_state["maintenance"])
+
+@app.on_event("startup")
+async def start_fanout():
+    await fanout.start()
+
+_compaction_task = None
+
+@app.on_event("startup")
+async def start_vectorstore_compaction():
+    global _compaction_task
+    if server_state["maintenance"]:
+        # Imports the vector store in a thread, not on the event loop
+        await asyncio.to_thread(get_vectorstore)
+        _compaction_task = asyncio.create_task(_compact_vectorstore_periodically())
+
+@app.on_event("shutdown")
+async def stop_vectorstore_compaction():
+    if _compaction_task is not None:
+        _compaction_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_ingestion():
+    # Unfinished jobs keep their active status and resume on the next start
+    await ingestion.stop(timeout=SHUTDOWN_DRAIN_SECONDS)
+
+@app.on_event("shutdown")
+async def finish_shutdown():
+    await fanout.stop()
+    if _vectorstore is not None:
+        await asyncio.to_thread(_vectorstore.close)
+    log.info("worker_stopped")
 
 def get_current_user(authorization: str = Header(...)):
     if not authorization.lower().startswith("bearer "):
@@ -132,6 +364,12 @@ def get_current_user(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="User not found")
     return user  # dict with id, email, ...
 
+def get_optional_user(authorization: Optional[str] = Header(None)):
+    """The authenticated user, or None for anonymous requests (a bad token is still rejected)."""
+    if not authorization:
+        return None
+    return get_current_user(authorization)
+
 def get_current_restaurant(authorization: str = Header(...)):
     if not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Invalid auth header")
@@ -158,6 +396,29 @@ async def get_current_user_ws(token: str = Query(...)):
     user = database.get_user_by_email(email)
     return user
 
+# Listings carry an ETag derived from the version counters of what they show (database.get_versions),
+# so a client revalidating an unchanged view gets a 304 without the listing being queried or rebuilt
+LISTING_CACHE_CONTROL = "private, no-cache"
+
+def listing_etag(scope, user_id, keys):
+    """Weak ETag of listing `scope` as seen by `user_id`; changes whenever a version in `keys` does."""
+    versions = database.get_versions(keys)
+    digest = hashlib.sha1(json.dumps([scope, user_id, versions]).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def not_modified(etag, if_none_match):
+    """A 304 response if `If-None-Match` lists `etag` (weak comparison), else None."""
+    if not if_none_match:
+        return None
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": LISTING_CACHE_CONTROL})
+    return None
+
+def set_listing_etag(response, etag):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = LISTING_CACHE_CONTROL
+
 class InviteRequest(BaseModel):
     emails: List[EmailStr]
 
@@ -230,11 +491,45 @@ def delete_restaurant_account(restaurant: dict = Depends(get_current_restaurant)
     return {}
 
 @app.get("/users", response_model=List[dict])
-def get_all_users_endpoint(user=Depends(get_current_user)):
-    """Returns a list of all users (id and email)."""
+def get_all_users_endpoint(response: Response, user=Depends(get_current_user), if_none_match: Optional[str] = Header(None)):
+    """Returns a list of all users (id and email). Grows with the user table; pickers should use /users/search."""
+    etag = listing_etag("users", None, ["users"])
+    cached = not_modified(etag, if_none_match)
+    if cached:
+        return cached
     users = database.get_all_users()
+    set_listing_etag(response, etag)
     return users
 
+USER_SEARCH_MAX_LIMIT = int(os.getenv("USER_SEARCH_MAX_LIMIT", "50"))
+
+def _encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps(after).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor):
+    try:
+        phase, key, last_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if phase not in ("username", "email"):
+            raise ValueError(phase)
+        return phase, str(key), int(last_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/users/search")
+def search_users_endpoint(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1),
+    cursor: Optional[str] = None,
+    user=Depends(get_current_user),
+):
+    """
+    Users whose username or email starts with `q` (case-insensitive), username matches first.
+    Pass `next_cursor` back as `cursor` for the next page; it is null on the last one.
+    """
+    after = _decode_cursor(cursor) if cursor else None
+    users, after = database.search_users(q, min(limit, USER_SEARCH_MAX_LIMIT), after)
+    return {"users": users, "next_cursor": _encode_cursor(after) if after else None}
+
 
 # --- Group Chat Endpoints ---
 
@@ -244,8 +539,13 @@ def create_new_chat(request: CreateChatRequest, user=Depends(get_current_user)):
     return {"chat_id": chat_id, "title": request.title}
 
 @app.get("/chats", response_model=ChatListResponse)
-def get_chats(user=Depends(get_current_user)):
+def get_chats(response: Response, user=Depends(get_current_user), if_none_match: Optional[str] = Header(None)):
+    etag = listing_etag("chats", user["id"], [f"chats:{user['id']}", "usernames"])
+    cached = not_modified(etag, if_none_match)
+    if cached:
+        return cached
     chats = database.get_user_chats(user["id"])
+    set_listing_etag(response, etag)
     return ChatListResponse(chats=chats)
 
 @app.post("/chats/{chat_id}/invite", response_model=dict)
@@ -294,10 +594,17 @@ def remove_member_endpoint(chat_id: int, member_id: int, user: dict = Depends(ge
     return {}
 
 @app.get("/chats/{chat_id}/members", response_model=dict)
-def list_members(chat_id: int, user=Depends(get_current_user)):
+def list_members(chat_id: int, response: Response, user=Depends(get_current_user), if_none_match: Optional[str] = Header(None)):
+    # Membership first: `If-None-Match: *` matches any ETag, so a 304 must not reach a non-member
     if not database.is_member(chat_id, user["id"]):
         raise HTTPException(status_code=403, detail="Not a member")
-    return {"members": database.get_chat_members(chat_id)}
+    etag = listing_etag(f"members:{chat_id}", user["id"], [f"members:{chat_id}", "usernames"])
+    cached = not_modified(etag, if_none_match)
+    if cached:
+        return cached
+    members = database.get_chat_members(chat_id)
+    set_listing_etag(response, etag)
+    return {"members": members}
 
 @app.get("/chats/{chat_id}/messages")
 def get_chat_messages_endpoint(chat_id: int, user=Depends(get_current_user)):
@@ -306,6 +613,24 @@ def get_chat_messages_endpoint(chat_id: int, user=Depends(get_current_user)):
     messages = database.get_chat_messages(chat_id)
     return {"messages": messages}
 
+# Replies to an @recme the scheduler did not take; sent to the sender only, not stored
+RECME_NOTICES = {
+    "cooldown": "I just sent recommendations to this chat. Try @recme again in a few seconds.",
+    "rejected": "I'm busy with other recommendations right now. Please try @recme again in a moment.",
+}
+
+def _bot_notice(content: str) -> dict:
+    """A message shaped like a stored bot message, with a negative id no stored message has."""
+    now = time.time()
+    return {
+        "id": -int(now * 1000),
+        "content": content,
+        "sender": "bot",
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now)),
+        "sender_username": None,
+        "ephemeral": True,
+    }
+
 @app.websocket("/ws/{chat_id}")
 async def websocket_endpoint(websocket: WebSocket, chat_id: int, user: dict = Depends(get_current_user_ws)):
     if not user or not database.is_member(chat_id, user["id"]):
@@ -320,263 +645,169 @@ async def websocket_endpoint(websocket: WebSocket, chat_id: int, user: dict = De
             message_id = database.add_message(chat_id, data, "user", user_id=user["id"])
             # Get full message to broadcast
             message = database.get_message_with_sender(message_id)
-            import json
             await manager.broadcast(json.dumps(message), chat_id)
 
             # Detect @recme trigger (case-insensitive, word boundary)
             if re.search(r"@recme\b", data, flags=re.IGNORECASE):
-                # Offload summary generation to a thread to avoid blocking event loop
-                async def _summarize_and_broadcast():
-                    try:
-                        # Fetch recent chat history (last 100 messages)
-                        rows = await asyncio.to_thread(database.get_chat_messages, chat_id)
-                        history_msgs = format_history_from_db(rows)
-
-                        # RAG Retrieval
-                        rag_info = ""
-                        if vectorstore:
-                            print(f"[RAG] Querying vectorstore with: {data}")
-                            try:
-                                rag_response = await asyncio.to_thread(
-                                    generate_rag_response,
-                                    vectorstore,
-                                    data,
-                                    history_messages=history_msgs[-6:]
-                                )
-                                if "no relevant information" not in rag_response.lower():
-                                    rag_info = rag_response
-                                    print("[RAG] Relevant info found.")
-                                else:
-                                    print("[RAG] No relevant info found in docs.")
-                            except Exception as e:
-                                print(f"[RAG] Error: {e}")
-
-                        # Build a concise summary using LLM without retrieval
-                        from langchain_openai import ChatOpenAI
-                        from langchain_core.messages import SystemMessage, HumanMessage
-                        import json
-
-                        llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
-                        
-                        # Step 1: Identify Intent
-                        print(f"[RECOMMENDATION] Analyzing intent for chat {chat_id}...")
-                        
-                        # Inject RAG info into the system prompt for intent analysis
-                        intent_system_content = (
-                            "You are a helpful assistant. Analyze the conversation to identify the user's desired cuisine and location.\n"
-                            "Return ONLY a JSON object with keys 'cuisine' and 'location'.\n"
-                            "Example: {\"cuisine\": \"Chinese\", \"location\": \"Los Angeles\"}\n"
-                            "If you cannot determine them, return {\"cuisine\": null, \"location\": null}."
-                        )
-                        
-                        if rag_info:
-                            intent_system_content += f"\n\nAdditional Context from User Documents:\n{rag_info}\nUse this context to infer preferences if not explicitly stated in the chat."
-
-                        system_intent = SystemMessage(content=intent_system_content)
-                        prompt_intent = HumanMessage(content="Analyze this chat history.")
-                        
-                        resp_intent = await asyncio.to_thread(llm.invoke, [system_intent, *history_msgs[-40:], prompt_intent])
-                        content_intent = (getattr(resp_intent, "content", "") or "").strip()
-                        print(f"[RECOMMENDATION] Intent raw response: {content_intent}")
-                        
-                        # Clean up potential markdown code blocks
-                        if content_intent.startswith("```json"):
-                            content_intent = content_intent[7:-3]
-                        elif content_intent.startswith("```"):
-                            content_intent = content_intent[3:-3]
-                            
-                        try:
-                            intent_data = json.loads(content_intent)
-                        except:
-                            print(f"[RECOMMENDATION] Failed to parse intent JSON")
-                            intent_data = {"cuisine": None, "location": None}
-                            
-                        cuisine = intent_data.get("cuisine")
-                        location = intent_data.get("location")
-                        print(f"[RECOMMENDATION] Extracted: Cuisine='{cuisine}', Location='{location}'")
-
-                        if not cuisine or not location:
-                            bot_text = "I couldn't identify what you're looking for. Please specify cuisine and location."
-                        else:
-                            # Step 2: Search Registered Restaurants
-                            print(f"[RECOMMENDATION] Searching registered restaurants...")
-                            registered = await asyncio.to_thread(database.search_registered_restaurants, cuisine, location)
-                            print(f"[RECOMMENDATION] Found {len(registered)} registered restaurants")
-                            
-                            recommendations = []
-                            # Add registered restaurants (already sorted by bid)
-                            for r in registered:
-                                recommendations.append({
-                                    "name": r["name"],
-                                    "website": r["website"],
-                                    "source": "sponsored"
-                                })
-                            
-                            # Step 3: Fill gaps with Web Search
-                            if len(recommendations) < 5:
-                                needed = 5 - len(recommendations)
-                                print(f"[RECOMMENDATION] Need {needed} more from web search...")
-                                search = DuckDuckGoSearchRun()
-                                # Improved query: prioritize official sites but allow aggregators for discovery
-                                query = f"official website {cuisine} restaurant {location}"
-                                print(f"[RECOMMENDATION] Running web search: '{query}'")
-                                search_results = await asyncio.to_thread(search.run, query)
-                                print(f"[RECOMMENDATION] Web search raw results length: {len(search_results)}")
-                                
-                                # Use LLM to parse search results
-                                system_parse = SystemMessage(content=(
-                                    f"Extract exactly {needed} distinct real restaurants from the search results text.\n"
-                                    "Return ONLY a JSON array of objects with 'name' and 'website' keys.\n"
-                                    "For 'website', prioritize the official site. If not found, use a Yelp/TripAdvisor/OpenTable link from the results.\n"
-                                    "Ensure the restaurant matches the cuisine '{cuisine}'."
-                                ))
-                                prompt_parse = HumanMessage(content=f"Search Results Text: {search_results}")
-                                
-                                resp_parse = await asyncio.to_thread(llm.invoke, [system_parse, prompt_parse])
-                                content_parse = (getattr(resp_parse, "content", "") or "").strip()
-                                print(f"[RECOMMENDATION] Parsed web results: {content_parse}")
-                                
-                                if content_parse.startswith("```json"):
-                                    content_parse = content_parse[7:-3]
-                                elif content_parse.startswith("```"):
-                                    content_parse = content_parse[3:-3]
-                                
-                                try:
-                                    external_recs = json.loads(content_parse)
-                                    if isinstance(external_recs, list):
-                                        for r in external_recs:
-                                            if len(recommendations) < 5:
-                                                # Fallback for null website: Google Search link
-                                                website = r.get("website")
-                                                if not website:
-                                                    website = f"https://www.google.com/search?q={r.get('name')} {location} official website"
-                                                
-                                                recommendations.append({
-                                                    "name": r.get("name"),
-                                                    "website": website,
-                                                    "source": "organic"
-                                                })
-                                except Exception as e:
-                                    print(f"[RECOMMENDATION] Error parsing web results: {e}")
-
-                            # Step 4: Format Response
-                            bot_text = f"Here are some {cuisine} recommendations in {location}:\n\n"
-                            
-                            # Split into Sponsored and Organic
-                            sponsored = [r for r in recommendations if r.get("source") == "sponsored"]
-                            organic = [r for r in recommendations if r.get("source") == "organic"]
-                            
-                            if sponsored:
-                                bot_text += "**Top Recommended**\n"
-                                for i, rec in enumerate(sponsored, 1):
-                                    website = rec.get('website', '')
-                                    if not website.startswith(('http://', 'https://')):
-                                        website = 'http://' + website
-                                    bot_text += f"{i}. **{rec['name']}**\n   [{rec['website']}]({website})\n"
-                                bot_text += "\n"
-                                
-                            if organic:
-                                bot_text += "**Other Recommended**\n"
-                                for i, rec in enumerate(organic, 1):
-                                    website = rec.get('website', '')
-                                    if not website.startswith(('http://', 'https://')):
-                                        website = 'http://' + website
-                                    bot_text += f"{i}. **{rec['name']}**\n   [{rec['website']}]({website})\n"
-
-                        # Save bot message and broadcast
-                        bot_id = await asyncio.to_thread(database.add_message, chat_id, bot_text, "bot", None)
-                        bot_msg = await asyncio.to_thread(database.get_message_with_sender, bot_id)
-                        await manager.broadcast(json.dumps(bot_msg), chat_id)
-                    except Exception as e:
-                        # On any failure, send a safe fallback once
-                        print(f"Error in recommendation: {e}")
-                        try:
-                            fallback = (
-                                "I encountered an error while finding recommendations. Please try again."
-                            )
-                            bot_id = await asyncio.to_thread(database.add_message, chat_id, fallback, "bot", None)
-                            bot_msg = await asyncio.to_thread(database.get_message_with_sender, bot_id)
-                            await manager.broadcast(json.dumps(bot_msg), chat_id)
-                        except Exception:
-                            pass
-
-                asyncio.create_task(_summarize_and_broadcast())
+                status, _ = rec_scheduler.submit(chat_id, data)
+                log.info("recme_triggered", chat_id=chat_id, status=status)
+                if status in RECME_NOTICES:
+                    # Only the sender hears why nothing is coming (and their client drops its loader)
+                    await websocket.send_text(json.dumps(_bot_notice(RECME_NOTICES[status])))
     except WebSocketDisconnect:
         manager.disconnect(websocket, chat_id)
     except Exception as e:
-        print(f"WebSocket Error: {e}")
+        log.exception("websocket_error", chat_id=chat_id)
         manager.disconnect(websocket, chat_id)
 
-# Make upload async (it awaits file.read()); keep public for now
-@app.post("/upload-pdf")
+# Upload only stores the file and queues ingestion; anonymous uploads stay public (global shard) for now
+@app.post("/upload-pdf", status_code=202)
 async def upload_pdf_endpoint(  # type: ignore[func-annotations]
-    file: UploadFile = File(...)
+    response: Response,
+    file: UploadFile = File(...),
+    chat_id: Optional[int] = Form(None),
+    user: Optional[dict] = Depends(get_optional_user)
 ):
-    """Upload and process a PDF file"""
-    global vectorstore
-    
+    """
+    Store an uploaded PDF and queue it for background ingestion; re-uploads of the same bytes are no-ops.
+    With `chat_id` the PDF is only retrievable in that chat; a signed-in upload without it is
+    retrievable in every chat of the uploader.
+    """
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
+    if chat_id is not None and (user is None or not await asyncio.to_thread(database.is_member, chat_id, user["id"])):
+        raise HTTPException(status_code=403, detail="Not a member of this chat")
+    owner_user_id = user["id"] if user else None
+    shard = shard_for(owner_user_id, chat_id)
     
+    tmp_file_path = None
     try:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-            file_size = len(content)
-        
-        # Process the PDF
-        print(f"Processing PDF: {file.filename}")
-        raw_text = get_pdf_text([tmp_file_path])
+        # Stream the upload to disk in 1 MiB pieces instead of reading it into memory, hashing as we go
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        fd, tmp_file_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.part')
+        file_size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as tmp_file:
+            while True:
+                content = await file.read(1 << 20)
+                if not content:
+                    break
+                tmp_file.write(content)
+                digest.update(content)
+                file_size += len(content)
+        sha256 = digest.hexdigest()
         
-        if not raw_text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
+        try:
+            pdf_id = await asyncio.to_thread(add_pdf, file.filename, file_size, STATUS_QUEUED, sha256, owner_user_id, chat_id, shard)
+        except sqlite3.IntegrityError:
+            existing = await asyncio.to_thread(database.get_pdf_by_sha256, sha256, shard)
+            if existing is None:
+                raise
+            pdf_id = existing["id"]
+            if existing["status"] != STATUS_FAILED:
+                os.unlink(tmp_file_path)
+                response.status_code = 200
+                log.info("pdf_duplicate_upload", filename=file.filename, pdf_id=pdf_id)
+                return {
+                    "message": f"PDF '{file.filename}' was already uploaded as '{existing['filename']}'.",
+                    "filename": existing["filename"],
+                    "id": pdf_id,
+                    "job_id": pdf_id,
+                    "status": existing["status"],
+                    "duplicate": True,
+                }
+            # A previous attempt failed: retry it with the new copy
+            await asyncio.to_thread(database.update_pdf_status, pdf_id, STATUS_QUEUED)
         
-        # Clean and chunk the text
-        cleaned_text = clean_text(raw_text)
-        text_chunks = get_text_chunks(cleaned_text)
+        stored_path = upload_path(pdf_id)
+        os.replace(tmp_file_path, stored_path)
+        ingestion.submit(pdf_id, file.filename, stored_path)
+        log.info("pdf_queued", filename=file.filename, pdf_id=pdf_id, bytes=file_size)
         
-        # Add to database
-        pdf_id = add_pdf(file.filename, file_size)
-        
-        # Create or update vectorstore (this will add to existing if it exists)
-        if vectorstore is None:
-            # First time: create vectorstore
-            vectorstore = get_or_load_vectorstore(text_chunks, path=index_path)
-        else:
-            if text_chunks:
-                vectorstore.add_texts(text_chunks)
-                vectorstore.save_local(index_path)
-                print(f"[INFO] Added {len(text_chunks)} chunks to existing vectorstore")
-        
-        # Clean up temporary file
-        os.unlink(tmp_file_path)
-        
-        return {"message": f"PDF '{file.filename}' processed successfully!", "filename": file.filename, "id": pdf_id}
+        return {
+            "message": f"PDF '{file.filename}' uploaded; processing in background.",
+            "filename": file.filename,
+            "id": pdf_id,
+            "job_id": pdf_id,
+            "status": STATUS_QUEUED,
+        }
         
     except Exception as e:
-        print(f"Error processing PDF: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+        if tmp_file_path and os.path.exists(tmp_file_path):
+            os.unlink(tmp_file_path)
+        log.exception("pdf_upload_failed", filename=file.filename)
+        raise HTTPException(status_code=500, detail=f"Error uploading PDF: {str(e)}")
+
+async def _can_see_pdf(pdf, user):
+    """Global PDFs are everyone's; user and chat PDFs only their owner's and the chat members'."""
+    if pdf["shard"] == shard_for():
+        return True
+    visible = await asyncio.to_thread(shards_for_user, user["id"]) if user else []
+    return pdf["shard"] in visible
+
+@app.get("/pdfs/{pdf_id}/job")
+async def get_pdf_job(pdf_id: int, user: Optional[dict] = Depends(get_optional_user)):
+    """Progress of a PDF's ingestion job (404 for PDFs the caller can't see)"""
+    pdf = await asyncio.to_thread(database.get_pdf, pdf_id)
+    if not pdf or not await _can_see_pdf(pdf, user):
+        raise HTTPException(status_code=404, detail="PDF not found")
+    job = ingestion.get(pdf_id)
+    if job is not None:
+        return job.to_dict()
+    # Finished before this process started (or on another worker): only the stored status is known
+    return {
+        "job_id": pdf_id,
+        "pdf_id": pdf_id,
+        "filename": pdf["filename"],
+        "status": pdf["status"],
+        "progress": 1.0 if pdf["status"] == STATUS_PROCESSED else None,
+    }
 
 @app.get("/pdfs")
-async def get_pdfs():
-    """Get all uploaded PDFs"""
+def get_pdfs(response: Response, user: Optional[dict] = Depends(get_optional_user), if_none_match: Optional[str] = Header(None)):
+    """Get the uploaded PDFs the caller can see (anonymous callers only see the global ones)"""
     try:
-        pdfs = get_all_pdfs()
+        # Which shards a user sees follows their chat memberships, not their chats' messages
+        user_id = user["id"] if user else None
+        keys = ["pdfs"] + ([f"memberships:{user_id}"] if user else [])
+        etag = listing_etag("pdfs", user_id, keys)
+        cached = not_modified(etag, if_none_match)
+        if cached:
+            return cached
+        shards = shards_for_user(user["id"]) if user else [shard_for()]
+        pdfs = get_all_pdfs(shards)
+        set_listing_etag(response, etag)
         return {"pdfs": pdfs}
     except Exception as e:
-        print(f"Error getting PDFs: {str(e)}")
+        log.exception("pdf_list_failed")
         raise HTTPException(status_code=500, detail="Error retrieving PDFs")
 
+def _delete_pdf_and_vectors(pdf_id):
+    """
+    Two commits, not one transaction. First the pdfs row goes, with its vectors marked
+    deleted. Then the index stops matching them: the shard's manifest version is bumped
+    under its file lock, so every worker reloads its tombstones. Compaction removes the
+    vectors later.
+    """
+    delete_pdf(pdf_id)
+    removed = get_vectorstore().delete_pdf(pdf_id)
+    if os.path.exists(upload_path(pdf_id)):
+        os.unlink(upload_path(pdf_id))
+    return removed
+
 @app.delete("/pdfs/{pdf_id}")
-async def delete_pdf_endpoint(pdf_id: int):
-    """Delete a PDF"""
+async def delete_pdf_endpoint(pdf_id: int, user: Optional[dict] = Depends(get_optional_user)):
+    """Delete a PDF (one uploaded by a user or into a chat can only be deleted by those who see it)"""
+    pdf = await asyncio.to_thread(database.get_pdf, pdf_id)
+    if pdf and not await _can_see_pdf(pdf, user):
+        raise HTTPException(status_code=403, detail="Not allowed to delete this PDF")
     try:
-        delete_pdf(pdf_id)
+        # Both steps take locks, write and fsync; off the event loop
+        removed = await asyncio.to_thread(_delete_pdf_and_vectors, pdf_id)
+        log.info("pdf_deleted", pdf_id=pdf_id, tombstoned=removed)
         return {"message": "PDF deleted successfully"}
     except Exception as e:
-        print(f"Error deleting PDF: {str(e)}")
+        log.exception("pdf_delete_failed", pdf_id=pdf_id)
         raise HTTPException(status_code=500, detail="Error deleting PDF")
 
 @app.delete("/api/restaurant", status_code=204)
@@ -585,11 +816,57 @@ def delete_restaurant_account(restaurant: dict = Depends(get_current_restaurant)
     database.delete_restaurant(restaurant["id"])
     return {}
 
+@app.get("/recme/stats")
+async def recme_stats():
+    """Queue depth, wait times and outcome counts for @recme jobs"""
+    return rec_scheduler.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of request, pipeline, SQL and queue metrics"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness: the process and its event loop respond (no dependency checks; see /ready)"""
     return {"status": "healthy", "message": "API is running"}
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """Readiness: the database answers, the vector index loaded, the job runners started and the worker is not draining"""
+    checks = {"index": server_state["index"]}
+    try:
+        await asyncio.to_thread(database.ping)
+        checks["database"] = "ok"
+    except Exception as e:
+        checks["database"] = f"error: {e}"
+    checks["recme_scheduler"] = "ok" if rec_scheduler.started else "stopped"
+    checks["ingestion"] = "ok" if ingestion.started else "stopped"
+    ready = not server_state["draining"] and all(v == "ok" for v in checks.values())
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else ("draining" if server_state["draining"] else "not_ready"),
+        "pid": os.getpid(),
+        "maintenance": server_state["maintenance"],
+        "checks": checks,
+    }
+
+def preload():
+    """
+    Warm shared, read-only state in the serve.py master before it forks workers: schema
+    and index migrations run once instead of racing in every worker (an index built with
+    another embedding model fails here, before any worker starts), and the lazily imported
+    stacks and tokenizer tables are loaded once so the workers share their pages copy-on-write.
+    """
+    database.init_db()
+    from . import data_storage, recommendation  # noqa: F401
+    from .vector_store import ShardedVectorStore
+    from .llm_gateway import token_encoding
+
+    ShardedVectorStore(index_path).load()
+    token_encoding()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,216 @@
+"""
+Token-aware chunking that follows the document's structure (CHUNKER=tokens).
+
+Text is parsed into headings, tables (the "cell | cell" rows pdf_utilities emits for
+extract_tables) and paragraphs, which are packed greedily into chunks of at most
+CHUNK_TOKENS tokens, counted with the embedding model's tokenizer:
+
+- a heading starts a new chunk (unless the current one is still small), and every
+  further chunk of the same section repeats the heading so it stays retrievable;
+- tables are only split between rows, and each piece repeats the header row;
+- paragraphs are split at sentence boundaries (at token boundaries for a sentence
+  longer than a chunk); only there do consecutive chunks overlap, by the last
+  CHUNK_OVERLAP_TOKENS tokens.
+
+Compared with fixed 1500/500-character windows this embeds each part of a document
+about once instead of 1.5 times, and no chunk exceeds the model's token budget.
+"""
+import os
+import re
+from backend.llm_gateway import token_encoding
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+_SECTION_WORDS = re.compile(
+    r"^(ingredients|directions|instructions|method|preparation|steps|notes|serves|servings|yield|"
+    r"prep time|cook time|total time|nutrition)\b",
+    re.IGNORECASE,
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"[A-Za-z][\w'-]*")
+# Without tiktoken: a word or punctuation mark with its leading whitespace per "token"
+_FALLBACK_TOKEN = re.compile(r"\s*(?:\w+|[^\w\s])|\s+$")
+
+
+class Tokenizer:
+    """tiktoken encoding of the embedding model, or an approximate word tokenizer without it."""
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding if encoding is not None else token_encoding()
+
+    def encode(self, text):
+        if self.encoding is None:
+            return _FALLBACK_TOKEN.findall(text)
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, tokens):
+        if self.encoding is None:
+            return "".join(tokens)
+        return self.encoding.decode(tokens)
+
+    def count(self, text):
+        return len(self.encode(text))
+
+
+def is_heading(line):
+    """Short title-like lines: recipe section names, "Title Case" or ALL CAPS lines, "Label:" lines."""
+    line = line.strip()
+    if not line or len(line) > 80 or " | " in line:
+        return False
+    words = _WORD.findall(line)
+    if _SECTION_WORDS.match(line) and len(line.split()) <= 6:
+        return True
+    if line.endswith(":") and len(words) <= 8:
+        return True
+    if line[-1] in ".,;!?" or not words or len(words) > 10:
+        return False
+    if line.isupper() and sum(len(w) for w in words) >= 4:
+        return True
+    significant = [w for w in words if len(w) > 3]
+    return len(words) >= 2 and bool(significant) and all(w[0].isupper() for w in significant)
+
+
+def parse_blocks(text):
+    """[(kind, text)] with kind "heading", "table" (rows joined by newlines) or "paragraph"."""
+    blocks, paragraph, table = [], [], []
+
+    def flush():
+        if paragraph:
+            blocks.append(("paragraph", " ".join(paragraph)))
+            paragraph.clear()
+        if table:
+            blocks.append(("table", "\n".join(table)))
+            table.clear()
+
+    for line in text.split("\n"):
+        line = line.strip()
+        if not line:
+            flush()
+        elif " | " in line:
+            if paragraph:
+                flush()
+            table.append(line)
+        elif is_heading(line):
+            flush()
+            blocks.append(("heading", line))
+        else:
+            if table:
+                flush()
+            paragraph.append(line)
+    flush()
+    return blocks
+
+
+class _ChunkBuilder:
+    def __init__(self, tokenizer, chunk_tokens, overlap_tokens):
+        self.tok = tokenizer
+        self.limit = chunk_tokens
+        self.overlap = overlap_tokens
+        self.chunks = []
+        self.lines = []
+        self.tokens = 0
+        self.heading = None
+        self.heading_tokens = 0
+
+    def emit(self):
+        text = "\n".join(self.lines).strip()
+        # A chunk holding nothing but its section's repeated heading adds no content
+        if text and not (len(self.lines) == 1 and self.lines[0] == self.heading and self.chunks):
+            self.chunks.append(text)
+        self.lines, self.tokens = [], 0
+
+    def continue_section(self):
+        """Start a new chunk of the current section, led by its heading."""
+        self.emit()
+        if self.heading:
+            self.lines.append(self.heading)
+            self.tokens = self.heading_tokens + 1
+
+    def add_line(self, line, count):
+        self.lines.append(line)
+        self.tokens += count + 1
+
+    def room(self):
+        return self.limit - self.tokens
+
+    def body_budget(self):
+        # Largest piece that fits in a fresh continuation chunk (heading plus overlap)
+        return max(1, self.limit - self.heading_tokens - self.overlap - 2)
+
+    def heading_block(self, text):
+        if self.tokens >= self.limit // 4:
+            self.emit()
+        self.heading = text
+        self.heading_tokens = self.tok.count(text)
+        self.add_line(text, self.heading_tokens)
+
+    def table_block(self, text):
+        rows = text.split("\n")
+        header = rows[0]
+        header_tokens = self.tok.count(header)
+        for i, row in enumerate(rows):
+            count = self.tok.count(row)
+            if count + 1 > self.room():
+                self.continue_section()
+                if i > 0 and header_tokens + count + 2 <= self.room():
+                    self.add_line(header, header_tokens)
+            for piece, piece_count in self._split_tokens(row, count, self.body_budget()):
+                if piece_count + 1 > self.room():
+                    self.continue_section()
+                self.add_line(piece, piece_count)
+
+    def paragraph_block(self, text):
+        started = False
+        for sentence in _SENTENCE_END.split(text):
+            count = self.tok.count(sentence)
+            for piece, piece_count in self._split_tokens(sentence, count, self.body_budget()):
+                if piece_count + 1 > self.room():
+                    tail = self._overlap_tail() if started else ""
+                    self.continue_section()
+                    started = False
+                    if tail:
+                        self.add_line(tail, self.tok.count(tail))
+                        started = True
+                if started:
+                    # Same paragraph: extend its line
+                    self.lines[-1] = f"{self.lines[-1]} {piece}"
+                    self.tokens += piece_count + 1
+                else:
+                    self.add_line(piece, piece_count)
+                    started = True
+
+    def _split_tokens(self, text, count, budget):
+        if count <= budget:
+            return [(text, count)]
+        ids = self.tok.encode(text)
+        return [(self.tok.decode(ids[i:i + budget]).strip(), len(ids[i:i + budget])) for i in range(0, len(ids), budget)]
+
+    def _overlap_tail(self):
+        """Last `overlap` tokens of the paragraph being split, starting at a word boundary."""
+        if self.overlap <= 0 or not self.lines:
+            return ""
+        line = self.lines[-1]
+        ids = self.tok.encode(line)
+        if len(ids) <= self.overlap:
+            return line
+        tail = self.tok.decode(ids[-self.overlap:])
+        start = len(line) - len(tail)
+        if line.endswith(tail) and start > 0 and line[start - 1].isalnum() and tail[:1].isalnum():
+            # Drop the partial first word
+            tail = tail.split(" ", 1)[1] if " " in tail else ""
+        return tail.strip()
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    """Split `text` into chunks of at most `chunk_tokens` tokens along its structure (see module docstring)."""
+    builder = _ChunkBuilder(tokenizer or Tokenizer(), chunk_tokens, min(overlap_tokens, chunk_tokens // 2))
+    for kind, block in parse_blocks(text):
+        if kind == "heading":
+            builder.heading_block(block)
+        elif kind == "table":
+            builder.table_block(block)
+        else:
+            builder.paragraph_block(block)
+    builder.emit()
+    return builder.chunks
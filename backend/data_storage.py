@@ -1,78 +1,155 @@
 import os
+import re
 import hashlib
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from backend.pdf_utilities import clean_text, get_pdf_text
+from backend.chunking import chunk_text
+from backend import metrics, database, logs
+from backend.llm_gateway import invoke_llm, pack_batches
+from backend.providers import get_chat_model, get_embeddings, embedding_model_name
 
 load_dotenv()
-index_path = os.path.join(os.path.dirname(__file__), "faiss_index")
+log = logs.get_logger(__name__)
+index_path = os.getenv("FAISS_INDEX_PATH", os.path.join(os.path.dirname(__file__), "faiss_index"))
+# Chunks whose SimHash differs from an indexed chunk by at most this many bits are skipped (max 3)
+NEAR_DUP_MAX_DISTANCE = min(3, int(os.getenv("NEAR_DUP_MAX_DISTANCE", "3")))
+# Embedding batches of one ingestion sent concurrently (the model gateway still caps the process total)
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+# Retrieved chunks farther from the question than this are dropped. Every index type reports
+# the squared L2 distance between unit vectors, 2 - 2 * cosine: flat computes it exactly, and
+# the inner-product types (flat_ip, hnsw, sq16, ivfpq) have their scores mapped to it, with
+# hnsw, sq16 and ivfpq approximate. 1.2 keeps cosine >= 0.4, which suits OpenAI's
+# text-embedding-3 models; models whose unrelated texts score higher need a lower value.
+RAG_MAX_DISTANCE = float(os.getenv("RAG_MAX_DISTANCE", "1.2"))
+# "tokens": structure-aware token chunker (backend.chunking); "chars": the original character splitter
+CHUNKER = os.getenv("CHUNKER", "tokens")
+
+def _splitter(chunk_size, chunk_overlap):
+    # Only the "chars" chunker needs langchain_text_splitters, so it is imported here
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
 
-def get_text_chunks(text, chunk_size=1500, chunk_overlap=500):
     # Use recursive splitter with multiple fallback separators to avoid giant chunks
-    splitter = RecursiveCharacterTextSplitter(
+    return RecursiveCharacterTextSplitter(
         separators=["\n\n", "\n", ". ", " ", ""],
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
     )
-    chunks = splitter.split_text(text)
-    print(f"[INFO] Created {len(chunks)} text chunks")
+
+def _split(text, chunk_size, chunk_overlap):
+    # chunk_size / chunk_overlap (characters) only apply to the "chars" chunker
+    if CHUNKER == "tokens":
+        return chunk_text(text)
+    return _splitter(chunk_size, chunk_overlap).split_text(text)
+
+def get_text_chunks(text, chunk_size=1500, chunk_overlap=500):
+    chunks = _split(text, chunk_size, chunk_overlap)
+    log.info("text_chunked", chunks=len(chunks))
     return chunks
 
+def iter_text_chunks(pages, chunk_size=1500, chunk_overlap=500):
+    """
+    Chunk a stream of page texts without joining the whole document.
+    Text is split once ~20 chunks' worth is buffered; the last (possibly partial)
+    chunk is carried into the next window so chunks never end at a page boundary.
+    """
+    window = chunk_size * 20
+    buffer = []
+    buffered = 0
+    count = 0
+    for page in pages:
+        buffer.append(page)
+        buffered += len(page)
+        if buffered >= window:
+            chunks = _split(clean_text("".join(buffer)), chunk_size, chunk_overlap)
+            count += max(0, len(chunks) - 1)
+            yield from chunks[:-1]
+            buffer = [chunks[-1] + "\n"] if chunks else []
+            buffered = len(buffer[0]) if buffer else 0
+    if buffer:
+        chunks = _split(clean_text("".join(buffer)), chunk_size, chunk_overlap)
+        count += len(chunks)
+        yield from chunks
+    log.info("text_chunked", chunks=count)
+
+
+def simhash(text):
+    """64-bit SimHash over word 3-shingles; near-identical texts differ in only a few bits."""
+    words = re.findall(r"\w+", (text or "").lower())
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
 
-def get_or_load_vectorstore(text_chunks, path="faiss_index"):
-    # Reduce batch size to avoid 300k token/request cap
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large", chunk_size=64)
-    print("[INFO] Using OpenAI embeddings: text-embedding-3-large (batch size=64)")
-    if os.path.exists(path):
-        print(f"[INFO] Loading existing vectorstore from '{path}'...")
-        print("[WARN] Ensure this index was built with the same embedding model; otherwise run with --rebuild-index or a different --index-path.")
-        vectorstore = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
-        if text_chunks:
-            print("[INFO] Adding new chunks to existing vectorstore...")
-            vectorstore.add_texts(text_chunks)
-            vectorstore.save_local(path)
-            print(f"[INFO] Updated vectorstore saved to '{path}'")
-        return vectorstore
-
-    print("[INFO] Creating new vectorstore...")
-    vectorstore = FAISS.from_texts(text_chunks, embedding=embeddings)
-    vectorstore.save_local(path)
-    print(f"[INFO] Vectorstore saved to '{path}'")
-    return vectorstore
+def filter_near_duplicates(pdf_id, text_chunks, max_distance=NEAR_DUP_MAX_DISTANCE, replace=True):
+    """
+    Drop chunks that are near-duplicates of already indexed chunks in the PDF's shard (or
+    of earlier chunks in the same PDF), so retrieval never has to dedup results per query.
+    Fingerprints are removed with their PDF; content that was skipped as a duplicate of
+    a deleted PDF comes back when its own PDF is re-ingested. Ingestion calls it once per
+    window of chunks; only the first (`replace`) drops fingerprints of an earlier attempt.
+    """
+    if not text_chunks:
+        return []
+    pdf = database.get_pdf(pdf_id)
+    shard = pdf["shard"] if pdf else "global"
+    fresh = database.claim_chunk_fingerprints(pdf_id, [simhash(c) for c in text_chunks], max_distance, shard, replace)
+    kept = [chunk for chunk, is_new in zip(text_chunks, fresh) if is_new]
+    if len(kept) < len(text_chunks):
+        log.info("near_duplicates_skipped", pdf_id=pdf_id, chunks=len(text_chunks) - len(kept))
+    return kept
+
+
+def embed_chunks(text_chunks, progress=None, max_in_flight=EMBED_MAX_IN_FLIGHT):
+    """
+    Embed chunks in token-packed batches (one request each), up to `max_in_flight` at once.
+    Each batch goes through the model gateway, which retries it on its own after transient
+    errors, and is written to the embedding cache as soon as it returns, so a failed job
+    only re-embeds the batches that never finished. progress(done, total) is called as
+    batches complete, in any order.
+    """
+    embeddings = get_embeddings()
+    vectors = [None] * len(text_chunks)
+    batches = pack_batches(text_chunks)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(batches))), thread_name_prefix="embed") as pool:
+        futures = {pool.submit(embeddings.embed_documents, text_chunks[start:end]): (start, end) for start, end in batches}
+        try:
+            for future in as_completed(futures):
+                start, end = futures[future]
+                vectors[start:end] = future.result()
+                done += end - start
+                if progress:
+                    progress(done, len(text_chunks))
+        except BaseException:
+            # Don't start the remaining batches of a failed job
+            for future in futures:
+                future.cancel()
+            raise
+    return list(zip(text_chunks, vectors))
 
 # Fallback LLM-only response
 def generate_general_response(question, history_messages):
     """LLM-only response (no retrieval), acts as a fallback."""
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
+    llm = get_chat_model()
     messages = [
         SystemMessage(content="You are a helpful, concise assistant."),
         *history_messages,
         HumanMessage(content=question),
     ]
-    resp = llm.invoke(messages)
+    resp = invoke_llm(llm, messages)
     answer = (getattr(resp, "content", "") or "").strip()
     if not answer:
         # Single retry without history if blank
-        resp = llm.invoke([SystemMessage(content="You are a helpful, concise assistant."), HumanMessage(content=question)])
+        resp = invoke_llm(llm, [SystemMessage(content="You are a helpful, concise assistant."), HumanMessage(content=question)])
         answer = (getattr(resp, "content", "") or "").strip()
     return answer
 
-# In case of duplicate docs
-def _dedup_docs(docs):
-    seen, out = set(), []
-    for d in docs:
-        content = (getattr(d, "page_content", "") or "")
-        digest = hashlib.md5(content.encode("utf-8")).hexdigest()
-        if digest in seen:
-            continue
-        seen.add(digest)
-        out.append(d)
-    return out
-
 def format_history_from_db(chat_messages_db):
     """Convert DB rows to LangChain messages, skipping blanks."""
     msgs = []
@@ -88,39 +165,31 @@ def format_history_from_db(chat_messages_db):
 
 def generate_rag_response(vectorstore, question, history_messages, k=8, return_docs=False):
     """Retrieve -> prompt with context -> LLM, with safe fallback."""
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0)
+    llm = get_chat_model()
 
-    # Use similarity_search_with_score to filter irrelevant docs
-    # FAISS L2 distance: lower is better. 
-    # Threshold is empirical; 1.0 is usually a safe cutoff for "somewhat relevant" with OpenAI embeddings,
-    # but it depends on the embedding scale. text-embedding-3-large is normalized?
-    # Let's try a strict threshold first.
+    # Hybrid retrieval: FAISS distances fused with BM25 (see ShardedVectorStore.hybrid_search_with_score).
+    # A question sharing no term with the documents comes back empty without an embedding call.
     try:
-        results_with_scores = vectorstore.similarity_search_with_score(question, k=k)
+        with metrics.span("rag.retrieval"):
+            results_with_scores = vectorstore.hybrid_search_with_score(question, k=k)
     except Exception as e:
-        print(f"[WARN] similarity_search failed: {e}")
+        log.exception("hybrid_search_failed")
         results_with_scores = []
 
-    # Filter by score (distance). 
-    # Note: OpenAI embeddings are normalized, so cosine similarity is dot product.
-    # FAISS IndexFlatL2 returns squared Euclidean distance.
-    # For normalized vectors u, v: |u-v|^2 = 2 - 2(u.v).
-    # If u.v (cosine sim) is 0.7, distance is 2 - 1.4 = 0.6.
-    # If u.v is 0.5, distance is 1.0.
-    # Let's set a threshold of 1.2 (approx 0.4 cosine similarity) to be generous but exclude total noise.
-    threshold = 1.2
     sim_docs = []
     for doc, score in results_with_scores:
-        if score < threshold:
+        # No distance: found by BM25 only, with a score of at least LEXICAL_MIN_SCORE of the best possible
+        if score is None or score < RAG_MAX_DISTANCE:
             sim_docs.append(doc)
         else:
-            print(f"[INFO] Filtered out doc with distance {score:.4f}")
+            log.debug("rag_doc_filtered", distance=round(float(score), 4))
 
-    merged = _dedup_docs(sim_docs)[:k]
-    print(f"[INFO] Retrieved {len(results_with_scores)} raw, kept {len(sim_docs)} within threshold, merged {len(merged)}")
+    # Duplicate chunks are filtered at ingestion (filter_near_duplicates)
+    merged = sim_docs[:k]
+    log.info("rag_retrieved", raw=len(results_with_scores), kept=len(sim_docs))
 
     if not merged:
-        print("[INFO] No relevant docs retrieved (all filtered); falling back to general response.")
+        log.info("rag_no_relevant_docs")
         # Return a specific string indicating no info, so the caller knows not to use it
         return {"answer": "No relevant information found in documents.", "documents": []} if return_docs else "No relevant information found in documents."
 
@@ -137,12 +206,13 @@ def generate_rag_response(vectorstore, question, history_messages, k=8, return_d
         *history_messages,
         HumanMessage(content=question),
     ]
-    resp = llm.invoke(messages)
-    # print(f"[CHAT] Retrieved response from RAG chain: {resp}")
+    with metrics.span("rag.llm"):
+        resp = invoke_llm(llm, messages)
+    log.debug("rag_answer", answer=logs.payload(getattr(resp, "content", "") or ""))
     answer = (getattr(resp, "content", "") or "").strip()
 
     if not answer:
-        print("[INFO] Empty RAG answer; retrying without context...")
+        log.info("rag_empty_answer_retrying")
         answer = generate_general_response(question, history_messages)
 
     return {"answer": answer, "documents": merged} if return_docs else answer
@@ -150,19 +220,23 @@ def generate_rag_response(vectorstore, question, history_messages, k=8, return_d
 
 # Local run function
 def run_conversational_agent(pdf_files):
-    print("[INFO] Checking for existing FAISS vectorstore...")
-    if not os.path.exists(index_path):
-        print("[INFO] No vectorstore found. Extracting from PDFs...")
-        raw_text = get_pdf_text(pdf_files)
-        if not raw_text.strip():
-            print("[ERROR] No text extracted. Exiting.")
-            return
-        cleaned_text = clean_text(raw_text)
-        text_chunks = get_text_chunks(cleaned_text)
-    else:
-        text_chunks = []
+    from backend.vector_store import ShardedVectorStore
 
-    vectorstore = get_or_load_vectorstore(text_chunks, path=index_path)
+    log.info("vectorstore_loading", path=index_path)
+    database.init_db()
+    vectorstore = ShardedVectorStore(index_path).load()
+    if not len(vectorstore):
+        log.info("vectorstore_building", pdfs=len(pdf_files), embeddings=embedding_model_name())
+        for pdf_path in pdf_files:
+            text_chunks = get_text_chunks(clean_text(get_pdf_text([pdf_path])))
+            if not text_chunks:
+                log.warning("pdf_no_text", path=pdf_path)
+                continue
+            pdf_id = database.add_pdf(os.path.basename(pdf_path), os.path.getsize(pdf_path))
+            vectorstore.add(pdf_id, embed_chunks(text_chunks))
+        if not len(vectorstore):
+            log.error("vectorstore_empty")
+            return
 
     print("\n[READY] Ask questions about the document. Type 'exit' to quit.\n")
 
@@ -172,7 +246,7 @@ def run_conversational_agent(pdf_files):
     while True:
         query = input("You: ").strip()
         if query.lower() == "exit":
-            print("[INFO] Exiting conversation.")
+            print("Exiting conversation.")
             break
 
         # RAG response using the latest pipeline
@@ -186,6 +260,6 @@ def run_conversational_agent(pdf_files):
 
 # Local runner for testing
 if __name__ == "__main__":
-    print("[INFO] RAG pipeline module loaded.")
+    log.info("rag_module_loaded")
     # You can add local testing logic here if needed
 
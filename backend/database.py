@@ -1,19 +1,70 @@
 import os
+import time
 import sqlite3
+import unicodedata
 from contextlib import contextmanager
 from datetime import datetime
+from backend import metrics
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "chatbot.db")
+DB_PATH = os.getenv("CHATBOT_DB_PATH", os.path.join(os.path.dirname(__file__), "chatbot.db"))
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that records statement duration (including busy/lock wait) in foodchat_sql_seconds."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.SQL_SECONDS.observe(time.perf_counter() - start, op=metrics.sql_op(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.SQL_SECONDS.observe(time.perf_counter() - start, op=metrics.sql_op(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.SQL_SECONDS.observe(time.perf_counter() - start, op="COMMIT")
+
+
+def _trace_statement(statement):
+    # Sees every statement SQLite runs, including implicit BEGIN/COMMIT
+    metrics.SQL_STATEMENTS.inc(op=metrics.sql_op(statement))
+
+
+def connect():
+    conn = sqlite3.connect(DB_PATH, factory=TimedConnection)
+    conn.set_trace_callback(_trace_statement)
+    return conn
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     conn.row_factory = sqlite3.Row
     try:
         yield conn
     finally:
         conn.close()
 
+def ping():
+    """Cheap query proving the database file is readable and migrated (readiness checks)."""
+    with get_conn() as conn:
+        conn.execute("SELECT 1 FROM pdfs LIMIT 1").fetchall()
+
 def init_db():
     """Initialize the database with required tables"""
     with get_conn() as conn:
@@ -29,6 +80,76 @@ def init_db():
                 status TEXT DEFAULT 'processed'
             )
         ''')
+
+        # Content digest of uploaded PDFs (NULL for rows that predate it)
+        cur.execute("PRAGMA table_info(pdfs)")
+        pcols = [r[1] for r in cur.fetchall()]
+        if "sha256" not in pcols:
+            try:
+                cur.execute("ALTER TABLE pdfs ADD COLUMN sha256 TEXT")
+            except Exception:
+                pass
+        # Tenant of a PDF: uploader, chat it was shared into, and the index shard both map to
+        if "owner_user_id" not in pcols:
+            try:
+                cur.execute("ALTER TABLE pdfs ADD COLUMN owner_user_id INTEGER")
+            except Exception:
+                pass
+        if "chat_id" not in pcols:
+            try:
+                cur.execute("ALTER TABLE pdfs ADD COLUMN chat_id INTEGER")
+            except Exception:
+                pass
+        if "shard" not in pcols:
+            try:
+                cur.execute("ALTER TABLE pdfs ADD COLUMN shard TEXT NOT NULL DEFAULT 'global'")
+            except Exception:
+                pass
+        # The same file may be uploaded once per shard
+        cur.execute("DROP INDEX IF EXISTS idx_pdfs_sha256")
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_pdfs_shard_sha256 ON pdfs(shard, sha256)")
+
+        # SimHash fingerprints of indexed chunks, split into 16-bit bands for candidate lookup
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_fingerprints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                pdf_id INTEGER NOT NULL,
+                simhash INTEGER NOT NULL,
+                band0 INTEGER NOT NULL,
+                band1 INTEGER NOT NULL,
+                band2 INTEGER NOT NULL,
+                band3 INTEGER NOT NULL
+            )
+        ''')
+        # Near-duplicates are only detected within a shard, so one tenant's content never hides another's
+        cur.execute("PRAGMA table_info(chunk_fingerprints)")
+        if "shard" not in [r[1] for r in cur.fetchall()]:
+            try:
+                cur.execute("ALTER TABLE chunk_fingerprints ADD COLUMN shard TEXT NOT NULL DEFAULT 'global'")
+            except Exception:
+                pass
+        for band in range(4):
+            cur.execute(f"DROP INDEX IF EXISTS idx_chunk_fingerprints_band{band}")
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_chunk_fingerprints_shard_band{band} ON chunk_fingerprints(shard, band{band})")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_chunk_fingerprints_pdf ON chunk_fingerprints(pdf_id)")
+
+        # Vector ids each PDF added to the FAISS index; deleted = 1 marks tombstones awaiting compaction
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_vectors (
+                vector_id TEXT PRIMARY KEY,
+                pdf_id INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        cur.execute("PRAGMA table_info(pdf_vectors)")
+        if "shard" not in [r[1] for r in cur.fetchall()]:
+            try:
+                cur.execute("ALTER TABLE pdf_vectors ADD COLUMN shard TEXT NOT NULL DEFAULT 'global'")
+            except Exception:
+                pass
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_pdf_vectors_pdf ON pdf_vectors(pdf_id)")
+        cur.execute("DROP INDEX IF EXISTS idx_pdf_vectors_deleted")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_pdf_vectors_shard_deleted ON pdf_vectors(shard, deleted)")
         
         # Create chats table
         cur.execute('''
@@ -76,6 +197,20 @@ def init_db():
                 # For this project, we'll assume it's for new setups or dev.
             except Exception:
                 pass # May fail if run multiple times, that's ok.
+        # Case-folded shadow columns for prefix search (search_users); filled by create_user
+        for col in ("username_norm", "email_norm"):
+            if col not in cols:
+                try:
+                    cur.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT")
+                except Exception:
+                    pass
+        cur.execute("SELECT id, username, email FROM users WHERE username_norm IS NULL OR email_norm IS NULL")
+        cur.executemany(
+            "UPDATE users SET username_norm = ?, email_norm = ? WHERE id = ?",
+            [(search_key(r[1]), search_key(r[2]), r[0]) for r in cur.fetchall()],
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_username_norm ON users(username_norm, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_users_email_norm ON users(email_norm, id)")
 
         # Ensure chats has owner_user_id
         cur.execute("PRAGMA table_info(chats)")
@@ -139,34 +274,104 @@ def init_db():
             except Exception:
                 pass
 
+        # @recme single-flight and cooldown across worker processes (see claim_recme)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS recme_claims (
+                chat_id INTEGER PRIMARY KEY,
+                claimed_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+
+        # Change counters behind the listing ETags, bumped by triggers so every writer
+        # (any worker, any code path) invalidates them; see VERSION_TRIGGERS
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS versions (
+                key TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Random per database, so ETags of a reset database never match old ones
+        cur.execute("INSERT OR IGNORE INTO versions (key, version) VALUES ('epoch', ABS(RANDOM()))")
+        for name, sql in VERSION_TRIGGERS.items():
+            cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {sql}")
+
         conn.commit()
 
-def add_pdf(filename, file_size):
-    """Add a new PDF to the database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO pdfs (filename, file_size)
-        VALUES (?, ?)
-    ''', (filename, file_size))
-    
-    pdf_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+# Version keys (see get_versions):
+#   pdfs           any PDF row (listing, status)
+#   users          the user directory (/users)
+#   usernames      a user's email or username, shown in chat and member listings
+#   chats:<user>   the user's chat list: membership, or title/recency of one of their chats
+#   members:<chat> the chat's member set
+#   memberships:<user> which chats the user belongs to (not their titles or messages)
+def _bump(*keys):
+    """Trigger body incrementing the versions `keys` (SQL expressions)."""
+    return " ".join(
+        f"INSERT INTO versions (key, version) VALUES ({key}, 1) ON CONFLICT(key) DO UPDATE SET version = version + 1;"
+        for key in keys
+    )
+
+VERSION_TRIGGERS = {
+    "versions_pdfs_insert": "AFTER INSERT ON pdfs BEGIN " + _bump("'pdfs'") + " END",
+    "versions_pdfs_update": "AFTER UPDATE ON pdfs BEGIN " + _bump("'pdfs'") + " END",
+    "versions_pdfs_delete": "AFTER DELETE ON pdfs BEGIN " + _bump("'pdfs'") + " END",
+    "versions_users_insert": "AFTER INSERT ON users BEGIN " + _bump("'users'") + " END",
+    "versions_users_update": "AFTER UPDATE OF email, username ON users BEGIN " + _bump("'users'", "'usernames'") + " END",
+    "versions_users_delete": "AFTER DELETE ON users BEGIN " + _bump("'users'", "'usernames'") + " END",
+    "versions_members_insert": (
+        "AFTER INSERT ON chat_members BEGIN " + _bump("'members:' || NEW.chat_id", "'chats:' || NEW.user_id") + " END"
+    ),
+    "versions_members_delete": (
+        "AFTER DELETE ON chat_members BEGIN " + _bump("'members:' || OLD.chat_id", "'chats:' || OLD.user_id") + " END"
+    ),
+    "versions_memberships_insert": "AFTER INSERT ON chat_members BEGIN " + _bump("'memberships:' || NEW.user_id") + " END",
+    "versions_memberships_delete": "AFTER DELETE ON chat_members BEGIN " + _bump("'memberships:' || OLD.user_id") + " END",
+    # Every message moves its chat's last_updated, so this bumps every member's chat list once per message
+    "versions_chats_update": (
+        "AFTER UPDATE OF title, last_updated, owner_user_id ON chats BEGIN "
+        "INSERT INTO versions (key, version) SELECT 'chats:' || user_id, 1 FROM chat_members WHERE chat_id = NEW.id "
+        "ON CONFLICT(key) DO UPDATE SET version = version + 1; END"
+    ),
+}
+
+def get_versions(keys):
+    """{key: version} for `keys` plus the database's 'epoch' (0 for a key never bumped)."""
+    keys = ["epoch", *keys]
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT key, version FROM versions WHERE key IN ({','.join('?' for _ in keys)})", keys)
+        found = dict(cur.fetchall())
+    return {key: found.get(key, 0) for key in keys}
+
+def add_pdf(filename, file_size, status="processed", sha256=None, owner_user_id=None, chat_id=None, shard="global"):
+    """Add a new PDF to the database (raises sqlite3.IntegrityError if sha256 is already stored in the shard)"""
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO pdfs (filename, file_size, status, sha256, owner_user_id, chat_id, shard)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (filename, file_size, status, sha256, owner_user_id, chat_id, shard))
+        pdf_id = cursor.lastrowid
+        conn.commit()
     
     return pdf_id
 
-def get_all_pdfs():
-    """Get all uploaded PDFs"""
-    conn = sqlite3.connect(DB_PATH)
+def get_all_pdfs(shards=None):
+    """Get all uploaded PDFs, or only those stored in `shards`"""
+    conn = connect()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT id, filename, upload_date, file_size, status
+    where, params = "", []
+    if shards is not None:
+        where = f"WHERE shard IN ({','.join('?' for _ in shards)})"
+        params = list(shards)
+    cursor.execute(f'''
+        SELECT id, filename, upload_date, file_size, status, owner_user_id, chat_id
         FROM pdfs
+        {where}
         ORDER BY upload_date DESC
-    ''')
+    ''', params)
     
     pdfs = cursor.fetchall()
     conn.close()
@@ -177,25 +382,198 @@ def get_all_pdfs():
             "filename": pdf[1],
             "upload_date": pdf[2],
             "file_size": pdf[3],
-            "status": pdf[4]
+            "status": pdf[4],
+            "owner_user_id": pdf[5],
+            "chat_id": pdf[6]
         }
         for pdf in pdfs
     ]
 
+def update_pdf_status(pdf_id, status):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE pdfs SET status = ? WHERE id = ?", (status, pdf_id))
+        conn.commit()
+
+def get_pdf(pdf_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, filename, upload_date, file_size, status, sha256, owner_user_id, chat_id, shard FROM pdfs WHERE id = ?",
+            (pdf_id,),
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+def get_pdf_by_sha256(sha256, shard="global"):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, filename, upload_date, file_size, status, sha256, owner_user_id, chat_id, shard FROM pdfs WHERE shard = ? AND sha256 = ?",
+            (shard, sha256),
+        )
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+def get_pdfs_by_status(statuses):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        placeholders = ",".join("?" for _ in statuses)
+        cur.execute(f"SELECT id, filename, status FROM pdfs WHERE status IN ({placeholders}) ORDER BY id", list(statuses))
+        return [dict(r) for r in cur.fetchall()]
+
 def delete_pdf(pdf_id):
     """Delete a PDF from the database"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM pdfs WHERE id = ?', (pdf_id,))
+    cursor.execute('DELETE FROM chunk_fingerprints WHERE pdf_id = ?', (pdf_id,))
+    # Its vectors are tombstoned here and removed from the index by compaction
+    cursor.execute('UPDATE pdf_vectors SET deleted = 1 WHERE pdf_id = ?', (pdf_id,))
     
     conn.commit()
     conn.close()
 
+def add_pdf_vectors(pdf_id, vector_ids, shard="global"):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "INSERT OR REPLACE INTO pdf_vectors (vector_id, pdf_id, deleted, shard) VALUES (?, ?, 0, ?)",
+            [(vector_id, pdf_id, shard) for vector_id in vector_ids],
+        )
+        conn.commit()
+
+def replace_pdf_vectors(pdf_id, vector_ids, deleted=0, shard="global"):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM pdf_vectors WHERE pdf_id = ?", (pdf_id,))
+        cur.executemany(
+            "INSERT INTO pdf_vectors (vector_id, pdf_id, deleted, shard) VALUES (?, ?, ?, ?)",
+            [(vector_id, pdf_id, deleted, shard) for vector_id in vector_ids],
+        )
+        conn.commit()
+
+def get_pdf_vector_ids(pdf_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT vector_id FROM pdf_vectors WHERE pdf_id = ?", (pdf_id,))
+        return [r[0] for r in cur.fetchall()]
+
+def get_pdf_vector_shards(pdf_id):
+    """Shards holding vectors of a PDF (still answerable after the pdfs row is deleted)"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT shard FROM pdf_vectors WHERE pdf_id = ?", (pdf_id,))
+        return [r[0] for r in cur.fetchall()]
+
+def tombstone_pdf_vectors(pdf_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE pdf_vectors SET deleted = 1 WHERE pdf_id = ?", (pdf_id,))
+        conn.commit()
+        return cur.rowcount
+
+def get_tombstoned_vectors(shard="global"):
+    """(vector_id, pdf_id) pairs of a shard deleted but not yet compacted out of its index"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT vector_id, pdf_id FROM pdf_vectors WHERE shard = ? AND deleted = 1", (shard,))
+        return [(r[0], r[1]) for r in cur.fetchall()]
+
+def purge_pdf_vectors(vector_ids, shard="global"):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.executemany(
+            "DELETE FROM pdf_vectors WHERE vector_id = ? AND shard = ? AND deleted = 1",
+            [(v, shard) for v in vector_ids],
+        )
+        conn.commit()
+
+def _signed64(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def claim_chunk_fingerprints(pdf_id, fingerprints, max_distance, shard="global", replace=True):
+    """
+    Record SimHash fingerprints for a PDF's chunks, skipping near-duplicates within its shard.
+    A fingerprint is new when no stored (or earlier, same-batch) fingerprint is within
+    `max_distance` bits; with max_distance <= 3, any such match shares one of the four
+    16-bit bands, so only band matches are compared. Returns a list of bools (True = new).
+    With `replace`, the PDF's earlier fingerprints are dropped first; later windows of the
+    same ingestion pass replace=False.
+    """
+    with get_conn() as conn:
+        cur = conn.cursor()
+        # Serialize concurrent ingestion jobs so they cannot both claim the same content
+        cur.execute("BEGIN IMMEDIATE")
+        if replace:
+            # A resumed or retried job replaces its own fingerprints
+            cur.execute("DELETE FROM chunk_fingerprints WHERE pdf_id = ?", (pdf_id,))
+        # One (shard, band) index lookup per band
+        lookup = " UNION ALL ".join(
+            f"SELECT simhash FROM chunk_fingerprints WHERE shard = ? AND band{band} = ?" for band in range(4)
+        )
+        new = []
+        for fp in fingerprints:
+            bands = [(fp >> (16 * i)) & 0xFFFF for i in range(4)]
+            cur.execute(lookup, [value for band in bands for value in (shard, band)])
+            duplicate = any(bin((row[0] & 0xFFFFFFFFFFFFFFFF) ^ fp).count("1") <= max_distance for row in cur.fetchall())
+            new.append(not duplicate)
+            if not duplicate:
+                cur.execute(
+                    "INSERT INTO chunk_fingerprints (pdf_id, shard, simhash, band0, band1, band2, band3) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (pdf_id, shard, _signed64(fp), *bands),
+                )
+        conn.commit()
+        return new
+
+def delete_chunk_fingerprints(pdf_id):
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM chunk_fingerprints WHERE pdf_id = ?", (pdf_id,))
+        conn.commit()
+
+def claim_recme(chat_id, cooldown, lease):
+    """
+    Claim a chat's next @recme job for this process. Returns "claimed", "running" (a job
+    claimed less than `lease` seconds ago has not finished) or "cooldown" (one finished
+    less than `cooldown` seconds ago). A claim older than `lease` is taken over, so a
+    worker that died mid-job does not silence the chat.
+    """
+    now = time.time()
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT claimed_at, finished_at FROM recme_claims WHERE chat_id = ?", (chat_id,))
+        row = cur.fetchone()
+        if row is not None:
+            claimed_at, finished_at = row
+            if finished_at is None and now - claimed_at < lease:
+                conn.rollback()
+                return "running"
+            if finished_at is not None and now - finished_at < cooldown:
+                conn.rollback()
+                return "cooldown"
+        cur.execute(
+            "INSERT INTO recme_claims (chat_id, claimed_at, finished_at) VALUES (?, ?, NULL) "
+            "ON CONFLICT(chat_id) DO UPDATE SET claimed_at = excluded.claimed_at, finished_at = NULL",
+            (chat_id, now),
+        )
+        conn.commit()
+    return "claimed"
+
+def finish_recme(chat_id):
+    """Mark a chat's claimed @recme job finished; its cooldown starts now."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("UPDATE recme_claims SET finished_at = ? WHERE chat_id = ?", (time.time(), chat_id))
+        conn.commit()
+
 # Chat functions
 def create_chat(title="New Chat", owner_user_id=None):
     """Create a new chat"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     
     cursor.execute('INSERT INTO chats (title, owner_user_id) VALUES (?, ?)', (title, owner_user_id))
@@ -214,7 +592,7 @@ def create_chat(title="New Chat", owner_user_id=None):
 
 def get_all_chats():
     """Get all chats"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -358,12 +736,16 @@ def delete_chat(chat_id):
         conn.commit()
 
 # --- User helpers ---
+def search_key(text):
+    """Case- and width-insensitive form of a username or email, as stored in the *_norm columns."""
+    return unicodedata.normalize("NFKC", text or "").casefold().strip()
+
 def create_user(email: str, username: str, password_hash: str):
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute(
-            "INSERT INTO users (email, username, password_hash, created_at) VALUES (?, ?, ?, ?)",
-            (email.lower(), username, password_hash, datetime.utcnow().isoformat()),
+            "INSERT INTO users (email, username, password_hash, created_at, username_norm, email_norm) VALUES (?, ?, ?, ?, ?, ?)",
+            (email.lower(), username, password_hash, datetime.utcnow().isoformat(), search_key(username), search_key(email)),
         )
         conn.commit()
         return cur.lastrowid
@@ -382,6 +764,61 @@ def get_all_users():
         cur.execute("SELECT id, email, username FROM users ORDER BY username")
         return [{"id": r[0], "email": r[1], "username": r[2]} for r in cur.fetchall()]
 
+def _prefix_range(prefix):
+    """[low, high) bounds of the strings starting with `prefix`, for an index range scan."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def search_users(prefix: str, limit: int, after=None):
+    """
+    Up to `limit` users whose username or email starts with `prefix` (see search_key), and
+    the key to pass as `after` for the next page (None on the last page).
+
+    Username matches come first, by username, then users matching only by email, by email.
+    Each page is one index range scan that starts after the previous page's last row, so
+    its cost depends on `limit`, not on the number of users or on how deep the page is.
+    """
+    prefix = search_key(prefix)
+    if not prefix:
+        return [], None
+    low, high = _prefix_range(prefix)
+    phase, last_key, last_id = after or ("username", "", 0)
+    users = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        if phase == "username":
+            cur.execute(
+                """
+                SELECT id, email, username, username_norm FROM users
+                WHERE username_norm >= ? AND username_norm < ? AND (username_norm, id) > (?, ?)
+                ORDER BY username_norm, id LIMIT ?
+                """,
+                (low, high, last_key, last_id, limit + 1),
+            )
+            users = [dict(r) for r in cur.fetchall()]
+            if len(users) > limit:
+                last = users[limit - 1]
+                return _public_users(users[:limit]), ("username", last["username_norm"], last["id"])
+            phase, last_key, last_id = "email", "", 0
+        cur.execute(
+            """
+            SELECT id, email, username, email_norm FROM users
+            WHERE email_norm >= ? AND email_norm < ? AND (email_norm, id) > (?, ?)
+              AND NOT (username_norm >= ? AND username_norm < ?)
+            ORDER BY email_norm, id LIMIT ?
+            """,
+            (low, high, last_key, last_id, low, high, limit - len(users) + 1),
+        )
+        rows = [dict(r) for r in cur.fetchall()]
+    if len(users) + len(rows) > limit:
+        rows = rows[:limit - len(users)]
+        # A full page of username matches can leave no room for email matches
+        after = ("email", rows[-1]["email_norm"], rows[-1]["id"]) if rows else ("email", "", 0)
+        return _public_users(users + rows), after
+    return _public_users(users + rows), None
+
+def _public_users(rows):
+    return [{"id": r["id"], "email": r["email"], "username": r["username"]} for r in rows]
+
 def ensure_user(email: str, password_hash: str = "placeholder"):
     user = get_user_by_email(email)
     if user:
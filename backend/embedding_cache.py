@@ -0,0 +1,201 @@
+"""
+Persistent, content-addressed embedding cache.
+
+Vectors are keyed by (embedding model, SHA-256 of the chunk text) and stored per
+model as append-only files:
+
+    <EMBEDDING_CACHE_DIR>/<model>/vectors.f16   float16 rows, memory-mapped for reads
+    <EMBEDDING_CACHE_DIR>/<model>/keys.bin      32-byte SHA-256 digests, one per row
+    <EMBEDDING_CACHE_DIR>/<model>/meta.json     {"model": ..., "dim": ...}
+
+Rows are written and fsynced before their keys, and a row only counts once its key
+is complete. A crash can leave unreferenced rows, or a torn row or key at the end
+of a file; opening the cache cuts both files back to the last complete record.
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from backend import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+# Outside the source tree: the cache is machine-local runtime state, not part of the package
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "foodchat", "embeddings"),
+)
+
+_DIGEST_SIZE = 32
+
+
+def text_digest(text):
+    return hashlib.sha256((text or "").encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Append-only float16 vector store for one embedding model; safe across threads and processes."""
+
+    def __init__(self, model, root=EMBEDDING_CACHE_DIR):
+        self.model = model
+        self.dir = os.path.join(root, re.sub(r"[^\w.-]+", "_", model))
+        os.makedirs(self.dir, exist_ok=True)
+        self._vectors_path = os.path.join(self.dir, "vectors.f16")
+        self._keys_path = os.path.join(self.dir, "keys.bin")
+        self._meta_path = os.path.join(self.dir, "meta.json")
+        self._lock = threading.Lock()
+        self._rows: dict[bytes, int] = {}
+        self._dim = None
+        self._mmap = None
+        self._mapped_rows = 0
+        with self._lock, self._file_lock():
+            self._load_meta()
+            self._truncate_torn_records()
+            self._sync()
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.dir, ".lock"))
+
+    def _load_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._dim = json.load(f).get("dim")
+
+    def _truncate_torn_records(self):
+        """Cut vectors.f16 and keys.bin back to the records both hold completely (caller holds the file lock)."""
+        keys = os.path.getsize(self._keys_path) // _DIGEST_SIZE if os.path.exists(self._keys_path) else 0
+        row_size = (self._dim or 0) * 2
+        rows = os.path.getsize(self._vectors_path) // row_size if row_size and os.path.exists(self._vectors_path) else 0
+        complete = min(keys, rows)
+        for path, size in ((self._keys_path, complete * _DIGEST_SIZE), (self._vectors_path, complete * row_size)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _sync(self):
+        """Pick up keys appended since the last read (possibly by another process)."""
+        if not os.path.exists(self._keys_path):
+            return
+        offset = len(self._rows) * _DIGEST_SIZE
+        with open(self._keys_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        usable = len(data) - len(data) % _DIGEST_SIZE
+        row = len(self._rows)
+        for i in range(0, usable, _DIGEST_SIZE):
+            self._rows.setdefault(data[i:i + _DIGEST_SIZE], row)
+            row += 1
+        if self._dim is None:
+            self._load_meta()
+
+    def _vectors(self):
+        rows = len(self._rows)
+        if self._mmap is None or self._mapped_rows < rows:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(rows, self._dim)) if rows else None
+            self._mapped_rows = rows
+        return self._mmap
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get_many(self, texts):
+        """Cached vectors (float32 lists) for `texts`, with None for misses."""
+        digests = [text_digest(t) for t in texts]
+        with self._lock:
+            if any(d not in self._rows for d in digests):
+                self._sync()
+            found = [self._rows.get(d) for d in digests]
+            vectors = self._vectors() if self._dim else None
+            out = [vectors[row].astype(np.float32).tolist() if row is not None else None for row in found]
+        for vec in out:
+            metrics.record_cache("embedding", vec is not None)
+        return out
+
+    def put_many(self, texts, vectors):
+        """Store vectors for texts not already cached."""
+        if not texts:
+            return
+        matrix = np.asarray(vectors, dtype=np.float16)
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._dim is None:
+                self._dim = int(matrix.shape[1])
+                tmp = f"{self._meta_path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model, "dim": self._dim}, f)
+                os.replace(tmp, self._meta_path)
+            elif matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dim {matrix.shape[1]} does not match cache dim {self._dim} for {self.model}")
+
+            new_rows, new_keys = [], []
+            for text, row in zip(texts, matrix):
+                digest = text_digest(text)
+                if digest in self._rows or digest in new_keys:
+                    continue
+                new_rows.append(row)
+                new_keys.append(digest)
+            if not new_keys:
+                return
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.stack(new_rows).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new_keys))
+                f.flush()
+                os.fsync(f.fileno())
+            start = len(self._rows)
+            for i, digest in enumerate(new_keys):
+                self._rows[digest] = start + i
+
+
+class _FileLock:
+    """Exclusive advisory lock for writers in other processes (no-op without fcntl)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+class CachedEmbeddings(Embeddings):
+    """Serves document embeddings from the cache; only misses reach `inner`."""
+
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            # Embed each distinct missing text once
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = self.inner.embed_documents(unique)
+            self.cache.put_many(unique, fresh)
+            # Round-trip through float16 so cached and fresh vectors are identical
+            by_text = {t: np.asarray(v, dtype=np.float16).astype(np.float32).tolist() for t, v in zip(unique, fresh)}
+            for i in missing:
+                vectors[i] = by_text[texts[i]]
+        return vectors
+
+    def embed_query(self, text):
+        return self.inner.embed_query(text)
@@ -0,0 +1,243 @@
+"""
+Websocket fan-out across worker processes (serve.py with SERVE_WORKERS > 1).
+
+Members of one chat may be connected to different workers, and each worker only
+holds its own sockets. Every worker binds a Unix datagram socket in FANOUT_DIR
+(<pid>.sock); a broadcast is delivered to the local sockets and sent as one
+datagram to every other worker, which delivers it to its own. Datagrams stay on
+the host, need no broker, and a dead worker's socket file is removed by the first
+sender that finds it refusing.
+
+Nothing is dropped while the peer lives. When a peer's receive buffer is full, its
+datagrams wait in an in-order queue until it reads them. A message larger than
+FANOUT_MAX_BYTES is written to a file in FANOUT_DIR. The peer gets a datagram naming
+that file, then reads and removes it.
+
+Without FANOUT_DIR (a single process) publish() only delivers locally.
+"""
+import os
+import glob
+import json
+import uuid
+import socket
+import asyncio
+import collections
+from backend import metrics, logs
+
+log = logs.get_logger(__name__)
+
+FANOUT_DIR = os.getenv("FANOUT_DIR", "")
+# Largest broadcast sent as a datagram; bigger ones go through a file in FANOUT_DIR
+FANOUT_MAX_BYTES = int(os.getenv("FANOUT_MAX_BYTES", str(128 << 10)))
+
+FANOUT_DATAGRAMS = metrics.counter("foodchat_fanout_datagrams_total", "Broadcasts exchanged with other worker processes", ["result"])
+FANOUT_QUEUED = metrics.gauge("foodchat_fanout_queued", "Broadcasts waiting for a busy worker to read its socket")
+
+# Retry delays while a peer's receive buffer stays full
+_RETRY_MIN_SECONDS = 0.001
+_RETRY_MAX_SECONDS = 0.05
+
+
+class Fanout:
+    """
+    `deliver(chat_id, message)` is awaited for every broadcast, local or from another worker;
+    those from other workers one at a time, in arrival order, with failures logged.
+    """
+
+    def __init__(self, deliver, directory=FANOUT_DIR):
+        self._deliver = deliver
+        self.directory = directory
+        self._sock = None
+        self._path = None
+        self._loop = None
+        # peer socket path -> datagrams not yet accepted by it, in order
+        self._pending: dict[str, collections.deque] = {}
+        self._flushers: dict[str, asyncio.Task] = {}
+        # Broadcasts received from other workers, delivered in arrival order by one consumer task
+        self._inbox = None
+        self._consumer = None
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    async def start(self):
+        if not self.enabled or self._sock is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{os.getpid()}.sock")
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+        # Left behind for an earlier process with this pid
+        self._remove_spills(self._path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, FANOUT_MAX_BYTES * 4)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, FANOUT_MAX_BYTES + 4096)
+        sock.bind(self._path)
+        sock.setblocking(False)
+        self._sock = sock
+        self._loop = asyncio.get_running_loop()
+        self._inbox = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._consume())
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+        log.info("fanout_listening", path=self._path)
+
+    async def stop(self, timeout=5.0):
+        if self._sock is None:
+            return
+        flushers = list(self._flushers.values())
+        if flushers:
+            # Hand the queued broadcasts to the other workers before the socket goes away
+            done, pending = await asyncio.wait(flushers, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                log.warning("fanout_stopped_with_queue", datagrams=sum(len(q) for q in self._pending.values()))
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            await asyncio.wait_for(self._inbox.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("fanout_stopped_with_inbox", broadcasts=self._inbox.qsize())
+        self._consumer.cancel()
+        await asyncio.gather(self._consumer, return_exceptions=True)
+        self._consumer = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    async def publish(self, chat_id, message):
+        """Deliver `message` to chat `chat_id` here and in every other worker."""
+        if self._sock is not None:
+            self._send_to_peers(chat_id, message)
+        await self._deliver(chat_id, message)
+
+    def _peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.directory, n) for n in names if n.endswith(".sock") and os.path.join(self.directory, n) != self._path]
+
+    def _send_to_peers(self, chat_id, message):
+        data = json.dumps({"chat_id": chat_id, "message": message}).encode("utf-8")
+        large = len(data) > FANOUT_MAX_BYTES
+        for peer in self._peers():
+            datagram = self._spill(peer, data) if large else data
+            if datagram is not None:
+                self._send(peer, datagram)
+
+    def _spill(self, peer, data):
+        """Write `data` to a file only `peer` reads; the datagram to send in its place."""
+        path = os.path.join(self.directory, f"{os.path.basename(peer)}.{uuid.uuid4().hex}.spill")
+        try:
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            log.exception("fanout_spill_failed", peer=peer, bytes=len(data))
+            return None
+        FANOUT_DATAGRAMS.inc(result="spilled")
+        return json.dumps({"spill": path}).encode("utf-8")
+
+    def _send(self, peer, datagram):
+        queued = self._pending.get(peer)
+        if queued:
+            # Behind earlier broadcasts the peer has not taken yet
+            queued.append(datagram)
+            FANOUT_QUEUED.inc()
+            return
+        try:
+            self._sock.sendto(datagram, peer)
+            FANOUT_DATAGRAMS.inc(result="sent")
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._forget_peer(peer)
+        except (BlockingIOError, InterruptedError):
+            # Its receive buffer is full: keep the datagram until it reads
+            self._pending[peer] = collections.deque([datagram])
+            FANOUT_QUEUED.inc()
+            FANOUT_DATAGRAMS.inc(result="queued")
+            self._flushers[peer] = self._loop.create_task(self._flush(peer))
+
+    async def _flush(self, peer):
+        queued = self._pending[peer]
+        delay = _RETRY_MIN_SECONDS
+        try:
+            while queued:
+                try:
+                    self._sock.sendto(queued[0], peer)
+                except (BlockingIOError, InterruptedError):
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, _RETRY_MAX_SECONDS)
+                    continue
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Its sockets went with it; there is nobody left to deliver to
+                    self._forget_peer(peer)
+                    return
+                except OSError:
+                    log.exception("fanout_send_failed", peer=peer)
+                    await asyncio.sleep(_RETRY_MAX_SECONDS)
+                    continue
+                queued.popleft()
+                FANOUT_QUEUED.dec()
+                FANOUT_DATAGRAMS.inc(result="sent")
+                delay = _RETRY_MIN_SECONDS
+        finally:
+            if not queued:
+                self._pending.pop(peer, None)
+            self._flushers.pop(peer, None)
+
+    def _forget_peer(self, peer):
+        """The worker behind `peer` exited without cleaning up."""
+        queued = self._pending.pop(peer, None)
+        if queued:
+            FANOUT_QUEUED.dec(len(queued))
+        try:
+            os.unlink(peer)
+        except FileNotFoundError:
+            pass
+        self._remove_spills(peer)
+
+    def _remove_spills(self, peer):
+        for path in glob.glob(f"{glob.escape(peer)}.*.spill*"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(FANOUT_MAX_BYTES + 4096)
+            except OSError:  # drained (BlockingIOError) or closed
+                return
+            try:
+                payload = json.loads(data)
+                if "spill" in payload:
+                    payload = self._read_spill(payload["spill"])
+            except (ValueError, OSError):
+                log.exception("fanout_receive_failed")
+                continue
+            FANOUT_DATAGRAMS.inc(result="received")
+            self._inbox.put_nowait((int(payload["chat_id"]), payload["message"]))
+
+    async def _consume(self):
+        while True:
+            chat_id, message = await self._inbox.get()
+            try:
+                await self._deliver(chat_id, message)
+            except Exception:
+                log.exception("fanout_delivery_failed", chat_id=chat_id)
+            finally:
+                self._inbox.task_done()
+
+    def _read_spill(self, path):
+        # Only files addressed to this worker's socket
+        if os.path.dirname(path) != self.directory or not os.path.basename(path).startswith(os.path.basename(self._path) + "."):
+            raise ValueError(f"not a spill file of this worker: {path}")
+        with open(path, "rb") as f:
+            data = f.read()
+        os.unlink(path)
+        return json.loads(data)
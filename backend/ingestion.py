@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backend import database, metrics, logs
+
+log = logs.get_logger(__name__)
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "uploads"))
+# Page-extraction processes (shared by all jobs) and jobs allowed to run at once
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 2)))
+INGEST_MAX_JOBS = int(os.getenv("INGEST_MAX_JOBS", "2"))
+# Chunks deduplicated, embedded and indexed together; bounds a job's memory whatever the PDF's size
+INGEST_WINDOW_CHUNKS = int(os.getenv("INGEST_WINDOW_CHUNKS", "256"))
+# Finished jobs stay in memory this long for /pdfs/{id}/job; after that only the stored status is reported
+INGEST_JOB_TTL_SECONDS = float(os.getenv("INGEST_JOB_TTL_SECONDS", "3600"))
+
+# Values written to pdfs.status
+STATUS_QUEUED = "queued"
+STATUS_EXTRACTING = "extracting"
+STATUS_EMBEDDING = "embedding"
+STATUS_PROCESSED = "processed"
+STATUS_FAILED = "failed"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_EXTRACTING, STATUS_EMBEDDING)
+
+
+def upload_path(pdf_id):
+    return os.path.join(UPLOAD_DIR, f"{pdf_id}.pdf")
+
+
+def extract_and_chunk(path, executor=None, progress=None):
+    """PDF -> page texts (in parallel on `executor`) streamed into the chunker; yields chunks."""
+    from backend.pdf_utilities import iter_pdf_pages
+    from backend.data_storage import iter_text_chunks
+
+    return iter_text_chunks(iter_pdf_pages([path], executor=executor, progress=progress))
+
+
+def next_window(chunks, size=INGEST_WINDOW_CHUNKS):
+    """Up to `size` more chunks from the `chunks` iterator ([] once it is exhausted)."""
+    window = []
+    for chunk in chunks:
+        window.append(chunk)
+        if len(window) >= size:
+            break
+    return window
+
+
+class IngestionJob:
+    def __init__(self, pdf_id, filename, path):
+        self.pdf_id = pdf_id
+        self.filename = filename
+        self.path = path
+        self.status = STATUS_QUEUED
+        self.pages_total = 0
+        self.pages_done = 0
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def to_dict(self):
+        progress = (self.chunks_done / self.chunks_total) if self.chunks_total else 0.0
+        if self.status == STATUS_PROCESSED:
+            progress = 1.0
+        return {
+            "job_id": self.pdf_id,
+            "pdf_id": self.pdf_id,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": round(progress, 3),
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class IngestionManager:
+    """
+    Runs PDF ingestion off the request path.
+    Page extraction (CPU-bound) is spread over a spawn-based process pool and streamed
+    into the chunker on a thread; embedding also runs in this process so it shares the
+    model gateway's rate limits and bulk priority. Chunks move through deduplication and
+    embedding in windows of INGEST_WINDOW_CHUNKS, so only one window is held at a time.
+    `index_fn(pdf_id, chunks, progress, replace)` embeds and adds one window to the index
+    (`replace` for the first); `discard_fn(pdf_id)` removes what a failed job added.
+    """
+
+    def __init__(self, index_fn, discard_fn=None, workers=INGEST_WORKERS, max_jobs=INGEST_MAX_JOBS, job_ttl=INGEST_JOB_TTL_SECONDS):
+        self._index_fn = index_fn
+        self._discard_fn = discard_fn
+        self._workers = workers
+        self._max_jobs = max_jobs
+        self._job_ttl = job_ttl
+        self._pool = None
+        self._slots = None
+        self._jobs: dict[int, IngestionJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self, resume=True):
+        """Start the worker pool; with `resume`, re-queue jobs a previous run left unfinished."""
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        self._pool = self._new_pool()
+        self._slots = asyncio.Semaphore(self._max_jobs)
+        if not resume:
+            # Another worker process resumes them (serve.py)
+            return
+        # Resume jobs interrupted by a restart
+        for row in await asyncio.to_thread(database.get_pdfs_by_status, ACTIVE_STATUSES):
+            path = upload_path(row["id"])
+            if os.path.exists(path):
+                log.info("ingestion_resumed", pdf_id=row["id"], filename=row["filename"])
+                self.submit(row["id"], row["filename"], path)
+            else:
+                await asyncio.to_thread(database.update_pdf_status, row["id"], STATUS_FAILED)
+
+    async def stop(self, timeout=60.0):
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            if pending:
+                log.warning("ingestion_interrupted", jobs=len(pending))
+                for task in pending:
+                    task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _new_pool(self):
+        # spawn: forking a process that already runs threads (uvicorn, gateway) is unsafe
+        return ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_broken_pool(self, pool):
+        """A worker process that died (OOM kill, segfault in a PDF library) breaks the pool for every later job."""
+        if self._pool is not pool:
+            return  # already replaced by another job, or stopped
+        log.warning("ingestion_pool_rebuilt", workers=self._workers)
+        pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._new_pool()
+
+    def submit(self, pdf_id, filename, path):
+        self._evict_finished()
+        job = IngestionJob(pdf_id, filename, path)
+        self._jobs[pdf_id] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, pdf_id):
+        self._evict_finished()
+        return self._jobs.get(pdf_id)
+
+    def _evict_finished(self):
+        cutoff = time.time() - self._job_ttl
+        for pdf_id in [i for i, job in self._jobs.items() if job.status not in ACTIVE_STATUSES and job.updated_at < cutoff]:
+            del self._jobs[pdf_id]
+
+    @property
+    def started(self):
+        return self._pool is not None
+
+    def active_count(self):
+        return sum(1 for job in self._jobs.values() if job.status in ACTIVE_STATUSES)
+
+    async def _set_status(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.updated_at = time.time()
+        await asyncio.to_thread(database.update_pdf_status, job.pdf_id, status)
+
+    async def _run(self, job):
+        async with self._slots:
+            indexed = 0
+            chunks = pool = None
+            try:
+                await self._set_status(job, STATUS_EXTRACTING)
+
+                def page_progress(done, total):
+                    job.pages_done = done
+                    job.pages_total = total
+                    job.updated_at = time.time()
+
+                from backend.data_storage import filter_near_duplicates
+                pool = self._pool
+                chunks = extract_and_chunk(job.path, pool, page_progress)
+                while True:
+                    with metrics.span("pdf.extract_chunk"):
+                        window = await asyncio.to_thread(next_window, chunks)
+                    if not window:
+                        break
+                    # The first window replaces the fingerprints and vectors of an earlier attempt
+                    first_window = not job.chunks_total
+                    job.chunks_total += len(window)
+                    window = await asyncio.to_thread(filter_near_duplicates, job.pdf_id, window, replace=first_window)
+                    if window:
+                        if job.status != STATUS_EMBEDDING:
+                            await self._set_status(job, STATUS_EMBEDDING)
+                        done_before = job.chunks_done
+
+                        def progress(done, total):
+                            job.chunks_done = done_before + done
+                            job.updated_at = time.time()
+
+                        with metrics.span("pdf.embed"):
+                            await asyncio.to_thread(self._index_fn, job.pdf_id, window, progress, not indexed)
+                        indexed += len(window)
+                    # Skipped duplicates count as done
+                    job.chunks_done = job.chunks_total
+                if not job.chunks_total:
+                    await self._set_status(job, STATUS_FAILED, "No text could be extracted from the PDF")
+                    return
+                await self._set_status(job, STATUS_PROCESSED)
+                if not indexed:
+                    log.info("pdf_no_new_content", pdf_id=job.pdf_id, filename=job.filename)
+                    return
+                log.info("pdf_indexed", pdf_id=job.pdf_id, filename=job.filename, chunks=indexed)
+            except Exception as e:
+                log.exception("pdf_ingestion_failed", pdf_id=job.pdf_id, filename=job.filename)
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_broken_pool(pool)
+                # Its chunks never (fully) reached the index, so they must not suppress later uploads
+                await asyncio.to_thread(database.delete_chunk_fingerprints, job.pdf_id)
+                if indexed and self._discard_fn is not None:
+                    await asyncio.to_thread(self._discard_fn, job.pdf_id)
+                await self._set_status(job, STATUS_FAILED, str(e))
+            finally:
+                if chunks is not None:
+                    # Cancels page extraction still queued for a failed job
+                    await asyncio.to_thread(chunks.close)
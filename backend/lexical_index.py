@@ -0,0 +1,217 @@
+"""
+BM25 inverted index over the same chunks as the FAISS segments.
+
+Every segment gets a lexicon file written next to its vectors when the segment
+is written (at ingestion and compaction), so building it costs one pass over the
+chunk texts the upload already holds:
+
+    seg-000001.lex.npz   terms (sorted, UTF-8, one joined buffer plus offsets into it),
+                         offsets into the postings, postings (ids, tfs), and the token
+                         length of every chunk (ids, lengths)
+
+It serves two purposes in retrieval (see ShardedVectorStore.hybrid_search_with_score):
+
+- a pre-filter: a query none of whose terms occurs in the searched shards cannot be
+  answered from the documents, so the query embedding and dense search are skipped;
+- a second ranking, fused with the FAISS ranking by reciprocal rank fusion, which
+  brings back exact-term matches (dish names, ingredients, numbers) that embeddings rank low.
+
+Terms are lower-cased word tokens with English stop words removed and a trailing
+plural "s" stripped, so "Eggs" in a query matches "egg" in a recipe.
+"""
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+import numpy as np
+
+# Skip dense retrieval when a query shares no term with the searched shards
+LEXICAL_PREFILTER = os.getenv("LEXICAL_PREFILTER", "1") == "1"
+# Fuse BM25 with the FAISS ranking (0: dense ranking only)
+LEXICAL_FUSION = os.getenv("LEXICAL_FUSION", "1") == "1"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Chunks only BM25 finds are kept when their score reaches this share of the query's
+# best possible BM25 score (every term matched many times); dense hits have the distance threshold
+LEXICAL_MIN_SCORE = float(os.getenv("LEXICAL_MIN_SCORE", "0.3"))
+# Reciprocal rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+_TOKEN = re.compile(r"\w+")
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not of off on once only or other our ours
+out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you
+your yours get got give me please recommend recme want like find any some
+""".split())
+
+
+def terms(text):
+    """Index terms of `text`, in order (repeats kept, for term frequencies)."""
+    words = _TOKEN.findall(unicodedata.normalize("NFKC", text or "").casefold())
+    out = []
+    for word in words:
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        out.append(word)
+    return out
+
+
+def query_terms(text):
+    """Distinct index terms of a query."""
+    return list(dict.fromkeys(terms(text)))
+
+
+class Lexicon:
+    """One segment's inverted index: term -> (ids, term frequencies), plus chunk lengths in terms."""
+
+    def __init__(self, term_bytes, term_offsets, offsets, posting_ids, posting_tfs, doc_ids, doc_lengths):
+        # Sorted terms as one UTF-8 buffer: term n is term_bytes[term_offsets[n]:term_offsets[n + 1]]
+        self.term_bytes = term_bytes
+        self.term_offsets = term_offsets
+        self.offsets = offsets
+        self.posting_ids = posting_ids
+        self.posting_tfs = posting_tfs
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.total_length = int(doc_lengths.sum()) if len(doc_lengths) else 0
+
+    @staticmethod
+    def _pack(vocabulary):
+        """(buffer, offsets) of UTF-8 terms, already sorted by their bytes."""
+        encoded = [term.encode("utf-8") for term in vocabulary]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(term) for term in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), term_offsets
+
+    @classmethod
+    def build(cls, ids, texts):
+        """Lexicon of chunks `texts` with (ascending) vector ids `ids`."""
+        postings = {}
+        lengths = np.zeros(len(ids), dtype=np.int32)
+        for row, (faiss_id, text) in enumerate(zip(ids, texts)):
+            counts = Counter(terms(text))
+            lengths[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((int(faiss_id), tf))
+        # Byte order, so lookups can compare encoded terms
+        vocabulary = sorted(postings, key=lambda term: term.encode("utf-8"))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        posting_ids, posting_tfs = [], []
+        for n, term in enumerate(vocabulary):
+            entries = postings[term]
+            offsets[n + 1] = offsets[n] + len(entries)
+            posting_ids.extend(i for i, _ in entries)
+            posting_tfs.extend(tf for _, tf in entries)
+        return cls(
+            *cls._pack(vocabulary),
+            offsets,
+            np.asarray(posting_ids, dtype=np.int64),
+            np.asarray(posting_tfs, dtype=np.int32),
+            np.asarray(ids, dtype=np.int64),
+            lengths,
+        )
+
+    def save(self, f):
+        np.savez(
+            f, term_bytes=self.term_bytes, term_offsets=self.term_offsets, offsets=self.offsets,
+            posting_ids=self.posting_ids, posting_tfs=self.posting_tfs, doc_ids=self.doc_ids,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["term_bytes"], data["term_offsets"], data["offsets"], data["posting_ids"],
+                data["posting_tfs"], data["doc_ids"], data["doc_lengths"],
+            )
+
+    def __len__(self):
+        return len(self.term_offsets) - 1
+
+    def term(self, n):
+        return self.term_bytes[self.term_offsets[n]:self.term_offsets[n + 1]].tobytes().decode("utf-8")
+
+    def _find(self, term):
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_bytes[self.term_offsets[mid]:self.term_offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.term_bytes[self.term_offsets[lo]:self.term_offsets[lo + 1]].tobytes() == key:
+            return lo
+        return None
+
+    def df(self, term):
+        """Chunks containing `term` (tombstoned ones included)."""
+        n = self._find(term)
+        return 0 if n is None else int(self.offsets[n + 1] - self.offsets[n])
+
+    def postings(self, term):
+        """(ids, term frequencies, chunk lengths) of the chunks containing `term`."""
+        n = self._find(term)
+        if n is None:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        start, end = int(self.offsets[n]), int(self.offsets[n + 1])
+        ids = self.posting_ids[start:end]
+        lengths = self.doc_lengths[np.searchsorted(self.doc_ids, ids)]
+        return ids, self.posting_tfs[start:end], lengths
+
+
+class CorpusStats:
+    """BM25 collection statistics over every searched shard, so scores compare across shards."""
+
+    def __init__(self, docs=0, total_length=0, df=None):
+        self.docs = docs
+        self.total_length = total_length
+        self.df = df if df is not None else Counter()
+
+    def merge(self, other):
+        self.docs += other.docs
+        self.total_length += other.total_length
+        self.df.update(other.df)
+        return self
+
+    def matches(self):
+        """Whether any query term occurs in the corpus at all."""
+        return any(self.df.values())
+
+    def idf(self, term):
+        df = self.df[term]
+        return math.log(1.0 + (self.docs - df + 0.5) / (df + 0.5))
+
+    def avg_length(self):
+        return self.total_length / self.docs if self.docs else 0.0
+
+    def max_score(self, terms, k1=BM25_K1):
+        """
+        Upper bound of a chunk's BM25 score for query `terms`: each term's idf * (k1 + 1).
+        Terms absent from the corpus have the highest idf but add nothing to any score.
+        """
+        return sum(self.idf(term) * (k1 + 1.0) for term in set(terms) if self.df.get(term, 0) > 0)
+
+
+def bm25(tfs, lengths, idf, avg_length, k1=BM25_K1, b=BM25_B):
+    """BM25 term weights for arrays of term frequencies and chunk lengths."""
+    tfs = tfs.astype(np.float64)
+    norm = 1.0 - b + b * (lengths / avg_length if avg_length else 1.0)
+    return idf * tfs * (k1 + 1.0) / (tfs + k1 * norm)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Keys of several best-first rankings, ordered by sum(1 / (k + rank)), best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda key: -scores[key])
@@ -0,0 +1,309 @@
+import os
+import time
+import heapq
+import random
+import functools
+import itertools
+import threading
+from langchain_core.embeddings import Embeddings
+from backend import metrics, logs
+
+log = logs.get_logger(__name__)
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "800000"))
+LLM_INITIAL_CONCURRENCY = float(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+LLM_MIN_CONCURRENCY = float(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = float(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "3.0"))
+# Budget for the completion side of a chat call when reserving TPM
+COMPLETION_TOKEN_ESTIMATE = 512
+# Embedding request limits (OpenAI: 2048 inputs and 300k tokens per request); batches are packed up to both
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "256"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "250000"))
+EMBED_TOKENIZER = os.getenv("EMBED_TOKENIZER", "cl100k_base")
+
+LLM_CALL_SECONDS = metrics.histogram("foodchat_llm_call_seconds", "Outbound model call latency per attempt", ["kind"])
+LLM_EVENTS = metrics.counter("foodchat_llm_events_total", "Model gateway events (calls, throttled, slow, retries, errors)", ["event"])
+
+
+def estimate_tokens(texts) -> int:
+    """Cheap upper-ish estimate (~4 chars/token) used only for TPM accounting."""
+    return sum(len(t or "") // 4 + 1 for t in texts)
+
+
+@functools.lru_cache(maxsize=1)
+def token_encoding():
+    """tiktoken encoding for EMBED_TOKENIZER, or None without tiktoken."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(EMBED_TOKENIZER)
+    except Exception:  # not installed, or its BPE file cannot be fetched offline
+        return None
+
+
+def count_tokens(text) -> int:
+    """Exact token count with tiktoken when available, else the ~4 chars/token estimate."""
+    encoding = token_encoding()
+    if encoding is None:
+        return len(text or "") // 4 + 1
+    return len(encoding.encode(text or "", disallowed_special=()))
+
+
+def pack_batches(texts, max_items=EMBED_BATCH_MAX_ITEMS, max_tokens=EMBED_BATCH_MAX_TOKENS):
+    """
+    Split `texts` into contiguous (start, end) ranges of at most `max_items` texts and
+    `max_tokens` tokens each, so every range fits in one embedding request.
+    A single text over the token limit gets a range of its own.
+    """
+    ranges, start, tokens = [], 0, 0
+    for i, text in enumerate(texts):
+        count = count_tokens(text)
+        if i > start and (i - start >= max_items or tokens + count > max_tokens):
+            ranges.append((start, i))
+            start, tokens = i, 0
+        tokens += count
+    if start < len(texts):
+        ranges.append((start, len(texts)))
+    return ranges
+
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def _retry_after(exc):
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(exc, status):
+    if status is not None:
+        return status == 429 or status == 408 or status >= 500
+    # Transport-level failures (openai.APITimeoutError / APIConnectionError, socket errors)
+    return type(exc).__name__ in ("APITimeoutError", "APIConnectionError", "Timeout", "ConnectionError", "TimeoutError")
+
+
+class TokenBucket:
+    """Continuous-refill bucket sized to one minute of budget. Not thread-safe; guarded by the gateway lock."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now) -> float:
+        self._refill(now)
+        # Requests bigger than the whole bucket are let through once it is full
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount, now):
+        self._refill(now)
+        self.tokens -= min(amount, self.capacity)
+
+
+class ModelGateway:
+    """
+    Process-wide admission control for outbound model calls.
+    - Token buckets for requests/minute and tokens/minute.
+    - AIMD concurrency limit: +1/limit per healthy call, halved on 429 or latency spikes.
+    - Strict priority among waiters, FIFO within a priority.
+    - Retries with full-jitter exponential backoff, honoring Retry-After.
+    """
+
+    def __init__(
+        self,
+        rpm=LLM_RPM,
+        tpm=LLM_TPM,
+        initial_concurrency=LLM_INITIAL_CONCURRENCY,
+        min_concurrency=LLM_MIN_CONCURRENCY,
+        max_concurrency=LLM_MAX_CONCURRENCY,
+        max_retries=LLM_MAX_RETRIES,
+        latency_tolerance=LLM_LATENCY_TOLERANCE,
+        base_delay=0.5,
+        max_delay=30.0,
+    ):
+        self._cond = threading.Condition()
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._waiters = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._limit = float(initial_concurrency)
+        self._min = float(min_concurrency)
+        self._max = float(max_concurrency)
+        self._max_retries = max_retries
+        self._tolerance = latency_tolerance
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._last_decrease = 0.0
+        self._baseline: dict[str, float] = {}
+        self._counts = {"calls": 0, "throttled": 0, "retries": 0, "errors": 0, "slow": 0}
+
+    def _acquire(self, priority, tokens):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == ticket and self._in_flight < int(self._limit):
+                        now = time.monotonic()
+                        timeout = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+                        if timeout <= 0:
+                            self._requests.consume(1, now)
+                            self._tokens.consume(tokens, now)
+                            self._in_flight += 1
+                            self._counts["calls"] += 1
+                            LLM_EVENTS.inc(event="calls")
+                            return
+                    self._cond.wait(timeout=timeout)
+            finally:
+                if self._waiters and self._waiters[0] == ticket:
+                    heapq.heappop(self._waiters)
+                else:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def _decrease(self, now, reason):
+        # At most one multiplicative decrease per second so a burst of 429s counts once
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        old = self._limit
+        self._limit = max(self._min, self._limit / 2)
+        log.info("concurrency_decreased", reason=reason, old=round(old, 1), new=round(self._limit, 1))
+
+    def _release(self, kind, latency, throttled):
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            baseline = self._baseline.get(kind)
+            # Slowly rising floor: tracks the best recent latency for this kind of call
+            baseline = latency if baseline is None else min(latency, baseline + (latency - baseline) * 0.01)
+            self._baseline[kind] = baseline
+            LLM_CALL_SECONDS.observe(latency, kind=kind)
+            if throttled:
+                self._counts["throttled"] += 1
+                LLM_EVENTS.inc(event="throttled")
+                self._decrease(now, "429 from provider")
+            elif latency > baseline * self._tolerance and latency > 1.0:
+                self._counts["slow"] += 1
+                LLM_EVENTS.inc(event="slow")
+                self._decrease(now, f"{kind} latency {latency:.2f}s vs baseline {baseline:.2f}s")
+            else:
+                self._limit = min(self._max, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def _count(self, name):
+        with self._cond:
+            self._counts[name] += 1
+        LLM_EVENTS.inc(event=name)
+
+    def _backoff(self, attempt, retry_after):
+        delay = random.uniform(0, min(self._max_delay, self._base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def call(self, fn, *args, priority=PRIORITY_DEFAULT, tokens=0, kind=None, **kwargs):
+        """Run fn(*args, **kwargs) under the gateway's limits, retrying transient failures."""
+        kind = kind or getattr(fn, "__qualname__", "call")
+        attempt = 0
+        while True:
+            self._acquire(priority, tokens)
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                status = _status_code(e)
+                self._release(kind, time.monotonic() - start, throttled=(status == 429))
+                if not _is_retryable(e, status) or attempt >= self._max_retries:
+                    self._count("errors")
+                    raise
+                delay = self._backoff(attempt, _retry_after(e))
+                attempt += 1
+                self._count("retries")
+                log.warning("model_call_retry", kind=kind, error=type(e).__name__, status=status, attempt=attempt, max_retries=self._max_retries, delay=round(delay, 2))
+                time.sleep(delay)
+                continue
+            self._release(kind, time.monotonic() - start, throttled=False)
+            return result
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": self._limit,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                **self._counts,
+            }
+
+
+# Shared by every model call in the process
+gateway = ModelGateway()
+
+metrics.gauge("foodchat_llm_concurrency_limit", "Current AIMD concurrency limit for model calls").set_function(lambda: gateway._limit)
+metrics.gauge("foodchat_llm_in_flight", "Model calls currently in flight").set_function(lambda: gateway._in_flight)
+metrics.gauge("foodchat_llm_waiting", "Model calls waiting for admission").set_function(lambda: len(gateway._waiters))
+
+
+def invoke_llm(llm, messages, priority=PRIORITY_INTERACTIVE):
+    """llm.invoke(messages) through the gateway."""
+    tokens = estimate_tokens(getattr(m, "content", "") for m in messages) + COMPLETION_TOKEN_ESTIMATE
+    return gateway.call(llm.invoke, messages, priority=priority, tokens=tokens, kind="chat")
+
+
+class GatedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that sends each batch through the gateway (documents are bulk, queries interactive).
+    Documents are packed into batches by item and token count (pack_batches), one request each.
+    """
+
+    def __init__(self, inner, batch_size=EMBED_BATCH_MAX_ITEMS, max_tokens=EMBED_BATCH_MAX_TOKENS, priority=PRIORITY_BULK):
+        self.inner = inner
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.priority = priority
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = []
+        for start, end in pack_batches(texts, self.batch_size, self.max_tokens):
+            batch = texts[start:end]
+            vectors.extend(gateway.call(
+                self.inner.embed_documents, batch,
+                priority=self.priority, tokens=estimate_tokens(batch), kind="embed_documents",
+            ))
+        return vectors
+
+    def embed_query(self, text):
+        return gateway.call(
+            self.inner.embed_query, text,
+            priority=PRIORITY_INTERACTIVE, tokens=estimate_tokens([text]), kind="embed_query",
+        )
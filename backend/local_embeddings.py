@@ -0,0 +1,187 @@
+"""
+Local sentence-transformers embeddings (EMBEDDINGS_PROVIDER=local): no network calls, no per-token cost.
+
+One inference thread owns the model. Callers enqueue texts and wait on a future;
+the thread packs whatever is waiting (queries before documents) into batches of up
+to LOCAL_EMBEDDING_BATCH_SIZE texts, giving a batch at most LOCAL_EMBEDDING_MAX_WAIT_MS
+to fill. Running every forward pass on that one thread, with torch's intra-op pool
+sized by LOCAL_EMBEDDING_THREADS and pinned to LOCAL_EMBEDDING_CPUS, keeps concurrent
+requests from oversubscribing the CPU.
+
+    LOCAL_EMBEDDING_BACKEND  torch (default) | torch-int8 | onnx | onnx-int8
+
+torch-int8 applies dynamic int8 quantization to the Linear layers; onnx-int8 loads the
+quantized ONNX export named by LOCAL_EMBEDDING_ONNX_FILE. Quantized backends produce
+slightly different vectors, so they count as a different embedding model (see
+providers.embedding_model_name).
+"""
+import os
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+from backend import metrics, logs
+from backend.llm_gateway import PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+log = logs.get_logger(__name__)
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_BACKEND = os.getenv("LOCAL_EMBEDDING_BACKEND", "torch")
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))  # 0: one per CPU it may run on
+LOCAL_EMBEDDING_CPUS = os.getenv("LOCAL_EMBEDDING_CPUS", "")  # e.g. "0-3,8"; empty: inherit the process affinity
+
+LOCAL_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+LOCAL_BATCH_TEXTS = metrics.histogram(
+    "foodchat_local_embedding_batch_texts", "Texts per local embedding forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+LOCAL_BATCH_SECONDS = metrics.histogram("foodchat_local_embedding_batch_seconds", "Local embedding forward pass duration")
+
+
+def parse_cpus(spec):
+    """CPU ids from a list like "0-3,8" (empty set for an empty spec)."""
+    cpus = set()
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def load_model(name=LOCAL_EMBEDDING_MODEL, backend=LOCAL_EMBEDDING_BACKEND):
+    if backend not in LOCAL_BACKENDS:
+        raise ValueError(f"Unknown LOCAL_EMBEDDING_BACKEND '{backend}' (expected one of {', '.join(LOCAL_BACKENDS)})")
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "onnx":
+        return SentenceTransformer(name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(name, device="cpu", backend="onnx", model_kwargs={"file_name": LOCAL_EMBEDDING_ONNX_FILE})
+    model = SentenceTransformer(name, device="cpu")
+    if backend == "torch-int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.future = Future()
+
+
+class LocalEmbeddings(Embeddings):
+    """sentence-transformers model behind a dynamic-batching inference thread; vectors are unit-normalized."""
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, backend=LOCAL_EMBEDDING_BACKEND,
+                 batch_size=LOCAL_EMBEDDING_BATCH_SIZE, max_wait_ms=LOCAL_EMBEDDING_MAX_WAIT_MS,
+                 threads=LOCAL_EMBEDDING_THREADS, cpus=LOCAL_EMBEDDING_CPUS, model=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.threads = threads
+        self.cpus = parse_cpus(cpus)
+        self._model = model
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._load_error = None
+        # Started (and the model loaded) on first use: serve.py imports the app before forking
+        # workers, and a thread started in the parent would not exist in them
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # --- Inference thread ---
+
+    def _pin(self):
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            # pid 0 is the calling thread on Linux; torch's pool inherits the mask when it starts
+            os.sched_setaffinity(0, self.cpus)
+        try:
+            import torch
+        except ImportError:  # ONNX-only install
+            return
+        available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        torch.set_num_threads(self.threads or available)
+
+    def _run(self):
+        try:
+            self._pin()
+            if self._model is None:
+                self._model = load_model(self.model_name, self.backend)
+            log.info("local_embedding_model_ready", model=self.model_name, backend=self.backend)
+        except Exception as e:
+            self._load_error = e
+        while True:
+            batch = self._next_batch()
+            if self._load_error is not None:
+                for request in batch:
+                    request.future.set_exception(self._load_error)
+                continue
+            self._encode(batch)
+
+    def _next_batch(self):
+        """Block for one request, then add waiting ones (by priority) until the batch is full or max_wait passes."""
+        _, _, first = self._queue.get()
+        batch, size = [first], len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.batch_size:
+            try:
+                _, _, request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _encode(self, batch):
+        texts = [text for request in batch for text in request.texts]
+        try:
+            start = time.perf_counter()
+            vectors = self._model.encode(
+                texts, batch_size=len(texts), normalize_embeddings=True,
+                convert_to_numpy=True, show_progress_bar=False,
+            )
+            LOCAL_BATCH_SECONDS.observe(time.perf_counter() - start)
+            LOCAL_BATCH_TEXTS.observe(len(texts))
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)].tolist())
+            offset += len(request.texts)
+
+    # --- Callers ---
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="local-embeddings", daemon=True)
+                self._thread.start()
+
+    def _submit(self, texts, priority):
+        self._ensure_started()
+        request = _Request(texts)
+        self._queue.put((priority, next(self._seq), request))
+        return request.future
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        # Split so queries can be batched in between the slices of a large document
+        futures = [
+            self._submit(texts[i:i + self.batch_size], PRIORITY_BULK)
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return [vec for future in futures for vec in future.result()]
+
+    def embed_query(self, text):
+        return self._submit([text], PRIORITY_INTERACTIVE).result()[0]
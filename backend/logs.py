@@ -0,0 +1,205 @@
+"""
+Structured logging that does not block the caller.
+
+    from backend import logs
+    log = logs.get_logger(__name__)
+
+    log.info("pdf_indexed", pdf_id=7, chunks=42)
+    log.debug("doc_filtered", distance=0.81)             # sampled, see LOG_DEBUG_SAMPLE
+    log.info("intent_parsed", raw=logs.payload(text))    # LLM/search payloads, capped at LOG_PAYLOAD_MAX_CHARS
+    log.exception("recme_failed", chat_id=3)             # inside `except`: adds the traceback
+
+A call checks the logger's level, caps its string fields and puts the record on a
+bounded in-memory queue; a writer thread (logging.handlers.QueueListener) formats it as
+one JSON line (LOG_FORMAT=text: one readable line) and writes it to stdout. A full queue
+drops the record and counts it in foodchat_log_dropped_total instead of making the event
+loop wait on stdout.
+
+Loggers are named after their module without the "backend." prefix ("ingestion" for
+backend/ingestion.py); LOG_LEVELS sets levels per module on top of LOG_LEVEL, e.g.
+LOG_LEVELS="recommendation=DEBUG,llm_gateway=WARNING".
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from backend import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# json: one JSON object per line; text: "time LEVEL [pid] logger: event key=value ..."
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Share of debug events kept (debug events are the high-volume ones: per document, per message)
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "0.1"))
+# Longest string field, and longest LLM prompt/response or search result field (logs.payload)
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", "2000"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+# Records waiting for the writer thread; more are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT = "foodchat"
+_RESERVED = ("ts", "level", "logger", "event", "pid")
+
+LOG_DROPPED = metrics.counter("foodchat_log_dropped_total", "Log records dropped because the writer queue was full", ["level"])
+
+
+class payload(str):
+    """Marks a field as a model or search payload, capped at LOG_PAYLOAD_MAX_CHARS."""
+
+    def __new__(cls, value):
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        return super().__new__(cls, value)
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[+{len(text) - limit} chars]"
+
+
+def _cap(value):
+    if isinstance(value, payload):
+        return _truncate(str(value), LOG_PAYLOAD_MAX_CHARS)
+    if isinstance(value, str):
+        return _truncate(value, LOG_FIELD_MAX_CHARS)
+    return value
+
+
+def _field(value):
+    """A JSON-ready field value; containers are serialized here, in the writer thread, and capped."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    return _truncate(json.dumps(value, ensure_ascii=False, default=str), LOG_FIELD_MAX_CHARS)
+
+
+def _timestamp(created):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(created)) + f".{int(created % 1 * 1000):03d}Z"
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": _timestamp(record.created),
+            "level": record.levelname.lower(),
+            "logger": record.name[len(ROOT) + 1:] or ROOT,
+            "event": record.getMessage(),
+            "pid": record.process,
+        }
+        for key, value in getattr(record, "fields", {}).items():
+            entry[f"field_{key}" if key in _RESERVED else key] = _field(value)
+        if record.exc_info:
+            entry["exc"] = _truncate(self.formatException(record.exc_info), LOG_FIELD_MAX_CHARS)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = " ".join(f"{key}={_field(value)}" for key, value in getattr(record, "fields", {}).items())
+        name = record.name[len(ROOT) + 1:] or ROOT
+        line = f"{_timestamp(record.created)} {record.levelname:<7} [{record.process}] {name}: {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatting happens in the writer thread; the record is only read from there
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(level=record.levelname.lower())
+
+
+class Logger:
+    """`method(event, **fields)` front end of a stdlib logger under "foodchat"."""
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(f"{ROOT}.{name}")
+
+    def enabled(self, level=logging.DEBUG):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        if level == logging.DEBUG and LOG_DEBUG_SAMPLE < 1.0:
+            if random.random() >= LOG_DEBUG_SAMPLE:
+                return
+            fields["sample_rate"] = LOG_DEBUG_SAMPLE
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": {k: _cap(v) for k, v in fields.items()}})
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        """Error with the traceback of the exception being handled."""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name):
+    if name.startswith("backend."):
+        name = name[len("backend."):]
+    return Logger(name)
+
+
+_handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+_listener = None
+
+
+def _start_writer():
+    """(Re)start the writer thread with a fresh queue; also runs in forked children (serve.py workers)."""
+    global _listener
+    _handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    _listener = logging.handlers.QueueListener(_handler.queue, out)
+    _listener.start()
+
+
+def flush():
+    """Write out every queued record and stop the writer (at exit)."""
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        except queue.Full:  # no room for the stop sentinel; the daemon writer dies with the process
+            pass
+        _listener = None
+
+
+def _configure():
+    root = logging.getLogger(ROOT)
+    root.setLevel(LOG_LEVEL)
+    # Only our writer prints these; not uvicorn's or gunicorn's root handlers as well
+    root.propagate = False
+    root.addHandler(_handler)
+    for item in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = item.partition("=")
+        logging.getLogger(f"{ROOT}.{name.strip()}").setLevel(level.strip().upper())
+    _start_writer()
+    atexit.register(flush)
+    # The writer thread does not survive fork: serve.py's gunicorn master imports the app first
+    os.register_at_fork(after_in_child=_start_writer)
+
+
+_configure()
@@ -1,49 +1,180 @@
 import os
 import re
-import pytesseract
-import pdfplumber
-from pdf2image import convert_from_path
+import hashlib
+from collections import deque
+from itertools import islice
+from backend import logs
+# pdfplumber, pdf2image and pytesseract are imported where they are used: only ingestion
+# (in its worker processes) needs them, not the server process importing clean_text
 
+log = logs.get_logger(__name__)
 
 PDF_DIR = "pdfs/"
+# Pages handed to a worker per task: enough to amortize opening the PDF in the worker
+PAGES_PER_TASK = 8
+# Page blocks submitted ahead of the consumer; bounds memory for very long PDFs
+MAX_PENDING_TASKS = 8
+
+# OCR fallback for pages without a usable text layer
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "25"))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(os.path.dirname(__file__), "ocr_cache"))
+_OCR_OK_CHARS = set(".,;:'\"!?()-|$%&/*+#@")
+
+
+def _page_text(page):
+    parts = []
+    # Extract tables with structure
+    for table in page.extract_tables():
+        if table:
+            # Convert to readable format
+            for row in table:
+                parts.append(" | ".join([str(cell or "") for cell in row]) + "\n")
+            parts.append("\n")
+    # Then text
+    parts.append((page.extract_text() or "") + "\n")
+    return "".join(parts)
+
+
+def needs_ocr(text):
+    """True when a page's text layer is missing or mostly unmapped glyphs / noise."""
+    stripped = text.strip()
+    if len(stripped) < OCR_MIN_CHARS:
+        return True
+    # pdfminer renders glyphs without a unicode mapping as "(cid:123)"
+    if stripped.count("(cid:") * 8 > len(stripped) * 0.3:
+        return True
+    readable = sum(1 for ch in stripped if ch.isalnum() or ch.isspace() or ch in _OCR_OK_CHARS)
+    return readable / len(stripped) < 0.6
+
+
+def _page_content_hash(pdf_path, page_index, page=None):
+    """Hash of the page's content stream and embedded images, so identical scans share cache entries."""
+    digest = hashlib.sha256()
+    try:
+        from pdfminer.pdftypes import resolve1
+        page_obj = page.page_obj
+        for stream in page_obj.contents:
+            digest.update(resolve1(stream).get_rawdata() or b"")
+        xobjects = resolve1((page_obj.resources or {}).get("XObject")) or {}
+        for name in sorted(xobjects):
+            digest.update(resolve1(xobjects[name]).get_rawdata() or b"")
+    except Exception:
+        stat = os.stat(pdf_path)
+        digest.update(f"{os.path.abspath(pdf_path)}:{stat.st_size}:{stat.st_mtime_ns}:{page_index}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ocr_page(pdf_path, page_index, page=None, dpi=OCR_DPI):
+    """OCR a single page (rasterizing only that page), cached on disk by page content hash."""
+    key = _page_content_hash(pdf_path, page_index, page)
+    cache_file = os.path.join(OCR_CACHE_DIR, f"{key}-{dpi}-{OCR_LANG}.txt")
+    if os.path.exists(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return f.read()
+
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_index + 1, last_page=page_index + 1)
+    text = "".join(pytesseract.image_to_string(img, lang=OCR_LANG) for img in images)
+
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    tmp = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, cache_file)
+    return text
+
+
+def extract_page_range(pdf_path, start, stop):
+    """Text of pages [start, stop), OCR-ing pages without a usable text layer; runs in a worker process."""
+    import pdfplumber
+
+    out = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for index, page in enumerate(pdf.pages[start:stop], start):
+            text = _page_text(page)
+            if OCR_ENABLED and needs_ocr(text):
+                try:
+                    ocr_text = ocr_page(pdf_path, index, page)
+                    if len(ocr_text.strip()) > len(text.strip()):
+                        text = ocr_text + "\n"
+                except Exception as e:
+                    log.exception("ocr_failed", path=pdf_path, page=index + 1)
+            out.append(text)
+    return out
+
+
+def iter_pdf_pages(pdf_docs, executor=None, progress=None):
+    """
+    Yield the text of each page, in order, across all PDFs.
+    With an executor, blocks of PAGES_PER_TASK pages are extracted in parallel and at
+    most MAX_PENDING_TASKS blocks are in flight. progress(done_pages, total_pages) is
+    called per block.
+    """
+    import pdfplumber
 
-def get_pdf_text(pdf_docs):
-    text = ""
     for pdf_path in pdf_docs:
         full_path = pdf_path if os.path.isabs(pdf_path) else os.path.join(PDF_DIR, pdf_path)
         if not os.path.exists(full_path):
-            print("[WARN] File not found:", full_path)
+            log.warning("pdf_not_found", path=full_path)
             continue
         
-        print("[INFO] Reading:", full_path)
+        log.info("pdf_reading", path=full_path)
+        pending = deque()
         try:
             with pdfplumber.open(full_path) as pdf:
-                for page in pdf.pages:
-                    # Extract tables with structure
-                    tables = page.extract_tables()
-                    for table in tables:
-                        if table:
-                            # Convert to readable format
-                            for row in table:
-                                text += " | ".join([str(cell or "") for cell in row]) + "\n"
-                            text += "\n"
-                    # Then text
-                    text += (page.extract_text() or "") + "\n"
-        except Exception as e:
-            print(f"[ERROR] pdfplumber failed: {e}")
-    return text.strip()
+                page_count = len(pdf.pages)
+            blocks = iter([(i, min(i + PAGES_PER_TASK, page_count)) for i in range(0, page_count, PAGES_PER_TASK)])
+            done = 0
+            if executor is None:
+                for start, stop in blocks:
+                    pages = extract_page_range(full_path, start, stop)
+                    done += len(pages)
+                    if progress:
+                        progress(done, page_count)
+                    yield from pages
+                continue
+
+            for start, stop in islice(blocks, MAX_PENDING_TASKS):
+                pending.append(executor.submit(extract_page_range, full_path, start, stop))
+            while pending:
+                pages = pending.popleft().result()
+                block = next(blocks, None)
+                if block is not None:
+                    pending.append(executor.submit(extract_page_range, full_path, *block))
+                done += len(pages)
+                if progress:
+                    progress(done, page_count)
+                yield from pages
+        finally:
+            # An error propagates, so the ingestion job fails instead of indexing part of the PDF
+            for future in pending:
+                future.cancel()
+
+
+def get_pdf_text(pdf_docs, executor=None):
+    return "".join(iter_pdf_pages(pdf_docs, executor=executor)).strip()
 
 
 def extract_text_ocr(pdf_path, page_index=None):
+    import pytesseract
+    from pdf2image import convert_from_path
+
     text = ""
     try:
-        pages = convert_from_path(pdf_path)
         if page_index is not None:
-            pages = [pages[page_index]]
+            # Rasterize only the requested page
+            pages = convert_from_path(pdf_path, dpi=OCR_DPI, first_page=page_index + 1, last_page=page_index + 1)
+        else:
+            pages = convert_from_path(pdf_path, dpi=OCR_DPI)
         for img in pages:
-            text += pytesseract.image_to_string(img, lang="eng") + "\n"
+            text += pytesseract.image_to_string(img, lang=OCR_LANG) + "\n"
     except Exception as e:
-        print(f"[ERROR] OCR failed for '{pdf_path}': {e}")
+        log.exception("ocr_failed", path=pdf_path)
     return text
 
 
@@ -0,0 +1,187 @@
+"""
+Model and search backends, selected by environment variables.
+
+    LLM_PROVIDER         openai (default) | fake
+    EMBEDDINGS_PROVIDER  openai (default) | local | hashed
+    SEARCH_PROVIDER      duckduckgo (default) | fixture
+
+The offline implementations are deterministic so the throughput and latency of
+our own code can be measured without network calls or API keys. "local" runs a
+sentence-transformers model on the CPU (see backend.local_embeddings).
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import functools
+from typing import Protocol, Any
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+from backend.llm_gateway import GatedEmbeddings, EMBED_BATCH_MAX_ITEMS
+from backend.embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEmbeddings, EmbeddingCache
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai")
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "duckduckgo")
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
+HASHED_EMBEDDING_DIM = int(os.getenv("HASHED_EMBEDDING_DIM", "3072"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "300"))
+FAKE_SEARCH_LATENCY_MS = float(os.getenv("FAKE_SEARCH_LATENCY_MS", "150"))
+SEARCH_FIXTURES_PATH = os.getenv(
+    "SEARCH_FIXTURES_PATH",
+    os.path.join(os.path.dirname(__file__), "fixtures", "search_results.json"),
+)
+
+
+class ChatProvider(Protocol):
+    def invoke(self, messages: list) -> Any:
+        """Return a message-like object with a `.content` string."""
+        ...
+
+
+class SearchProvider(Protocol):
+    def run(self, query: str) -> str:
+        ...
+
+
+# --- Offline implementations ---
+
+_CUISINES = ["italian", "chinese", "mexican", "japanese", "sushi", "ramen", "thai", "indian", "korean", "french", "vietnamese"]
+_LOCATIONS = ["san francisco", "los angeles", "new york", "seattle", "chicago", "austin", "boston", "oakland"]
+
+
+class FakeChatModel:
+    """Canned-latency stand-in for ChatOpenAI that answers our prompts deterministically."""
+
+    def __init__(self, latency_ms=FAKE_LLM_LATENCY_MS):
+        self.latency = latency_ms / 1000.0
+
+    def invoke(self, messages):
+        time.sleep(self.latency)
+        system = next((m.content for m in messages if getattr(m, "type", "") == "system"), "")
+        conversation = " ".join(str(m.content) for m in messages if getattr(m, "type", "") != "system")
+
+        if "'cuisine' and 'location'" in system:
+            text = conversation.lower()
+            if "Additional Context" in system:
+                text += " " + system.split("Additional Context", 1)[1].lower()
+            cuisine = next((c for c in _CUISINES if c in text), None)
+            location = next((l for l in _LOCATIONS if l in text), None)
+            return AIMessage(content=json.dumps({
+                "cuisine": cuisine.title() if cuisine else None,
+                "location": location.title() if location else None,
+            }))
+
+        if "JSON array" in system:
+            match = re.search(r"Extract exactly (\d+)", system)
+            needed = int(match.group(1)) if match else 5
+            # Fixture results are "Name https://site Description." sequences
+            found = re.findall(r"([A-Z][\w&'+ ]*?) (https?://\S+)", conversation)
+            restaurants = [{"name": name.strip(), "website": url} for name, url in found[:needed]]
+            return AIMessage(content=json.dumps(restaurants))
+
+        if "Context:" in system:
+            context = system.split("Context:", 1)[1].strip()
+            if context:
+                return AIMessage(content=f"From your documents: {context[:200]}")
+        return AIMessage(content="No relevant information found in documents.")
+
+
+class HashedEmbeddings(Embeddings):
+    """Feature-hashing embeddings over words and bigrams; unit-normalized so FAISS L2 thresholds behave like OpenAI's."""
+
+    def __init__(self, dim=HASHED_EMBEDDING_DIM):
+        self.dim = dim
+
+    def _embed(self, text):
+        vec = [0.0] * self.dim
+        words = re.findall(r"\w+", (text or "").lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = sum(v * v for v in vec) ** 0.5
+        if norm:
+            vec = [v / norm for v in vec]
+        return vec
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class FixtureSearch:
+    """Web search stand-in that returns canned result text from a JSON fixture."""
+
+    def __init__(self, path=SEARCH_FIXTURES_PATH, latency_ms=FAKE_SEARCH_LATENCY_MS):
+        with open(path, "r", encoding="utf-8") as f:
+            self.fixtures = json.load(f)
+        self.latency = latency_ms / 1000.0
+
+    def run(self, query):
+        time.sleep(self.latency)
+        q = query.lower()
+        for entry in self.fixtures.get("queries", []):
+            if any(term in q for term in entry.get("match", [])):
+                return entry["results"]
+        return self.fixtures.get("default", "")
+
+
+# --- Factories ---
+
+@functools.lru_cache(maxsize=None)
+def get_chat_model() -> ChatProvider:
+    if LLM_PROVIDER == "fake":
+        return FakeChatModel()
+    if LLM_PROVIDER == "openai":
+        from langchain_openai import ChatOpenAI
+        # Retries are handled by the model gateway
+        return ChatOpenAI(model_name=CHAT_MODEL, temperature=0, max_retries=0)
+    raise ValueError(f"Unknown LLM_PROVIDER '{LLM_PROVIDER}' (expected 'openai' or 'fake')")
+
+
+@functools.lru_cache(maxsize=None)
+def get_embeddings() -> Embeddings:
+    """Embeddings for the vector store; cache misses are batched through the model gateway."""
+    if EMBEDDINGS_PROVIDER == "hashed":
+        embeddings = GatedEmbeddings(HashedEmbeddings())
+    elif EMBEDDINGS_PROVIDER == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        # GatedEmbeddings packs batches under the 300k tokens/request cap; chunk_size only must not split them again
+        embeddings = GatedEmbeddings(OpenAIEmbeddings(model=EMBEDDING_MODEL, chunk_size=EMBED_BATCH_MAX_ITEMS, max_retries=0))
+    elif EMBEDDINGS_PROVIDER == "local":
+        from backend.local_embeddings import LocalEmbeddings
+        # No API rate limits to respect, so it bypasses the model gateway and batches on its own
+        embeddings = LocalEmbeddings()
+    else:
+        raise ValueError(f"Unknown EMBEDDINGS_PROVIDER '{EMBEDDINGS_PROVIDER}' (expected 'openai', 'local' or 'hashed')")
+    if EMBEDDING_CACHE_ENABLED:
+        # Re-ingesting identical chunks is served from disk without calling the model
+        embeddings = CachedEmbeddings(embeddings, EmbeddingCache(embedding_model_name()))
+    return embeddings
+
+
+def embedding_model_name() -> str:
+    """Identifier recorded with vector indexes built by get_embeddings(); indexes refuse a different one."""
+    if EMBEDDINGS_PROVIDER == "hashed":
+        return f"hashed-{HASHED_EMBEDDING_DIM}"
+    if EMBEDDINGS_PROVIDER == "local":
+        from backend.local_embeddings import LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_BACKEND
+        # Quantized backends produce different vectors from the same weights
+        suffix = "" if LOCAL_EMBEDDING_BACKEND in ("torch", "onnx") else f"@{LOCAL_EMBEDDING_BACKEND}"
+        return f"local:{LOCAL_EMBEDDING_MODEL}{suffix}"
+    return EMBEDDING_MODEL
+
+
+@functools.lru_cache(maxsize=None)
+def get_search() -> SearchProvider:
+    if SEARCH_PROVIDER == "fixture":
+        return FixtureSearch()
+    if SEARCH_PROVIDER == "duckduckgo":
+        from langchain_community.tools import DuckDuckGoSearchRun
+        return DuckDuckGoSearchRun()
+    raise ValueError(f"Unknown SEARCH_PROVIDER '{SEARCH_PROVIDER}' (expected 'duckduckgo' or 'fixture')")
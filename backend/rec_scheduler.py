@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+from collections import deque
+from backend import metrics, logs
+
+log = logs.get_logger(__name__)
+
+RECME_WORKERS = int(os.getenv("RECME_WORKERS", "4"))
+RECME_QUEUE_SIZE = int(os.getenv("RECME_QUEUE_SIZE", "100"))
+RECME_COOLDOWN_SECONDS = float(os.getenv("RECME_COOLDOWN_SECONDS", "10"))
+# A cross-process claim not finished after this long is presumed lost with its worker
+RECME_LEASE_SECONDS = float(os.getenv("RECME_LEASE_SECONDS", "300"))
+
+RECME_WAIT_SECONDS = metrics.histogram("foodchat_recme_queue_wait_seconds", "Time @recme jobs spend queued before a worker picks them up")
+RECME_TRIGGERS = metrics.counter("foodchat_recme_triggers_total", "@recme triggers by scheduling outcome", ["status"])
+
+
+class RecommendationJob:
+    def __init__(self, chat_id: int, text: str):
+        self.chat_id = chat_id
+        self.text = text
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.attached = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class RecommendationScheduler:
+    """
+    Runs @recme jobs on a fixed pool of workers.
+    - One job per chat at a time: later triggers attach to the queued/running job.
+    - Bounded queue: triggers are rejected once it is full.
+    - Per-chat cooldown after a job finishes.
+    With `claim_fn(chat_id, cooldown, lease)` and `finish_fn(chat_id)` (database.claim_recme
+    and finish_recme) the last two also hold across the worker processes of serve.py.
+    """
+
+    def __init__(self, handler, workers=RECME_WORKERS, max_queue=RECME_QUEUE_SIZE, cooldown=RECME_COOLDOWN_SECONDS,
+                 claim_fn=None, finish_fn=None, lease=RECME_LEASE_SECONDS):
+        self._handler = handler  # async (chat_id, text) -> None
+        self._workers = workers
+        self._max_queue = max_queue
+        self._cooldown = cooldown
+        self._claim_fn = claim_fn
+        self._finish_fn = finish_fn
+        self._lease = lease
+        self._queue = None
+        self._tasks: list[asyncio.Task] = []
+        self._inflight: dict[int, RecommendationJob] = {}
+        self._last_finished: dict[int, float] = {}
+        self._running = 0
+        self._wait_times = deque(maxlen=1000)
+        self._counts = {
+            "submitted": 0,
+            "attached": 0,
+            "cooldown": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+        }
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self._workers)]
+        log.info("recme_scheduler_started", workers=self._workers, queue=self._max_queue, cooldown=self._cooldown)
+
+    async def stop(self, timeout=30.0):
+        """Wait for queued and running jobs to finish, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("recme_drain_timeout", queued=self._queue.qsize(), running=self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, chat_id: int, text: str):
+        """
+        Schedule a recommendation for a chat.
+        Returns (status, future); status is one of "queued", "attached", "cooldown", "rejected".
+        """
+        job = self._inflight.get(chat_id)
+        if job is not None:
+            # Single-flight: the running job reads the full history, so it covers this trigger too
+            job.attached += 1
+            if job.started_at is None:
+                job.text = text
+            self._counts["attached"] += 1
+            RECME_TRIGGERS.inc(status="attached")
+            return "attached", job.future
+
+        last = self._last_finished.get(chat_id)
+        if last is not None and time.monotonic() - last < self._cooldown:
+            self._counts["cooldown"] += 1
+            RECME_TRIGGERS.inc(status="cooldown")
+            return "cooldown", None
+
+        if self._queue is None or self._queue.full():
+            self._counts["rejected"] += 1
+            RECME_TRIGGERS.inc(status="rejected")
+            log.warning("recme_queue_full", chat_id=chat_id)
+            return "rejected", None
+
+        claim = self._claim(chat_id)
+        if claim == "running":
+            # Another worker runs this chat's job; its reply reaches this worker's sockets through the fan-out
+            self._counts["attached"] += 1
+            RECME_TRIGGERS.inc(status="attached")
+            return "attached", None
+        if claim == "cooldown":
+            self._counts["cooldown"] += 1
+            RECME_TRIGGERS.inc(status="cooldown")
+            return "cooldown", None
+
+        job = RecommendationJob(chat_id, text)
+        self._inflight[chat_id] = job
+        self._queue.put_nowait(job)
+        self._counts["submitted"] += 1
+        RECME_TRIGGERS.inc(status="queued")
+        return "queued", job.future
+
+    def _claim(self, chat_id: int):
+        if self._claim_fn is None:
+            return "claimed"
+        try:
+            return self._claim_fn(chat_id, self._cooldown, self._lease)
+        except Exception:
+            # Without the shared claim this worker still enforces its own single-flight and cooldown
+            log.exception("recme_claim_failed", chat_id=chat_id)
+            return "claimed"
+
+    async def _finish(self, chat_id: int):
+        if self._finish_fn is None:
+            return
+        try:
+            await asyncio.to_thread(self._finish_fn, chat_id)
+        except Exception:
+            log.exception("recme_finish_failed", chat_id=chat_id)
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            job.started_at = time.monotonic()
+            self._wait_times.append(job.started_at - job.enqueued_at)
+            RECME_WAIT_SECONDS.observe(job.started_at - job.enqueued_at)
+            self._running += 1
+            ok = False
+            try:
+                await self._handler(job.chat_id, job.text)
+                self._counts["completed"] += 1
+                ok = True
+            except Exception:
+                self._counts["failed"] += 1
+                log.exception("recme_job_failed", worker=worker_id, chat_id=job.chat_id)
+            finally:
+                # The cooldown starts (here and in the shared claim) before anyone waiting hears the outcome
+                await self._finish(job.chat_id)
+                self._running -= 1
+                self._inflight.pop(job.chat_id, None)
+                self._mark_finished(job.chat_id)
+                if not job.future.done():
+                    job.future.set_result(ok)
+                self._queue.task_done()
+
+    def _mark_finished(self, chat_id: int):
+        """Start `chat_id`'s cooldown, dropping the chats whose cooldown has run out."""
+        now = time.monotonic()
+        for expired in [c for c, t in self._last_finished.items() if now - t >= self._cooldown]:
+            del self._last_finished[expired]
+        self._last_finished[chat_id] = now
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def running(self) -> int:
+        return self._running
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+        def pct(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+        return {
+            "workers": self._workers,
+            "queue_depth": self.queue_depth(),
+            "queue_capacity": self._max_queue,
+            "running": self._running,
+            "wait_seconds": {
+                "count": len(waits),
+                "avg": (sum(waits) / len(waits)) if waits else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "max": waits[-1] if waits else 0.0,
+            },
+            **self._counts,
+        }
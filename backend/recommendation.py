@@ -0,0 +1,186 @@
+import asyncio
+import json
+from collections import deque
+
+from langchain_core.messages import SystemMessage, HumanMessage
+from backend import database, metrics, logs
+from backend.data_storage import format_history_from_db, generate_rag_response
+from backend.llm_gateway import invoke_llm
+from backend.providers import get_chat_model, get_search
+
+log = logs.get_logger(__name__)
+
+# Per-run stage durations (seconds), newest last; read by benchmarks/load_test.py
+stage_timings = deque(maxlen=10000)
+
+
+def _strip_code_fence(content):
+    # Clean up potential markdown code blocks
+    if content.startswith("```json"):
+        return content[7:-3]
+    if content.startswith("```"):
+        return content[3:-3]
+    return content
+
+
+async def generate_recommendation(chat_id, data, vectorstore):
+    """Run the @recme pipeline for a chat and return the bot reply text."""
+    timings = {}
+    try:
+        with metrics.span("recme.total", timings):
+            return await _run_pipeline(chat_id, data, vectorstore, timings)
+    finally:
+        stage_timings.append(timings)
+
+
+async def _run_pipeline(chat_id, data, vectorstore, timings):
+    # Fetch recent chat history (last 100 messages)
+    with metrics.span("recme.history", timings):
+        rows = await asyncio.to_thread(database.get_chat_messages, chat_id)
+        history_msgs = format_history_from_db(rows)
+
+    # RAG Retrieval
+    rag_info = ""
+    if vectorstore:
+        log.debug("recme_rag_query", chat_id=chat_id, query=logs.payload(data))
+        try:
+            with metrics.span("recme.rag", timings):
+                rag_response = await asyncio.to_thread(
+                    generate_rag_response,
+                    vectorstore,
+                    data,
+                    history_messages=history_msgs[-6:]
+                )
+            if "no relevant information" not in rag_response.lower():
+                rag_info = rag_response
+            log.info("recme_rag_done", chat_id=chat_id, relevant=bool(rag_info))
+        except Exception:
+            log.exception("recme_rag_failed", chat_id=chat_id)
+
+    # Build a concise summary using LLM without retrieval
+    llm = get_chat_model()
+
+    # Step 1: Identify Intent
+
+    # Inject RAG info into the system prompt for intent analysis
+    intent_system_content = (
+        "You are a helpful assistant. Analyze the conversation to identify the user's desired cuisine and location.\n"
+        "Return ONLY a JSON object with keys 'cuisine' and 'location'.\n"
+        "Example: {\"cuisine\": \"Chinese\", \"location\": \"Los Angeles\"}\n"
+        "If you cannot determine them, return {\"cuisine\": null, \"location\": null}."
+    )
+
+    if rag_info:
+        intent_system_content += f"\n\nAdditional Context from User Documents:\n{rag_info}\nUse this context to infer preferences if not explicitly stated in the chat."
+
+    system_intent = SystemMessage(content=intent_system_content)
+    prompt_intent = HumanMessage(content="Analyze this chat history.")
+
+    with metrics.span("recme.intent_llm", timings):
+        resp_intent = await asyncio.to_thread(invoke_llm, llm, [system_intent, *history_msgs[-40:], prompt_intent])
+    content_intent = (getattr(resp_intent, "content", "") or "").strip()
+    log.debug("recme_intent_response", chat_id=chat_id, response=logs.payload(content_intent))
+
+    content_intent = _strip_code_fence(content_intent)
+
+    try:
+        intent_data = json.loads(content_intent)
+    except:
+        log.warning("recme_intent_unparsed", chat_id=chat_id, response=logs.payload(content_intent))
+        intent_data = {"cuisine": None, "location": None}
+
+    cuisine = intent_data.get("cuisine")
+    location = intent_data.get("location")
+    log.info("recme_intent", chat_id=chat_id, cuisine=logs.payload(str(cuisine)), location=logs.payload(str(location)))
+
+    if not cuisine or not location:
+        return "I couldn't identify what you're looking for. Please specify cuisine and location."
+
+    # Step 2: Search Registered Restaurants
+    with metrics.span("recme.registered_search", timings):
+        registered = await asyncio.to_thread(database.search_registered_restaurants, cuisine, location)
+    log.info("recme_registered_found", chat_id=chat_id, restaurants=len(registered))
+
+    recommendations = []
+    # Add registered restaurants (already sorted by bid)
+    for r in registered:
+        recommendations.append({
+            "name": r["name"],
+            "website": r["website"],
+            "source": "sponsored"
+        })
+
+    # Step 3: Fill gaps with Web Search
+    if len(recommendations) < 5:
+        needed = 5 - len(recommendations)
+        search = get_search()
+        # Improved query: prioritize official sites but allow aggregators for discovery
+        query = f"official website {cuisine} restaurant {location}"
+        log.info("recme_web_search", chat_id=chat_id, needed=needed, query=logs.payload(query))
+        with metrics.span("recme.web_search", timings):
+            search_results = await asyncio.to_thread(search.run, query)
+        log.debug("recme_web_results", chat_id=chat_id, chars=len(search_results), results=logs.payload(search_results))
+
+        # Use LLM to parse search results
+        system_parse = SystemMessage(content=(
+            f"Extract exactly {needed} distinct real restaurants from the search results text.\n"
+            "Return ONLY a JSON array of objects with 'name' and 'website' keys.\n"
+            "For 'website', prioritize the official site. If not found, use a Yelp/TripAdvisor/OpenTable link from the results.\n"
+            "Ensure the restaurant matches the cuisine '{cuisine}'."
+        ))
+        prompt_parse = HumanMessage(content=f"Search Results Text: {search_results}")
+
+        with metrics.span("recme.parse_llm", timings):
+            resp_parse = await asyncio.to_thread(invoke_llm, llm, [system_parse, prompt_parse])
+        content_parse = (getattr(resp_parse, "content", "") or "").strip()
+        log.debug("recme_parse_response", chat_id=chat_id, response=logs.payload(content_parse))
+
+        content_parse = _strip_code_fence(content_parse)
+
+        try:
+            external_recs = json.loads(content_parse)
+            if isinstance(external_recs, list):
+                for r in external_recs:
+                    if len(recommendations) < 5:
+                        # Fallback for null website: Google Search link
+                        website = r.get("website")
+                        if not website:
+                            website = f"https://www.google.com/search?q={r.get('name')} {location} official website"
+
+                        recommendations.append({
+                            "name": r.get("name"),
+                            "website": website,
+                            "source": "organic"
+                        })
+        except Exception:
+            log.exception("recme_parse_failed", chat_id=chat_id, response=logs.payload(content_parse))
+
+    # Step 4: Format Response
+    return format_recommendations(cuisine, location, recommendations)
+
+
+def format_recommendations(cuisine, location, recommendations):
+    bot_text = f"Here are some {cuisine} recommendations in {location}:\n\n"
+
+    # Split into Sponsored and Organic
+    sponsored = [r for r in recommendations if r.get("source") == "sponsored"]
+    organic = [r for r in recommendations if r.get("source") == "organic"]
+
+    if sponsored:
+        bot_text += "**Top Recommended**\n"
+        for i, rec in enumerate(sponsored, 1):
+            website = rec.get('website', '')
+            if not website.startswith(('http://', 'https://')):
+                website = 'http://' + website
+            bot_text += f"{i}. **{rec['name']}**\n   [{rec['website']}]({website})\n"
+        bot_text += "\n"
+
+    if organic:
+        bot_text += "**Other Recommended**\n"
+        for i, rec in enumerate(organic, 1):
+            website = rec.get('website', '')
+            if not website.startswith(('http://', 'https://')):
+                website = 'http://' + website
+            bot_text += f"{i}. **{rec['name']}**\n   [{rec['website']}]({website})\n"
+
+    return bot_text
@@ -0,0 +1,32 @@
+"""
+Tenant shard names of the vector index (see vector_store for the index itself).
+
+Kept apart from vector_store so request handlers can route and authorize uploads
+without importing FAISS, numpy and the embedding stack.
+"""
+import re
+from backend import database
+
+GLOBAL_SHARD = "global"
+SHARD_NAME = re.compile(r"^(global|user-\d+|chat-\d+)$")
+
+
+def shard_for(owner_user_id=None, chat_id=None):
+    """Shard a PDF's vectors live in: its chat if shared into one, else its owner, else global."""
+    if chat_id is not None:
+        return f"chat-{chat_id}"
+    if owner_user_id is not None:
+        return f"user-{owner_user_id}"
+    return GLOBAL_SHARD
+
+
+def shards_for_chat(chat_id):
+    """Shards a chat's retrieval may search: the global corpus, the chat's PDFs and its members' own."""
+    members = database.get_chat_members(chat_id)
+    return [GLOBAL_SHARD, shard_for(chat_id=chat_id)] + [shard_for(owner_user_id=m["id"]) for m in members]
+
+
+def shards_for_user(user_id):
+    """Shards whose PDFs a user can list and delete."""
+    chats = database.get_user_chats(user_id)
+    return [GLOBAL_SHARD, shard_for(owner_user_id=user_id)] + [shard_for(chat_id=c["id"]) for c in chats]
@@ -0,0 +1,1112 @@
+"""
+Tenant-sharded FAISS indexes with per-PDF vector bookkeeping and append-only persistence.
+
+Every PDF belongs to one shard, named after its tenant (see shards.shard_for):
+
+    global        PDFs uploaded without a user (the original shared corpus)
+    user-<id>     a user's personal PDFs, visible in every chat they are a member of
+    chat-<id>     PDFs shared into one chat, visible to that chat only
+
+Each shard is a VectorStore in its own directory under the index path. A chat's
+retrieval embeds the query once, searches only the shards it can see (in parallel)
+and merges their top-k, so its latency depends on its own data, not the corpus.
+Query embeddings and merged results are kept in in-memory LRUs; result keys include
+each searched shard's version, which every upload, deletion and compaction bumps.
+
+On disk each shard is a set of immutable segments plus a manifest:
+
+    manifest.json        {"version", "dim", "embedding_model", "index_type", "metric", "next_id",
+                          "next_segment", "segments": [{"name", "count"}]}
+    seg-000001.faiss     IndexIDMap2 over a flat / HNSW / IVF-PQ / SQfp16 index (int64 ids)
+    seg-000001.texts     chunk texts, UTF-8, concatenated
+    seg-000001.docs.npy  one (id, offset, length, pdf_id, owner_id, chat_id) record per vector, sorted by id
+    seg-000001.lex.npz   BM25 inverted index of the segment's chunks (see lexical_index)
+
+Each upload writes one new delta segment and then swaps the manifest in with an
+atomic rename, so the cost of an upload does not depend on corpus size and a crash
+leaves the previous manifest (and every segment it names) intact. Segment files a
+manifest does not reference are leftovers from an interrupted write and are removed
+on load. compact() merges all segments into a single base, dropping tombstoned
+vectors, off the request path.
+
+Several worker processes (serve.py) may share one index directory. Writers hold an
+advisory lock on <shard>/.lock and re-read the manifest before changing it; readers
+notice a replaced manifest with one stat() per search and pick up the new segments
+and tombstones (deletions rewrite the manifest too, so they are seen the same way).
+
+load() only reads the manifest; segments are opened on first use. In the default
+"mmap" load mode the FAISS vectors, texts and records are memory-mapped read-only,
+so startup is fast and uvicorn workers share the pages through the OS cache.
+
+Delta segments are always exact flat indexes; the base segment written by compaction
+(or by rebuild_index.py) uses the manifest's index_type. Every type except "flat"
+stores unit-normalized vectors under inner product; scores are converted back to the
+equivalent squared L2 distance (2 - 2 * ip), so callers see one scale throughout.
+
+hybrid_search_with_score() is the retrieval entry point: it checks the query's terms
+against the shards' lexicons first, skipping the embedding call and dense search
+altogether when none occurs, and otherwise fuses the FAISS and BM25 rankings.
+
+Vectors added for a PDF get ids "pdf<pdf_id>:<faiss id>", recorded in pdf_vectors
+with their shard (faiss ids are only unique within a shard). Deleting a PDF tombstones
+its rows: those vectors are filtered out of searches at once and physically dropped
+by the next compaction.
+"""
+import os
+import re
+import json
+import mmap
+import shutil
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import faiss
+from langchain_core.documents import Document
+from backend import database, metrics, logs
+from backend.embedding_cache import _FileLock
+from backend.lexical_index import (
+    LEXICAL_PREFILTER, LEXICAL_FUSION, LEXICAL_MIN_SCORE, Lexicon, CorpusStats, bm25, query_terms, reciprocal_rank_fusion,
+)
+from backend.providers import get_embeddings, embedding_model_name
+from backend.shards import GLOBAL_SHARD, SHARD_NAME, shard_for, shards_for_chat, shards_for_user  # noqa: F401 (re-exported)
+
+log = logs.get_logger(__name__)
+
+VECTOR_COMPACT_INTERVAL_SECONDS = float(os.getenv("VECTOR_COMPACT_INTERVAL_SECONDS", "60"))
+# Compact once this many delta segments have accumulated on top of the base
+VECTOR_MAX_DELTAS = int(os.getenv("VECTOR_MAX_DELTAS", "8"))
+# "mmap": map segments read-only and share them between processes; "memory": read them into RAM
+VECTOR_INDEX_LOAD = os.getenv("VECTOR_INDEX_LOAD", "mmap")
+
+# Index type for new indexes: flat (exact L2), flat_ip, hnsw, ivfpq or sq16; see build_index()
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "80"))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64"))
+VECTOR_IVF_NLIST = int(os.getenv("VECTOR_IVF_NLIST", "0"))  # 0: 4 * sqrt(vectors)
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+VECTOR_PQ_M = int(os.getenv("VECTOR_PQ_M", "64"))  # sub-quantizers of 8 bits each
+# Threads searching a chat's shards concurrently (FAISS releases the GIL while searching)
+VECTOR_SEARCH_THREADS = int(os.getenv("VECTOR_SEARCH_THREADS", "4"))
+# In-memory LRU sizes for query embeddings and search results (0 disables either)
+VECTOR_QUERY_CACHE_SIZE = int(os.getenv("VECTOR_QUERY_CACHE_SIZE", "1024"))
+VECTOR_RESULT_CACHE_SIZE = int(os.getenv("VECTOR_RESULT_CACHE_SIZE", "1024"))
+
+INDEX_TYPES = ("flat", "flat_ip", "hnsw", "ivfpq", "sq16")
+MANIFEST = "manifest.json"
+_SEGMENT_FILE = re.compile(r"^(seg-\d+)\.(faiss|texts|docs\.npy|docs\.jsonl|lex\.npz)$")
+_DOC_DTYPE = np.dtype([
+    ("id", "<i8"), ("offset", "<i8"), ("length", "<i4"),
+    ("pdf_id", "<i8"), ("owner_id", "<i8"), ("chat_id", "<i8"),
+])
+# Chunk metadata stored in the records; -1 means unset
+_DOC_FIELDS = (("pdf_id", "pdf_id"), ("owner_id", "owner_user_id"), ("chat_id", "chat_id"))
+# IO_FLAG_MMAP_IFC maps flat vector codes straight from the file (faiss >= 1.10)
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+DENSE_SKIPPED = metrics.counter(
+    "foodchat_retrieval_dense_skipped_total",
+    "Retrievals answered by the lexical pre-filter without embedding the query",
+)
+
+
+class EmbeddingModelMismatch(ValueError):
+    """The index was built with a different embedding model than the one configured."""
+
+    def __init__(self, path, recorded, current):
+        super().__init__(
+            f"Vector index at '{path}' was built with embedding model '{recorded}', "
+            f"but '{current}' is configured. Switch back or delete the index and re-upload the PDFs."
+        )
+
+
+def check_embedding_model(path):
+    """
+    Raise EmbeddingModelMismatch if an index under `path` (any shard, or an index saved
+    before sharding) was built with another embedding model than the configured one.
+    Only the manifests are read, so startup can refuse a mismatched index at once.
+    """
+    current = embedding_model_name()
+    candidates = [path]
+    if os.path.isdir(path):
+        candidates += [os.path.join(path, name) for name in sorted(os.listdir(path)) if SHARD_NAME.match(name)]
+    for directory in candidates:
+        try:
+            with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+                recorded = json.load(f).get("embedding_model")
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if recorded is not None and recorded != current:
+            raise EmbeddingModelMismatch(directory, recorded, current)
+
+
+def _fsync_replace(tmp, path):
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def metric_for(index_type):
+    return "l2" if index_type == "flat" else "ip"
+
+
+def _ivf_nlist(count):
+    return VECTOR_IVF_NLIST or max(1, int(4 * count ** 0.5))
+
+
+def _pq_m(dim):
+    # Largest sub-quantizer count <= VECTOR_PQ_M that divides the dimension
+    return next(m for m in range(min(VECTOR_PQ_M, dim), 0, -1) if dim % m == 0)
+
+
+def effective_index_type(index_type, count):
+    """IVF-PQ needs enough vectors to train its coarse and product quantizers; below that use sq16."""
+    if index_type == "ivfpq" and count < max(256 * 39, _ivf_nlist(count) * 39):
+        return "sq16"
+    return index_type
+
+
+def build_index(index_type, dim, train_vectors=None):
+    """
+    Empty IDMap2-wrapped index of `index_type` (trained on `train_vectors` if it needs it):
+        flat     exact L2 (the original behaviour)
+        flat_ip  exact inner product on normalized vectors
+        hnsw     HNSW graph over full vectors
+        ivfpq    inverted lists + product quantization (~VECTOR_PQ_M bytes per vector)
+        sq16     float16 scalar quantization (half the memory of flat)
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+    metric = faiss.METRIC_L2 if metric_for(index_type) == "l2" else faiss.METRIC_INNER_PRODUCT
+    count = len(train_vectors) if train_vectors is not None else 0
+    factory = {
+        "flat": "Flat",
+        "flat_ip": "Flat",
+        "hnsw": f"HNSW{VECTOR_HNSW_M}",
+        "ivfpq": f"IVF{_ivf_nlist(count)},PQ{_pq_m(dim)}",
+        "sq16": "SQfp16",
+    }[index_type]
+    index = faiss.index_factory(dim, f"IDMap2,{factory}", metric)
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = VECTOR_HNSW_EF_CONSTRUCTION
+    if not index.is_trained:
+        index.train(np.asarray(train_vectors, dtype=np.float32))
+    return index
+
+
+def index_type_of(index):
+    """Index type name (see build_index) of an IDMap2-wrapped index."""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(inner) is not None:
+        return "ivfpq"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq16"
+    return "flat" if index.metric_type == faiss.METRIC_L2 else "flat_ip"
+
+
+def tune_for_search(index):
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = VECTOR_HNSW_EF_SEARCH
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        ivf.nprobe = VECTOR_IVF_NPROBE
+
+
+def _normalized(vectors):
+    vectors = np.array(vectors, dtype=np.float32)
+    if len(vectors):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def normalize_query(text):
+    """Cache key for a query: Unicode-normalized, case-folded, whitespace collapsed."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+
+class LRUCache:
+    """Thread-safe LRU map; lookups are counted in foodchat_cache_requests_total under `name`."""
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+        if self.maxsize > 0:
+            metrics.record_cache(self.name, value is not None)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+def _vector_id(pdf_id, faiss_id):
+    return f"pdf{pdf_id}:{faiss_id}"
+
+
+def _faiss_id(vector_id):
+    try:
+        return int(vector_id.rsplit(":", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+
+class Segment:
+    """An immutable FAISS index plus the chunk texts and metadata of its vectors, opened lazily."""
+
+    def __init__(self, directory, name, count):
+        self.directory = directory
+        self.name = name
+        self.ntotal = count
+        self._index = None
+        self._docs = None
+        self._texts = None
+        self._lexicon = None
+        self._open_lock = threading.Lock()
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, f"{self.name}{suffix}")
+
+    @classmethod
+    def write(cls, directory, name, dim, ids, vectors, docs, index_type="flat", index=None):
+        """
+        Write a segment's files (fsynced) and return it; the manifest is updated separately.
+        `ids` must be ascending; `docs` maps each id to (text, metadata). A prebuilt
+        `index` already holding `ids` is written as is.
+        """
+        segment = cls(directory, name, len(ids))
+        if index is None:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if metric_for(index_type) == "ip":
+                vectors = _normalized(vectors)
+            index = build_index(index_type, dim, vectors)
+            if len(ids):
+                index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+        faiss.write_index(index, segment._path(".faiss.tmp"))
+        _fsync_replace(segment._path(".faiss.tmp"), segment._path(".faiss"))
+
+        records = np.zeros(len(ids), dtype=_DOC_DTYPE)
+        offset = 0
+        with open(segment._path(".texts.tmp"), "wb") as f:
+            for row, faiss_id in enumerate(ids):
+                text, metadata = docs[int(faiss_id)]
+                data = text.encode("utf-8")
+                f.write(data)
+                values = [metadata.get(key) for _, key in _DOC_FIELDS]
+                records[row] = (faiss_id, offset, len(data), *(-1 if v is None else v for v in values))
+                offset += len(data)
+        _fsync_replace(segment._path(".texts.tmp"), segment._path(".texts"))
+        with open(segment._path(".docs.tmp"), "wb") as f:
+            np.save(f, records)
+        _fsync_replace(segment._path(".docs.tmp"), segment._path(".docs.npy"))
+        segment._write_lexicon(Lexicon.build(ids, [docs[int(i)][0] for i in ids]))
+        return segment
+
+    def _write_lexicon(self, lexicon):
+        with open(self._path(".lex.tmp"), "wb") as f:
+            lexicon.save(f)
+        _fsync_replace(self._path(".lex.tmp"), self._path(".lex.npz"))
+        self._lexicon = lexicon
+
+    def open(self):
+        """Map (or read) the segment's files; idempotent and safe to call from many threads."""
+        if self._index is not None:
+            return self
+        with self._open_lock:
+            if self._index is None:
+                mapped = VECTOR_INDEX_LOAD == "mmap"
+                self._docs = np.load(self._path(".docs.npy"), mmap_mode="r" if mapped else None)
+                with open(self._path(".texts"), "rb") as f:
+                    if not mapped:
+                        self._texts = f.read()
+                    elif os.fstat(f.fileno()).st_size:
+                        self._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    else:
+                        self._texts = b""
+                index = faiss.read_index(self._path(".faiss"), _MMAP_FLAGS if mapped else 0)
+                tune_for_search(index)
+                self._index = index
+        return self
+
+    @property
+    def index(self):
+        return self.open()._index
+
+    def doc(self, faiss_id):
+        """(text, metadata) of a vector in this segment."""
+        docs = self.open()._docs
+        record = docs[int(np.searchsorted(docs["id"], faiss_id))]
+        offset, length = int(record["offset"]), int(record["length"])
+        text = bytes(self._texts[offset:offset + length]).decode("utf-8")
+        # Segments written before owner/chat metadata only carry pdf_id
+        metadata = {}
+        for field, key in _DOC_FIELDS:
+            if field in docs.dtype.names and int(record[field]) >= 0:
+                metadata[key] = int(record[field])
+        return text, metadata
+
+    def has_lexicon(self):
+        return self._lexicon is not None or os.path.exists(self._path(".lex.npz"))
+
+    def build_lexicon(self):
+        """Lexicon of the segment's stored texts (segments written before lexicons existed)."""
+        docs = self.open()._docs
+        ids = np.asarray(docs["id"], dtype=np.int64)
+        return Lexicon.build(ids, [self.doc(int(i))[0] for i in ids])
+
+    def lexicon(self):
+        """The segment's BM25 lexicon. Written with the segment, or at load under the shard's file lock."""
+        if self._lexicon is not None:
+            return self._lexicon
+        with self._open_lock:
+            if self._lexicon is None and os.path.exists(self._path(".lex.npz")):
+                self._lexicon = Lexicon.load(self._path(".lex.npz"))
+        if self._lexicon is None:
+            # Its sidecar is written by whichever worker loads the shard next; only kept in memory here
+            self._lexicon = self.build_lexicon()
+        return self._lexicon
+
+    def ids(self):
+        return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+
+    def vectors(self):
+        """
+        (ids, float32 matrix) of every vector in the segment. The matrix is None for
+        product-quantized segments, whose reconstruction is too lossy to re-index.
+        """
+        index = self.index
+        ids = self.ids()
+        if not len(ids):
+            return ids, np.zeros((0, index.d), dtype=np.float32)
+        if faiss.try_extract_index_ivf(faiss.downcast_index(index.index)) is not None:
+            return ids, None
+        return ids, index.index.reconstruct_n(0, index.ntotal)
+
+    def search(self, query, k):
+        """(squared L2 distance, id) pairs; inner-product scores are mapped to 2 - 2 * ip."""
+        k = min(k, self.ntotal)
+        if k <= 0:
+            return []
+        index = self.index
+        scores, ids = index.search(query, k)
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            scores = 2.0 - 2.0 * scores
+        return [(float(d), int(i)) for d, i in zip(scores[0], ids[0]) if i != -1]
+
+    def remove_files(self):
+        # Open mappings stay valid after unlink, so in-flight searches are unaffected
+        for suffix in (".faiss", ".texts", ".docs.npy", ".lex.npz"):
+            try:
+                os.unlink(self._path(suffix))
+            except FileNotFoundError:
+                pass
+
+
+class VectorStore:
+    """One shard's segmented index; see ShardedVectorStore for routing and scoped search."""
+
+    def __init__(self, path, shard=GLOBAL_SHARD):
+        self.path = path
+        self.shard = shard
+        self._embeddings = get_embeddings()
+        # Guards the segment list, manifest and tombstones; searches only hold it to take a snapshot
+        self._lock = threading.Lock()
+        # One compaction at a time; uploads keep appending while it runs
+        self._compact_lock = threading.Lock()
+        self._segments: list[Segment] = []
+        self._manifest = {
+            "version": 0,
+            "dim": None,
+            "embedding_model": embedding_model_name(),
+            "index_type": VECTOR_INDEX_TYPE,
+            "metric": metric_for(VECTOR_INDEX_TYPE),
+            "next_id": 0,
+            "next_segment": 1,
+            "segments": [],
+        }
+        self._dead_ids = frozenset()
+        # (inode, mtime, size) of the manifest last read or written; see refresh()
+        self._manifest_stamp = None
+
+    # --- Persistence ---
+
+    def _file_lock(self):
+        """Cross-process writer lock of this shard (uploads and compaction in other workers)."""
+        os.makedirs(self.path, exist_ok=True)
+        return _FileLock(os.path.join(self.path, ".lock"))
+
+    def _stamp(self):
+        try:
+            st = os.stat(os.path.join(self.path, MANIFEST))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def load(self):
+        """
+        Read the manifest (migrating older formats) and the tombstones.
+        Segment files are not opened until the first search.
+        """
+        # The file lock keeps orphan cleanup away from a segment another worker is writing
+        with self._file_lock(), self._lock:
+            manifest_path = os.path.join(self.path, MANIFEST)
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+                # Indexes written before index types were configurable are flat L2
+                self._manifest.setdefault("index_type", "flat")
+                self._manifest.setdefault("metric", "l2")
+                self._check_embedding_model()
+                if any(isinstance(entry, str) for entry in self._manifest["segments"]):
+                    self._upgrade_jsonl_segments()
+                self._segments = [Segment(self.path, e["name"], e["count"]) for e in self._manifest["segments"]]
+                self._remove_orphans()
+                self._write_missing_lexicons()
+            elif os.path.exists(os.path.join(self.path, "index.faiss")):
+                self._migrate_langchain_index()
+            self._manifest_stamp = self._stamp()
+            self._load_tombstones()
+        return self
+
+    def _write_missing_lexicons(self):
+        """Build the lexicons of segments written before lexicons existed; the caller holds the file lock."""
+        for segment in self._segments:
+            if not segment.has_lexicon():
+                segment._write_lexicon(segment.build_lexicon())
+                log.info("lexicon_built", shard=self.shard, segment=segment.name)
+
+    def refresh(self):
+        """Pick up segments and tombstones another worker process wrote since the last read (one stat() if none)."""
+        if self._stamp() == self._manifest_stamp:
+            return
+        with self._lock:
+            self._reread_manifest()
+
+    def _reread_manifest(self):
+        # Caller holds self._lock
+        stamp = self._stamp()
+        if stamp is None or stamp == self._manifest_stamp:
+            return
+        with open(os.path.join(self.path, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest.setdefault("index_type", "flat")
+        manifest.setdefault("metric", "l2")
+        manifest.setdefault("embedding_model", self._manifest.get("embedding_model"))
+        # Keep already opened segments (and their mappings)
+        opened = {s.name: s for s in self._segments}
+        self._manifest = manifest
+        self._segments = [opened.get(e["name"]) or Segment(self.path, e["name"], e["count"]) for e in manifest["segments"]]
+        self._manifest_stamp = stamp
+        self._load_tombstones()
+
+    def _check_embedding_model(self):
+        """Refuse an index whose vectors came from another model; older manifests adopt the current one."""
+        current = embedding_model_name()
+        recorded = self._manifest.setdefault("embedding_model", current)
+        if recorded != current:
+            raise EmbeddingModelMismatch(self.path, recorded, current)
+
+    def _write_manifest(self):
+        self._manifest["version"] += 1
+        self._manifest["segments"] = [{"name": s.name, "count": s.ntotal} for s in self._segments]
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f)
+        _fsync_replace(path + ".tmp", path)
+        self._manifest_stamp = self._stamp()
+
+    def _remove_orphans(self):
+        # A base another worker is still compacting into is not an orphan yet
+        live = {s.name for s in self._segments} | {self._manifest.get("compacting")}
+        for filename in os.listdir(self.path):
+            match = _SEGMENT_FILE.match(filename)
+            if (match and match.group(1) not in live) or filename.endswith(".tmp"):
+                os.unlink(os.path.join(self.path, filename))
+
+    def _next_segment_name(self):
+        name = f"seg-{self._manifest['next_segment']:06d}"
+        self._manifest["next_segment"] += 1
+        return name
+
+    def _migrate_langchain_index(self):
+        """One-time conversion of a FAISS.save_local directory into a base segment."""
+        from langchain_community.vectorstores import FAISS
+
+        legacy = FAISS.load_local(self.path, self._embeddings, allow_dangerous_deserialization=True)
+        vectors = legacy.index.reconstruct_n(0, legacy.index.ntotal)
+        ids, docs, vector_rows = [], {}, {}
+        for row, docstore_id in sorted(legacy.index_to_docstore_id.items()):
+            doc = legacy.docstore.search(docstore_id)
+            faiss_id = len(ids)
+            ids.append(faiss_id)
+            docs[faiss_id] = (doc.page_content, dict(doc.metadata or {}))
+            pdf_id = (doc.metadata or {}).get("pdf_id")
+            if pdf_id is not None:
+                vector_rows.setdefault(pdf_id, []).append(_vector_id(pdf_id, faiss_id))
+
+        self._manifest["dim"] = legacy.index.d
+        self._manifest["next_id"] = len(ids)
+        base_type = effective_index_type(self._manifest["index_type"], len(ids))
+        base = Segment.write(self.path, self._next_segment_name(), legacy.index.d, ids, vectors, docs, base_type)
+        self._segments = [base]
+        for pdf_id, vector_ids in vector_rows.items():
+            # Vectors of PDFs deleted before the migration stay tombstoned
+            deleted = 1 if database.get_pdf(pdf_id) is None else 0
+            database.replace_pdf_vectors(pdf_id, vector_ids, deleted, self.shard)
+        self._write_manifest()
+        for filename in ("index.faiss", "index.pkl"):
+            os.unlink(os.path.join(self.path, filename))
+        log.info("vectorstore_migrated", path=self.path, vectors=len(ids))
+
+    def _upgrade_jsonl_segments(self):
+        """Rewrite segments saved with a JSONL docs file into the mmap-able texts/records format."""
+        self._segments = []
+        for entry in self._manifest["segments"]:
+            name = entry if isinstance(entry, str) else entry["name"]
+            jsonl_path = os.path.join(self.path, f"{name}.docs.jsonl")
+            if not os.path.exists(jsonl_path):
+                self._segments.append(Segment(self.path, name, entry["count"]))
+                continue
+            index = faiss.read_index(os.path.join(self.path, f"{name}.faiss"))
+            ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+            vectors = index.index.reconstruct_n(0, index.ntotal) if len(ids) else np.zeros((0, index.d), dtype=np.float32)
+            docs = {}
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    docs[row["id"]] = (row["text"], row.get("metadata") or {})
+            order = np.argsort(ids)
+            self._segments.append(Segment.write(self.path, name, index.d, ids[order], vectors[order], docs))
+            os.unlink(jsonl_path)
+        self._write_manifest()
+        log.info("vectorstore_segments_upgraded", path=self.path, segments=len(self._segments))
+
+    def _load_tombstones(self):
+        ids = (_faiss_id(vector_id) for vector_id, _ in database.get_tombstoned_vectors(self.shard))
+        self._dead_ids = frozenset(i for i in ids if i is not None)
+
+    # --- Mutations ---
+
+    @property
+    def version(self):
+        """
+        The manifest version: every upload, deletion and compaction, in any worker process,
+        writes a new one. Up to date after refresh().
+        """
+        with self._lock:
+            return self._manifest["version"]
+
+    def __len__(self):
+        """Live (non-tombstoned) vectors."""
+        with self._lock:
+            total = sum(s.ntotal for s in self._segments)
+            return max(0, total - len(self._dead_ids))
+
+    def add(self, pdf_id, text_embeddings, metadata=None, replace=True):
+        """
+        Append a PDF's (text, vector) pairs as a new delta segment; `metadata` is stored with
+        every chunk. With `replace`, vectors an earlier attempt added for the PDF are
+        tombstoned; ingestion adds later windows of the same PDF with replace=False.
+        """
+        if not text_embeddings:
+            return []
+        vectors = np.asarray([vec for _, vec in text_embeddings], dtype=np.float32)
+        with self._file_lock(), self._lock:
+            # Ids and segment names continue from whatever another worker added last
+            self._reread_manifest()
+            dim = self._manifest["dim"] or vectors.shape[1]
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dim {vectors.shape[1]} does not match index dim {dim}")
+            start = self._manifest["next_id"]
+            ids = list(range(start, start + len(text_embeddings)))
+            chunk_metadata = {**(metadata or {}), "pdf_id": pdf_id}
+            docs = {i: (text, chunk_metadata) for i, (text, _) in zip(ids, text_embeddings)}
+            segment = Segment.write(self.path, self._next_segment_name(), dim, ids, vectors, docs, self._delta_type())
+
+            if replace:
+                # A resumed job replaces whatever an earlier attempt added for this PDF
+                database.tombstone_pdf_vectors(pdf_id)
+            vector_ids = [_vector_id(pdf_id, i) for i in ids]
+            database.add_pdf_vectors(pdf_id, vector_ids, self.shard)
+
+            self._manifest["dim"] = dim
+            self._manifest["next_id"] = start + len(ids)
+            self._segments.append(segment)
+            self._write_manifest()
+            if database.get_pdf(pdf_id) is None:
+                # Deleted while it was being ingested
+                database.tombstone_pdf_vectors(pdf_id)
+            self._load_tombstones()
+        log.info("vectorstore_added", shard=self.shard, pdf_id=pdf_id, chunks=len(ids), segment=segment.name)
+        return vector_ids
+
+    def delete_pdf(self, pdf_id):
+        """Tombstone a PDF's vectors; they stop matching at once and are removed by compact()."""
+        with self._file_lock(), self._lock:
+            self._reread_manifest()
+            count = database.tombstone_pdf_vectors(pdf_id)
+            if count:
+                # A new manifest version tells other workers to reload the tombstones
+                self._write_manifest()
+            self._load_tombstones()
+        return count
+
+    def needs_compaction(self):
+        with self._lock:
+            return len(self._segments) > VECTOR_MAX_DELTAS or bool(self._dead_ids)
+
+    def _delta_type(self):
+        return "flat" if self._manifest["metric"] == "l2" else "flat_ip"
+
+    def _segment_contents(self, segment, dead=frozenset()):
+        """(ids, vectors, docs) of a segment's live vectors; PQ segments are re-embedded from text."""
+        ids, vectors = segment.vectors()
+        keep = np.array([int(i) not in dead for i in ids], dtype=bool)
+        ids = ids[keep]
+        docs = {int(i): segment.doc(int(i)) for i in ids}
+        if vectors is None:
+            # Served from the embedding cache, so this normally makes no provider calls
+            vectors = np.asarray(self._embeddings.embed_documents([docs[int(i)][0] for i in ids]), dtype=np.float32)
+            vectors = vectors.reshape(len(ids), segment.index.d)
+        else:
+            vectors = vectors[keep]
+        return ids, vectors, docs
+
+    def live_vectors(self):
+        """float32 matrix of every live vector (for benchmarks and offline tools)."""
+        with self._lock:
+            segments = list(self._segments)
+            dead = self._dead_ids
+            dim = self._manifest["dim"] or 1
+        parts = [self._segment_contents(segment, dead)[1] for segment in segments]
+        return np.concatenate(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+
+    def compact(self, index_type=None):
+        """
+        Merge all segments into one base without tombstoned vectors; returns vectors dropped.
+        The base uses the manifest's index type, or `index_type` to switch types (rebuild).
+        """
+        with self._compact_lock:
+            with self._file_lock(), self._lock:
+                self._reread_manifest()
+                segments = list(self._segments)
+                rows = database.get_tombstoned_vectors(self.shard)
+                dim = self._manifest["dim"]
+                target = index_type or self._manifest["index_type"]
+                if not index_type and len(segments) <= 1 and not rows:
+                    return 0
+                name = self._next_segment_name()
+                # Reserve the name against uploads and orphan cleanup in other workers
+                self._manifest["compacting"] = name
+                self._write_manifest()
+            dead = {_faiss_id(vector_id) for vector_id, _ in rows}
+
+            # The merge reads immutable segments, so searches and uploads continue meanwhile
+            total = sum(s.ntotal for s in segments)
+            if (
+                not index_type
+                and len(segments) > 1
+                and index_type_of(segments[0].index) == effective_index_type(target, total)
+                and not np.isin(segments[0].ids(), list(dead)).any()
+            ):
+                base = self._append_to_base(name, segments, dead)
+                return self._swap_in(base, segments, rows, target, total - base.ntotal)
+
+            all_ids, all_vectors, docs = [], [], {}
+            for segment in segments:
+                ids, vectors, segment_docs = self._segment_contents(segment, dead)
+                all_ids.append(ids)
+                all_vectors.append(vectors)
+                docs.update(segment_docs)
+            ids = np.concatenate(all_ids) if all_ids else np.zeros(0, dtype=np.int64)
+            vectors = np.concatenate(all_vectors) if all_vectors else np.zeros((0, dim or 1), dtype=np.float32)
+            dropped = sum(s.ntotal for s in segments) - len(ids)
+            base_type = effective_index_type(target, len(ids))
+            base = Segment.write(self.path, name, dim, ids, vectors, docs, base_type) if dim else None
+
+            return self._swap_in(base, segments, rows, target, dropped)
+
+    def _append_to_base(self, name, segments, dead):
+        """
+        Add the deltas' live vectors to a writable copy of the base index instead of
+        rebuilding it, so trained (IVF-PQ) and graph (HNSW) bases are not rebuilt per merge.
+        """
+        base = segments[0]
+        index = faiss.read_index(base._path(".faiss"))
+        docs = {int(i): base.doc(int(i)) for i in base.ids()}
+        ids = [base.ids()]
+        for segment in segments[1:]:
+            seg_ids, seg_vectors, seg_docs = self._segment_contents(segment, dead)
+            if len(seg_ids):
+                if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                    seg_vectors = _normalized(seg_vectors)
+                index.add_with_ids(np.asarray(seg_vectors, dtype=np.float32), seg_ids)
+            ids.append(seg_ids)
+            docs.update(seg_docs)
+        ids = np.concatenate(ids)
+        return Segment.write(self.path, name, index.d, ids, None, docs, index=index)
+
+    def _swap_in(self, base, segments, rows, target, dropped):
+        """Replace `segments` with `base` in the manifest, keeping deltas appended meanwhile."""
+        with self._file_lock(), self._lock:
+            self._reread_manifest()
+            dim = self._manifest["dim"]
+            merged = {s.name for s in segments}
+            newer = [s for s in self._segments if s.name not in merged]
+            if metric_for(target) != self._manifest["metric"]:
+                # Switching metric: rewrite those deltas to match the new base
+                self._manifest["metric"] = metric_for(target)
+                rewritten = []
+                for segment in newer:
+                    seg_ids, seg_vectors, seg_docs = self._segment_contents(segment)
+                    rewritten.append(Segment.write(self.path, self._next_segment_name(), dim, seg_ids, seg_vectors, seg_docs, self._delta_type()))
+                    segments.append(segment)
+                newer = rewritten
+            self._manifest["index_type"] = target
+            self._manifest.pop("compacting", None)
+            self._segments = ([base] if base is not None else []) + newer
+            self._write_manifest()
+            database.purge_pdf_vectors([vector_id for vector_id, _ in rows], self.shard)
+            self._load_tombstones()
+        for segment in segments:
+            segment.remove_files()
+        log.info("vectorstore_compacted", shard=self.shard, segments=len(segments), removed=dropped)
+        return dropped
+
+    # --- Search ---
+
+    def similarity_search_with_score(self, query, k=4):
+        """(Document, squared L2 distance) pairs, nearest first, across all segments."""
+        return self.search_by_vector(self._embeddings.embed_query(query), k)
+
+    def search_by_vector(self, embedding, k=4):
+        """Like similarity_search_with_score for an already embedded query."""
+        embedding = np.asarray([embedding], dtype=np.float32)
+        # Segments are immutable, so only the snapshot is taken under the lock
+        with self._lock:
+            if self._manifest["dim"] is not None and embedding.shape[1] != self._manifest["dim"]:
+                raise ValueError(f"Query dim {embedding.shape[1]} does not match index dim {self._manifest['dim']}")
+            segments = list(self._segments)
+            dead = self._dead_ids
+            if self._manifest["metric"] == "ip":
+                embedding = _normalized(embedding)
+        # Over-fetch by the number of tombstones so k live results survive the filter
+        fetch = k + len(dead)
+        hits = []
+        for segment in segments:
+            for distance, faiss_id in segment.search(embedding, fetch):
+                if faiss_id not in dead:
+                    hits.append((distance, faiss_id, segment))
+        hits.sort(key=lambda hit: hit[0])
+        results = []
+        for distance, faiss_id, segment in hits[:k]:
+            text, metadata = segment.doc(faiss_id)
+            results.append((Document(page_content=text, metadata=metadata), distance))
+        return results
+
+    def lexical_stats(self, terms):
+        """BM25 collection statistics of this shard for query `terms` (no segment is memory-mapped for it)."""
+        with self._lock:
+            segments = list(self._segments)
+            dead = self._dead_ids
+        stats = CorpusStats(docs=max(0, sum(s.ntotal for s in segments) - len(dead)))
+        for segment in segments:
+            lexicon = segment.lexicon()
+            stats.total_length += lexicon.total_length
+            for term in terms:
+                stats.df[term] += lexicon.df(term)
+        return stats
+
+    def lexical_search(self, terms, k, stats):
+        """(Document, BM25 score) pairs, best first; `stats` covers every shard being searched."""
+        with self._lock:
+            segments = list(self._segments)
+            dead = self._dead_ids
+        avg_length = stats.avg_length()
+        scores = {}
+        for segment in segments:
+            lexicon = segment.lexicon()
+            for term in terms:
+                if not stats.df[term]:
+                    continue
+                ids, tfs, lengths = lexicon.postings(term)
+                weights = bm25(tfs, lengths, stats.idf(term), avg_length)
+                for faiss_id, weight in zip(ids.tolist(), weights.tolist()):
+                    if faiss_id not in dead:
+                        key = (segment, faiss_id)
+                        scores[key] = scores.get(key, 0.0) + weight
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        results = []
+        for (segment, faiss_id), score in best:
+            text, metadata = segment.doc(faiss_id)
+            results.append((Document(page_content=text, metadata=metadata), score))
+        return results
+
+
+class ShardedVectorStore:
+    """
+    Per-tenant VectorStores under one directory (<path>/<shard>/), created on first upload.
+    Uploads are routed to their PDF's shard; scoped() gives a chat a view over the shards it can see.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._embeddings = get_embeddings()
+        self._lock = threading.Lock()
+        self._shards: dict[str, VectorStore] = {}
+        self._pool = None
+        self._query_embeddings = LRUCache("query_embedding", VECTOR_QUERY_CACHE_SIZE)
+        self._results = LRUCache("retrieval", VECTOR_RESULT_CACHE_SIZE)
+
+    def load(self):
+        """Open every shard directory (manifests and tombstones only; segments load on first search)."""
+        with self._lock:
+            self._move_unsharded_index()
+            shards = {}
+            if os.path.isdir(self.path):
+                for name in sorted(os.listdir(self.path)):
+                    if SHARD_NAME.match(name) and os.path.isdir(os.path.join(self.path, name)):
+                        shards[name] = VectorStore(os.path.join(self.path, name), name).load()
+            self._shards = shards
+        self._results.clear()
+        return self
+
+    def _move_unsharded_index(self):
+        """An index saved before sharding lives directly in the index path; it becomes the global shard."""
+        if not os.path.isdir(self.path):
+            return
+        legacy = [
+            f for f in os.listdir(self.path)
+            if f in (MANIFEST, "index.faiss", "index.pkl") or _SEGMENT_FILE.match(f)
+        ]
+        if not legacy:
+            return
+        target = os.path.join(self.path, GLOBAL_SHARD)
+        os.makedirs(target, exist_ok=True)
+        # The files load() keys on move last, so an interrupted move is simply redone
+        for filename in sorted(legacy, key=lambda f: f in (MANIFEST, "index.faiss")):
+            shutil.move(os.path.join(self.path, filename), os.path.join(target, filename))
+        log.info("vectorstore_sharded", path=self.path, shard=GLOBAL_SHARD)
+
+    def shard(self, name, create=False):
+        """The VectorStore of shard `name` (None if it has no index yet, unless `create`)."""
+        with self._lock:
+            store = self._shards.get(name)
+            if store is None and create:
+                if not SHARD_NAME.match(name):
+                    raise ValueError(f"Invalid shard name '{name}'")
+                store = VectorStore(os.path.join(self.path, name), name).load()
+                self._shards[name] = store
+            return store
+
+    def shard_names(self):
+        with self._lock:
+            return list(self._shards)
+
+    def _stores(self, shards=None):
+        """Loaded stores of `shards` (default: all), refreshed with other workers' changes."""
+        if shards is None:
+            names = self._shard_dirs()
+        else:
+            names = list(dict.fromkeys(shards))
+        with self._lock:
+            missing = [name for name in names if name not in self._shards]
+        for name in missing:
+            # Created by another worker since load()
+            if os.path.exists(os.path.join(self.path, name, MANIFEST)):
+                self.shard(name, create=True)
+        with self._lock:
+            stores = [self._shards[name] for name in names if name in self._shards]
+        for store in stores:
+            store.refresh()
+        return stores
+
+    def _shard_dirs(self):
+        with self._lock:
+            names = list(self._shards)
+        if os.path.isdir(self.path):
+            names += [n for n in sorted(os.listdir(self.path)) if SHARD_NAME.match(n) and n not in names]
+        return names
+
+    def __len__(self):
+        return sum(len(store) for store in self._stores())
+
+    # --- Mutations ---
+
+    def add(self, pdf_id, text_embeddings, replace=True):
+        """Add a PDF's (text, vector) pairs to its tenant's shard, tagging chunks with owner and chat."""
+        pdf = database.get_pdf(pdf_id)
+        if pdf is None:
+            # Deleted while it was being ingested
+            return []
+        metadata = {key: pdf[key] for key in ("owner_user_id", "chat_id") if pdf[key] is not None}
+        return self.shard(pdf["shard"], create=True).add(pdf_id, text_embeddings, metadata, replace)
+
+    def delete_pdf(self, pdf_id):
+        """Tombstone a PDF's vectors in whichever shard holds them."""
+        removed = 0
+        for store in self._stores(database.get_pdf_vector_shards(pdf_id)):
+            removed += store.delete_pdf(pdf_id)
+        return removed
+
+    def needs_compaction(self):
+        return any(store.needs_compaction() for store in self._stores())
+
+    def compact(self, index_type=None):
+        """Compact every shard that needs it (all of them when switching `index_type`)."""
+        dropped = 0
+        for store in self._stores():
+            if index_type or store.needs_compaction():
+                dropped += store.compact(index_type=index_type)
+        return dropped
+
+    def live_vectors(self):
+        parts = [store.live_vectors() for store in self._stores()]
+        parts = [p for p in parts if len(p)]
+        return np.concatenate(parts) if parts else np.zeros((0, 1), dtype=np.float32)
+
+    # --- Search ---
+
+    def close(self):
+        """Stop the search threads (server shutdown)."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=VECTOR_SEARCH_THREADS, thread_name_prefix="vector-search")
+            return self._pool
+
+    def embed_query(self, query):
+        """Query embedding, served from the LRU for repeated (normalized) queries."""
+        key = normalize_query(query)
+        embedding = self._query_embeddings.get(key)
+        if embedding is None:
+            embedding = self._embeddings.embed_query(query)
+            self._query_embeddings.put(key, embedding)
+        return embedding
+
+    def similarity_search_with_score(self, query, k=4, shards=None):
+        """
+        (Document, distance) pairs, nearest first, over `shards` (default: every shard).
+        The query is embedded once; shards are searched in parallel and their top-k merged.
+        Results are cached per (query, k, shard versions), so any upload, deletion or
+        compaction in a searched shard makes its cached results unreachable.
+        """
+        stores = [store for store in self._stores(shards) if len(store)]
+        if not stores:
+            return []
+        key = (normalize_query(query), k, tuple((store.shard, store.version) for store in stores))
+        cached = self._results.get(key)
+        if cached is not None:
+            return list(cached)
+        embedding = self.embed_query(query)
+        if len(stores) == 1:
+            hits = stores[0].search_by_vector(embedding, k)
+        else:
+            parts = self._executor().map(lambda store: store.search_by_vector(embedding, k), stores)
+            hits = [hit for part in parts for hit in part]
+            hits.sort(key=lambda hit: hit[1])
+            hits = hits[:k]
+        self._results.put(key, tuple(hits))
+        return hits
+
+    def hybrid_search_with_score(self, query, k=4, shards=None):
+        """
+        Retrieval for RAG: (Document, distance) pairs, best first, over `shards`.
+
+        A query with no term in the searched shards' lexicons returns [] without
+        embedding it (LEXICAL_PREFILTER). Otherwise the FAISS top-k and the BM25 top-k
+        are merged by reciprocal rank fusion (LEXICAL_FUSION). Chunks only BM25 found
+        carry a distance of None. They are kept only when their BM25 score reaches
+        LEXICAL_MIN_SCORE of the query's best possible score, so sharing one common
+        term with the question is not enough.
+        """
+        if not (LEXICAL_PREFILTER or LEXICAL_FUSION):
+            return self.similarity_search_with_score(query, k, shards)
+        stores = [store for store in self._stores(shards) if len(store)]
+        if not stores:
+            return []
+        terms = query_terms(query)
+        stats = CorpusStats()
+        for store in stores:
+            stats.merge(store.lexical_stats(terms))
+        if not stats.matches():
+            if LEXICAL_PREFILTER:
+                DENSE_SKIPPED.inc()
+                return []
+            return self.similarity_search_with_score(query, k, shards)
+
+        dense = self.similarity_search_with_score(query, k, shards)
+        if not LEXICAL_FUSION:
+            return dense
+        lexical = [hit for store in stores for hit in store.lexical_search(terms, k, stats)]
+        lexical.sort(key=lambda hit: -hit[1])
+
+        def key(doc):
+            return doc.metadata.get("pdf_id"), doc.page_content
+
+        docs, distances = {}, {}
+        for doc, distance in dense:
+            docs.setdefault(key(doc), doc)
+            distances.setdefault(key(doc), distance)
+        floor = LEXICAL_MIN_SCORE * stats.max_score(terms)
+        weak = set()
+        for doc, score in lexical[:k]:
+            docs.setdefault(key(doc), doc)
+            if score < floor:
+                weak.add(key(doc))
+        order = reciprocal_rank_fusion([[key(doc) for doc, _ in dense], [key(doc) for doc, _ in lexical[:k]]])
+        # A weak lexical match still lifts a dense hit's rank, but does not stand on its own
+        order = [item for item in order if item in distances or item not in weak]
+        return [(docs[item], distances.get(item)) for item in order[:k]]
+
+    def scoped(self, chat_id):
+        """Read-only view over the shards chat `chat_id` can see (queries the chat's members)."""
+        return ScopedVectorStore(self, shards_for_chat(chat_id))
+
+
+class ScopedVectorStore:
+    """The shards one chat may retrieve from, with the VectorStore search interface."""
+
+    def __init__(self, store, shards):
+        self.store = store
+        self.shards = shards
+
+    def __len__(self):
+        return sum(len(s) for s in self.store._stores(self.shards))
+
+    def similarity_search_with_score(self, query, k=4):
+        return self.store.similarity_search_with_score(query, k, shards=self.shards)
+
+    def hybrid_search_with_score(self, query, k=4):
+        return self.store.hybrid_search_with_score(query, k, shards=self.shards)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Chunk count, embedding volume and retrieval recall: character splitter vs token chunker.
+
+Chunks the same text with the original RecursiveCharacterTextSplitter (1500/500
+characters) and with backend.chunking, then reports per chunker:
+
+    chunks       number of chunks
+    tokens       tokens embedded (the embedding bill), and as a multiple of the text's own tokens
+    max tok      largest chunk in tokens
+    $/doc        embedding cost at --price (USD per 1M tokens)
+    recall@k     share of questions whose answer sentence is intact in one of the top-k chunks
+
+The default corpus is a synthetic cookbook (titles, ingredient tables, directions) with
+one question per recipe fact; --pdf uses real PDFs and questions made from their own
+sentences with every third word dropped. Embeddings come from EMBEDDINGS_PROVIDER
+(`hashed` runs offline).
+
+    EMBEDDINGS_PROVIDER=hashed python benchmarks/chunking.py --recipes 200
+    python benchmarks/chunking.py --pdf backend/pdfs/cookbook.pdf --k 4
+"""
+import argparse
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+
+DISHES = ["carbonara", "risotto", "paella", "ramen", "pho", "tacos", "curry", "lasagna", "gnocchi", "bibimbap",
+          "goulash", "moussaka", "ratatouille", "shakshuka", "biryani", "tagine", "pierogi", "empanadas"]
+INGREDIENTS = ["flour", "butter", "garlic", "onion", "tomato", "rice", "egg", "milk", "basil", "cumin",
+               "paprika", "ginger", "lemon", "chicken", "beef", "tofu", "spinach", "mushroom"]
+
+
+def synthetic_cookbook(recipes, seed):
+    """(text, [(question, answer sentence)]) for a cookbook of `recipes` recipes."""
+    rng = random.Random(seed)
+    parts, questions = [], []
+    for r in range(recipes):
+        dish = f"{rng.choice(DISHES)} {r}"
+        temp, minutes, serves = rng.randrange(150, 260, 10), rng.randrange(10, 90, 5), rng.randrange(2, 9)
+        filler = " ".join(
+            f"This {dish} pairs well with {rng.choice(INGREDIENTS)} and a glass of wine on a {rng.choice(['cold', 'warm', 'rainy'])} evening."
+            for _ in range(rng.randrange(3, 9))
+        )
+        bake = f"Bake the {dish} at {temp} degrees for {minutes} minutes until golden."
+        rows = "\n".join(f"{rng.choice(INGREDIENTS)} | {rng.randrange(1, 500)} g | {rng.choice(['fresh', 'dried', 'chopped'])}" for _ in range(rng.randrange(4, 12)))
+        parts.append(
+            f"{dish.title()} Recipe\n{filler}\n\nIngredients:\nIngredient | Amount | Notes\n{rows}\n\n"
+            f"Directions\nPrepare everything before you start. {filler} {bake} Rest before serving.\n\nServes {serves}\n"
+        )
+        questions.append((f"At what temperature and for how long do you bake the {dish}?", bake))
+    return "\n\n".join(parts), questions
+
+
+def pdf_corpus(paths, count, seed):
+    from backend.pdf_utilities import get_pdf_text, clean_text
+
+    text = clean_text(get_pdf_text(paths))
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if len(s.split()) >= 10 and "\n" not in s.strip()]
+    rng = random.Random(seed)
+    picked = rng.sample(sentences, min(count, len(sentences)))
+    return text, [(" ".join(w for i, w in enumerate(s.split()) if i % 3 != 2), s) for s in picked]
+
+
+def recall(chunks, questions, k, embeddings):
+    vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    queries = np.asarray([embeddings.embed_query(q) for q, _ in questions], dtype=np.float32)
+    faiss.normalize_L2(queries)
+    _, found = index.search(queries, k)
+    squash = lambda s: " ".join(s.split())
+    hits = sum(any(squash(answer) in squash(chunks[i]) for i in row if i >= 0) for (_, answer), row in zip(questions, found))
+    return hits / len(questions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", help="Chunk these PDFs instead of the synthetic cookbook")
+    parser.add_argument("--recipes", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=200, help="Questions sampled from --pdf text")
+    parser.add_argument("--chunk-tokens", type=int, default=None, help="Token chunk size (default CHUNK_TOKENS)")
+    parser.add_argument("--overlap-tokens", type=int, default=None, help="Token overlap (default CHUNK_OVERLAP_TOKENS)")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--price", type=float, default=0.13, help="USD per 1M embedding tokens (text-embedding-3-large)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from backend.chunking import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, chunk_text
+    from backend.data_storage import _splitter
+    from backend.llm_gateway import count_tokens, token_encoding
+    from backend.providers import get_embeddings, embedding_model_name
+
+    if args.pdf:
+        text, questions = pdf_corpus(args.pdf, args.questions, args.seed)
+    else:
+        text, questions = synthetic_cookbook(args.recipes, args.seed)
+    chunk_tokens = args.chunk_tokens or CHUNK_TOKENS
+    overlap = CHUNK_OVERLAP_TOKENS if args.overlap_tokens is None else args.overlap_tokens
+    text_tokens = count_tokens(text)
+    embeddings = get_embeddings()
+    print(f"{text_tokens} tokens of text, {len(questions)} questions, k={args.k}, embeddings {embedding_model_name()}")
+    if token_encoding() is None:
+        print("tiktoken unavailable: token counts are approximate")
+    print()
+
+    chunkers = (
+        ("chars 1500/500", lambda: _splitter(1500, 500).split_text(text)),
+        (f"tokens {chunk_tokens}/{overlap}", lambda: chunk_text(text, chunk_tokens, overlap)),
+    )
+    header = f"{'chunker':<18} {'chunks':>7} {'tokens':>9} {'x text':>7} {'max tok':>8} {'$/doc':>9} {'recall@k':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, split in chunkers:
+        chunks = split()
+        counts = [count_tokens(c) for c in chunks]
+        total = sum(counts)
+        print(
+            f"{name:<18} {len(chunks):>7} {total:>9} {total / text_tokens:>7.2f} {max(counts):>8} "
+            f"{total * args.price / 1e6:>9.5f} {recall(chunks, questions, args.k, embeddings):>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
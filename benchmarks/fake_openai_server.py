@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Minimal OpenAI-compatible server for exercising the model gateway offline.
+
+Serves POST /v1/chat/completions and POST /v1/embeddings with configurable
+latency, its own requests-per-minute limit (answered with 429 + Retry-After),
+random 5xx errors, and latency that grows once more than --capacity requests
+are in flight.
+
+    python benchmarks/fake_openai_server.py --port 8089 --rpm 120
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake python start_backend.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIState:
+    def __init__(self, rpm, latency_ms, capacity, error_rate, dim):
+        self.rpm = rpm
+        self.latency = latency_ms / 1000.0
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.window = []  # request timestamps in the last minute
+        self.in_flight = 0
+        self.counts = {"ok": 0, "rate_limited": 0, "errors": 0}
+
+    def admit(self):
+        """Returns seconds to wait before retrying, or None if admitted."""
+        now = time.monotonic()
+        with self.lock:
+            self.window = [t for t in self.window if now - t < 60.0]
+            if self.rpm and len(self.window) >= self.rpm:
+                self.counts["rate_limited"] += 1
+                return max(0.1, 60.0 - (now - self.window[0]))
+            self.window.append(now)
+            self.in_flight += 1
+            return None
+
+    def done(self, ok):
+        with self.lock:
+            self.in_flight -= 1
+            self.counts["ok" if ok else "errors"] += 1
+
+    def service_time(self):
+        # Overloaded servers slow down before they fail
+        overload = max(0, self.in_flight - self.capacity) / max(1, self.capacity)
+        return self.latency * (1 + overload) * random.uniform(0.8, 1.2)
+
+
+def fake_embedding(text, dim):
+    """Deterministic unit vector derived from the text's hash."""
+    values = []
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    while len(values) < dim:
+        seed = hashlib.sha256(seed).digest()
+        values.extend(v / 2147483648.0 for v in struct.unpack("<8i", seed))
+    values = values[:dim]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with state.lock:
+                    self._send(200, {**state.counts, "in_flight": state.in_flight})
+                return
+            self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", "0"))
+            body = json.loads(self.rfile.read(length) or b"{}")
+
+            retry_after = state.admit()
+            if retry_after is not None:
+                self._send(429, {"error": {
+                    "message": "Rate limit reached for requests",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }}, headers={"Retry-After": f"{retry_after:.1f}"})
+                return
+
+            ok = False
+            try:
+                time.sleep(state.service_time())
+                if random.random() < state.error_rate:
+                    self._send(500, {"error": {"message": "The server had an error", "type": "server_error"}})
+                    return
+                if self.path.endswith("/chat/completions"):
+                    self._send(200, self._chat(body))
+                elif self.path.endswith("/embeddings"):
+                    self._send(200, self._embeddings(body))
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                ok = True
+            finally:
+                state.done(ok)
+
+        def _chat(self, body):
+            messages = body.get("messages") or []
+            system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+            if "'cuisine' and 'location'" in system:
+                content = json.dumps({"cuisine": "Italian", "location": "San Francisco"})
+            elif "JSON array" in system:
+                content = json.dumps([{"name": f"Fake Trattoria {i}", "website": f"https://example.com/{i}"} for i in range(5)])
+            else:
+                content = "No relevant information found in documents."
+            prompt_tokens = sum(len(m.get("content") or "") // 4 + 1 for m in messages)
+            return {
+                "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4, "total_tokens": prompt_tokens + len(content) // 4},
+            }
+
+        def _embeddings(self, body):
+            inputs = body.get("input") or []
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            dim = int(body.get("dimensions") or state.dim)
+            as_base64 = body.get("encoding_format") == "base64"
+            data = []
+            for i, item in enumerate(inputs):
+                # langchain may send pre-tokenized input (lists of token ids)
+                text = item if isinstance(item, str) else " ".join(str(t) for t in item)
+                vector = fake_embedding(text, dim)
+                if as_base64:
+                    # The openai client asks for packed float32 by default
+                    vector = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+                data.append({"object": "embedding", "index": i, "embedding": vector})
+            return {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-large"),
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            }
+
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=8089, rpm=0, latency_ms=200, capacity=8, error_rate=0.0, dim=3072):
+    """Start the server on a daemon thread; returns (server, state)."""
+    state = FakeOpenAIState(rpm, latency_ms, capacity, error_rate, dim)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--capacity", type=int, default=8, help="In-flight requests before latency degrades")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    parser.add_argument("--dim", type=int, default=3072)
+    args = parser.parse_args()
+
+    server, _ = start_server(args.host, args.port, args.rpm, args.latency_ms, args.capacity, args.error_rate, args.dim)
+    print(f"Fake OpenAI API listening on http://{args.host}:{args.port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
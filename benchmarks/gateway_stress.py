@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Drive the model gateway against the fake OpenAI server.
+
+Runs a bulk embedding ingestion and a stream of interactive chat calls at the
+same time against a rate-limited fake provider, then reports per-priority
+latency and the gateway's 429/retry counters.
+
+    python benchmarks/gateway_stress.py --rpm 60 --chats 40 --embed-batches 40
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import start_server
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=60, help="Fake provider requests/minute before 429s")
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--capacity", type=int, default=4)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--chats", type=int, default=40, help="Interactive chat calls")
+    parser.add_argument("--chat-threads", type=int, default=8)
+    parser.add_argument("--embed-batches", type=int, default=40, help="Bulk embedding batches of 64 chunks")
+    parser.add_argument("--gateway-rpm", type=float, default=None, help="Gateway RPM (defaults to --rpm)")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    # The gateway reads its limits at import time
+    os.environ["LLM_RPM"] = str(args.gateway_rpm or args.rpm)
+
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from backend import llm_gateway
+
+    server, state = start_server(port=args.port, rpm=args.rpm, latency_ms=args.latency_ms,
+                                 capacity=args.capacity, error_rate=args.error_rate, dim=256)
+
+    llm = ChatOpenAI(model_name="gpt-4o", temperature=0, max_retries=0)
+    embeddings = llm_gateway.GatedEmbeddings(
+        OpenAIEmbeddings(model="text-embedding-3-large", dimensions=256, check_embedding_ctx_length=False, max_retries=0),
+        batch_size=64,
+    )
+
+    chat_latencies, embed_latencies, failures = [], [], []
+    lock = threading.Lock()
+
+    def chat_worker(n):
+        for i in range(n):
+            start = time.monotonic()
+            try:
+                llm_gateway.invoke_llm(llm, [
+                    SystemMessage(content="Return ONLY a JSON object with keys 'cuisine' and 'location'."),
+                    HumanMessage(content=f"ramen near downtown #{i}"),
+                ])
+                with lock:
+                    chat_latencies.append(time.monotonic() - start)
+            except Exception as e:
+                with lock:
+                    failures.append(("chat", repr(e)))
+
+    def embed_worker():
+        for b in range(args.embed_batches):
+            start = time.monotonic()
+            try:
+                embeddings.embed_documents([f"chunk {b}-{i} of a cookbook" for i in range(64)])
+                with lock:
+                    embed_latencies.append(time.monotonic() - start)
+            except Exception as e:
+                with lock:
+                    failures.append(("embed", repr(e)))
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=embed_worker)]
+    per_thread = max(1, args.chats // args.chat_threads)
+    threads += [threading.Thread(target=chat_worker, args=(per_thread,)) for _ in range(args.chat_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    server.shutdown()
+
+    print(f"Finished in {elapsed:.1f}s")
+    for name, values in (("interactive chat", chat_latencies), ("bulk embed batch", embed_latencies)):
+        print(f"  {name:18s} n={len(values):4d}  p50={percentile(values, 0.5):6.2f}s  "
+              f"p95={percentile(values, 0.95):6.2f}s  max={max(values, default=0):6.2f}s")
+    print(f"  failures: {len(failures)}")
+    for kind, err in failures[:5]:
+        print(f"    {kind}: {err}")
+    print(f"  gateway: {llm_gateway.gateway.stats()}")
+    print(f"  provider: {state.counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Recall vs. latency of the FAISS index types against the exact flat baseline.
+
+Builds every index type from backend.vector_store.build_index over the same
+vectors, runs single-query searches (as the RAG path does) and reports
+recall@k against exact search, per-query latency and bytes per vector.
+
+Vectors come from a saved index (--index-path, the live vectors of every
+shard) or are synthetic: unit-normalized points around --clusters centres,
+which behaves more like text embeddings than uniform noise.
+
+    python benchmarks/index_recall.py --n 100000 --dim 3072
+    python benchmarks/index_recall.py --index-path backend/faiss_index --types hnsw,sq16
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import faiss
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def synthetic_vectors(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def index_vectors(path):
+    from backend.vector_store import ShardedVectorStore
+
+    vectors = np.ascontiguousarray(ShardedVectorStore(path).load().live_vectors(), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=50000, help="Synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=3072)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--types", default="flat_ip,hnsw,ivfpq,sq16")
+    parser.add_argument("--index-path", help="Benchmark on the vectors of a saved index instead of synthetic data")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 mimics concurrent requests)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from backend.vector_store import build_index, effective_index_type, tune_for_search
+
+    faiss.omp_set_num_threads(args.threads)
+    if args.index_path:
+        data = index_vectors(args.index_path)
+    else:
+        data = synthetic_vectors(args.n + args.queries, args.dim, args.clusters, args.seed)
+    # Held-out queries: near the data distribution but not in the index
+    queries, base = data[:args.queries], data[args.queries:]
+    ids = np.arange(len(base), dtype=np.int64)
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {len(queries)} queries, k={args.k}\n")
+
+    # Exact baseline (inner product == L2 ranking on unit vectors)
+    exact = faiss.IndexFlatIP(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, args.k)
+
+    header = f"{'type':<10} {'built as':<10} {'build s':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'bytes/vec':>10}"
+    print(header)
+    print("-" * len(header))
+    for index_type in ["flat"] + [t for t in args.types.split(",") if t and t != "flat"]:
+        built_as = effective_index_type(index_type, len(base))
+        start = time.perf_counter()
+        index = build_index(built_as, base.shape[1], base)
+        index.add_with_ids(base, ids)
+        build_seconds = time.perf_counter() - start
+        tune_for_search(index)
+
+        latencies, hits = [], 0
+        for i in range(len(queries)):
+            start = time.perf_counter()
+            _, found = index.search(queries[i:i + 1], args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(found[0].tolist()) & set(truth[i].tolist()))
+        recall = hits / (len(queries) * args.k)
+        size = len(faiss.serialize_index(index)) / len(base)
+        print(
+            f"{index_type:<10} {built_as:<10} {build_seconds:>8.2f} {recall:>9.3f} "
+            f"{percentile(latencies, 0.50):>8.3f} {percentile(latencies, 0.95):>8.3f} {size:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
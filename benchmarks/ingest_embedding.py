@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Wall-clock time to embed one large PDF's chunks against the fake OpenAI server.
+
+Compares the old ingestion path (batches of 64 sent one after another) with
+embed_chunks: batches packed by token count, serially and with several in flight.
+
+    python benchmarks/ingest_embedding.py --chunks 2000 --latency-ms 400 --in-flight 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import start_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--chunk-words", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=400, help="Fake provider latency per request")
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--in-flight", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["EMBEDDINGS_PROVIDER"] = "openai"
+    # Every run must reach the provider
+    os.environ["EMBEDDING_CACHE_ENABLED"] = "0"
+
+    from backend.data_storage import embed_chunks
+    from backend.llm_gateway import pack_batches
+    from backend.providers import get_embeddings
+
+    start_server(port=args.port, rpm=0, latency_ms=args.latency_ms, capacity=args.capacity, error_rate=0.0)
+    chunks = [
+        " ".join(f"word{(c * 31 + w) % 5000}" for w in range(args.chunk_words))
+        for c in range(args.chunks)
+    ]
+    print(f"{len(chunks)} chunks, {len(pack_batches(chunks))} packed batches, {args.latency_ms:.0f} ms per request\n")
+
+    def serial_64():
+        embeddings = get_embeddings()
+        for i in range(0, len(chunks), 64):
+            embeddings.embed_documents(chunks[i:i + 64])
+
+    runs = (
+        ("serial, 64 per batch", serial_64),
+        ("packed, serial", lambda: embed_chunks(chunks, max_in_flight=1)),
+        (f"packed, {args.in_flight} in flight", lambda: embed_chunks(chunks, max_in_flight=args.in_flight)),
+    )
+    for name, run in runs:
+        start = time.perf_counter()
+        run()
+        print(f"{name:<24} {time.perf_counter() - start:>7.2f} s")
+
+
+if __name__ == "__main__":
+    main()
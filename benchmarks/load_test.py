@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for group chat websockets and @recme.
+
+Registers N users, creates M group chats, opens one websocket per member on
+/ws/{chat_id}, then replays a message trace at a fixed rate, turning a
+configurable fraction of messages into @recme triggers. By default the backend
+runs in-process on localhost with a throwaway database and the offline model
+stand-ins (LLM_PROVIDER=fake, EMBEDDINGS_PROVIDER=hashed, SEARCH_PROVIDER=fixture).
+
+Reports broadcast latency (send -> every member's socket), message throughput,
+@recme end-to-end latency and per-stage breakdown, and SQLite write-lock wait
+measured by a probe connection. Results can be saved as a baseline and later
+runs compared against it; a regression beyond --tolerance exits non-zero.
+
+    python benchmarks/load_test.py --users 40 --chats 10 --messages 2000 --rate 50 --recme-rate 0.02
+    python benchmarks/load_test.py --save-baseline benchmarks/baselines/load_test.json
+    python benchmarks/load_test.py --compare benchmarks/baselines/load_test.json
+
+Client and server share one process (and GIL) in the default mode; pass --url
+to drive a separately started server instead (stage timings are then skipped).
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NONCE_RE = re.compile(r"#lt(\d+)")
+DEFAULT_TRACE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces", "group_chat.jsonl")
+
+# (section, key) pairs checked against a baseline
+LOWER_IS_BETTER = [
+    ("broadcast_latency_ms", "p50"),
+    ("broadcast_latency_ms", "p95"),
+    ("broadcast_latency_ms", "p99"),
+    ("recme_latency_ms", "p50"),
+    ("recme_latency_ms", "p95"),
+    ("db_lock_wait_ms", "p95"),
+]
+HIGHER_IS_BETTER = [
+    ("throughput", "delivered_per_second"),
+]
+
+
+def summarize(values_s):
+    """Seconds in, milliseconds out."""
+    values = sorted(v * 1000.0 for v in values_s)
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+    return {"count": len(values), "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": round(values[-1], 3)}
+
+
+def http_json(base_url, method, path, body=None, token=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", f"Bearer {token}")
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        raw = resp.read()
+        return json.loads(raw) if raw else {}
+
+
+class LockProbe(threading.Thread):
+    """Repeatedly takes SQLite's write lock and records how long acquiring it took."""
+
+    def __init__(self, db_path, interval=0.05):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.waits = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+                start = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                self.waits.append(time.perf_counter() - start)
+                conn.execute("ROLLBACK")
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def start_in_process_server(port):
+    import uvicorn
+    from backend.backend import app
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_load(base_url, args, trace):
+    import websockets
+
+    rng = random.Random(args.seed)
+    suffix = f"{rng.randrange(16 ** 6):06x}"
+
+    # --- Setup: users, chats, memberships ---
+    users = []
+    for i in range(args.users):
+        email = f"lt{i}_{suffix}@example.com"
+        resp = await asyncio.to_thread(http_json, base_url, "POST", "/auth/register", {
+            "email": email, "username": f"lt{i}_{suffix}", "password": "load-test-password",
+        })
+        users.append({"email": email, "token": resp["access_token"]})
+
+    chats = []
+    for c in range(args.chats):
+        members = rng.sample(users, min(args.members_per_chat, len(users)))
+        owner = members[0]
+        resp = await asyncio.to_thread(http_json, base_url, "POST", "/chats", {"title": f"load chat {c}"}, owner["token"])
+        chat_id = resp["chat_id"]
+        if len(members) > 1:
+            await asyncio.to_thread(http_json, base_url, "POST", f"/chats/{chat_id}/invite",
+                                    {"emails": [m["email"] for m in members[1:]]}, owner["token"])
+        chats.append({"id": chat_id, "members": members})
+
+    # --- Websockets ---
+    ws_base = base_url.replace("http://", "ws://", 1).replace("https://", "wss://", 1)
+    sent = {}
+    broadcast_latencies = []
+    recme_pending = {}
+    recme_latencies = []
+    seen_bot = set()
+    delivered = 0
+
+    async def reader(ws, chat_id):
+        nonlocal delivered
+        try:
+            async for raw in ws:
+                now = time.perf_counter()
+                msg = json.loads(raw)
+                if msg.get("sender") == "bot":
+                    if msg.get("id") in seen_bot:
+                        continue
+                    seen_bot.add(msg.get("id"))
+                    for t in recme_pending.pop(chat_id, []):
+                        recme_latencies.append(now - t)
+                    continue
+                match = NONCE_RE.search(msg.get("content") or "")
+                if match and match.group(1) in sent:
+                    broadcast_latencies.append(now - sent[match.group(1)])
+                    delivered += 1
+        except websockets.ConnectionClosed:
+            pass
+
+    conns, readers = [], []
+    for chat in chats:
+        for member in chat["members"]:
+            ws = await websockets.connect(f"{ws_base}/ws/{chat['id']}?token={member['token']}", max_size=None)
+            conns.append((ws, chat))
+            readers.append(asyncio.create_task(reader(ws, chat["id"])))
+
+    # --- Replay (open loop: sends follow the schedule regardless of server speed) ---
+    expected = 0
+    triggers = 0
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    start = time.perf_counter()
+    for i in range(args.messages):
+        ws, chat = rng.choice(conns)
+        text = trace[i % len(trace)]
+        if rng.random() < args.recme_rate:
+            text += " @recme"
+            triggers += 1
+            recme_pending.setdefault(chat["id"], []).append(time.perf_counter())
+        nonce = str(i)
+        sent[nonce] = time.perf_counter()
+        await ws.send(f"{text} #lt{nonce}")
+        expected += len(chat["members"])
+        if interval:
+            await asyncio.sleep(max(0.0, start + (i + 1) * interval - time.perf_counter()))
+    send_elapsed = time.perf_counter() - start
+
+    deadline = time.perf_counter() + args.drain_timeout
+    while (delivered < expected or any(recme_pending.values())) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    total_elapsed = time.perf_counter() - start
+
+    for ws, _ in conns:
+        await ws.close()
+    for task in readers:
+        task.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    return {
+        "broadcast_latency_ms": summarize(broadcast_latencies),
+        "throughput": {
+            "messages_sent": args.messages,
+            "sent_per_second": round(args.messages / send_elapsed, 2) if send_elapsed else 0.0,
+            "deliveries_expected": expected,
+            "deliveries": delivered,
+            "delivered_per_second": round(delivered / total_elapsed, 2) if total_elapsed else 0.0,
+            "connections": len(conns),
+        },
+        "recme_latency_ms": {
+            **summarize(recme_latencies),
+            "triggers": triggers,
+            "unanswered": sum(len(v) for v in recme_pending.values()),
+        },
+    }
+
+
+def stage_breakdown():
+    from backend import recommendation
+
+    stages = {}
+    for run in list(recommendation.stage_timings):
+        for stage, seconds in run.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: summarize(values) for stage, values in sorted(stages.items())}
+
+
+def compare(result, baseline, tolerance):
+    regressions = []
+    for section, key in LOWER_IS_BETTER:
+        base = baseline.get(section, {}).get(key)
+        cur = result.get(section, {}).get(key)
+        # Ignore sub-millisecond jitter on tiny baselines
+        if base is not None and cur is not None and cur > base * (1 + tolerance) and cur - base > 1.0:
+            regressions.append(f"{section}.{key}: {cur} vs baseline {base}")
+    for section, key in HIGHER_IS_BETTER:
+        base = baseline.get(section, {}).get(key)
+        cur = result.get(section, {}).get(key)
+        if base is not None and cur is not None and cur < base * (1 - tolerance):
+            regressions.append(f"{section}.{key}: {cur} vs baseline {base}")
+    return regressions
+
+
+def print_report(result):
+    def row(name, stats):
+        print(f"  {name:24s} n={stats['count']:6d}  p50={stats['p50']:9.2f}ms  p95={stats['p95']:9.2f}ms  "
+              f"p99={stats['p99']:9.2f}ms  max={stats['max']:9.2f}ms")
+
+    tp = result["throughput"]
+    print("\n=== Load test results ===")
+    print(f"  connections={tp['connections']}  sent={tp['messages_sent']} ({tp['sent_per_second']}/s)  "
+          f"delivered={tp['deliveries']}/{tp['deliveries_expected']} ({tp['delivered_per_second']}/s)")
+    row("broadcast latency", result["broadcast_latency_ms"])
+    recme = result["recme_latency_ms"]
+    row("@recme end-to-end", recme)
+    print(f"  @recme triggers={recme['triggers']} unanswered={recme['unanswered']}")
+    for stage, stats in result.get("recme_stages_ms", {}).items():
+        row(f"  stage: {stage}", stats)
+    if "db_lock_wait_ms" in result:
+        row("db write-lock wait", result["db_lock_wait_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--members-per-chat", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=50.0, help="Messages per second across all chats (0 = as fast as possible)")
+    parser.add_argument("--recme-rate", type=float, default=0.02, help="Fraction of messages that trigger @recme")
+    parser.add_argument("--recme-cooldown", type=float, default=0.0, help="RECME_COOLDOWN_SECONDS for the in-process server")
+    parser.add_argument("--trace", default=DEFAULT_TRACE, help="JSON lines file with a 'text' field per message")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url", help="Drive an already running server instead of starting one in-process")
+    parser.add_argument("--db-path", help="SQLite file to probe for lock wait when using --url")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a saved baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs. baseline")
+    parser.add_argument("--verbose", action="store_true", help="Show backend log output during the run")
+    args = parser.parse_args()
+
+    with open(args.trace, "r", encoding="utf-8") as f:
+        trace = [json.loads(line)["text"] for line in f if line.strip()]
+
+    server = None
+    db_path = args.db_path
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        workdir = tempfile.mkdtemp(prefix="foodchat-load-")
+        db_path = os.path.join(workdir, "chatbot.db")
+        os.environ.update({
+            "CHATBOT_DB_PATH": db_path,
+            "FAISS_INDEX_PATH": os.path.join(workdir, "faiss_index"),
+            "RECME_COOLDOWN_SECONDS": str(args.recme_cooldown),
+            "LLM_RPM": "1000000",
+            "LLM_TPM": "1000000000",
+        })
+        for key, value in (("LLM_PROVIDER", "fake"), ("EMBEDDINGS_PROVIDER", "hashed"), ("SEARCH_PROVIDER", "fixture")):
+            os.environ.setdefault(key, value)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        if not args.url:
+            server, _ = start_in_process_server(args.port)
+        probe = LockProbe(db_path) if db_path else None
+        if probe:
+            probe.start()
+        result = asyncio.run(run_load(base_url, args, trace))
+        if probe:
+            probe.stop()
+            result["db_lock_wait_ms"] = summarize(probe.waits)
+        if server is not None:
+            result["recme_stages_ms"] = stage_breakdown()
+            server.should_exit = True
+
+    result["config"] = {k: getattr(args, k) for k in ("users", "chats", "members_per_chat", "messages", "rate", "recme_rate", "seed")}
+    result["config"]["in_process"] = server is not None
+    print_report(result)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != result["config"]:
+            print("\n[WARN] Baseline was recorded with a different configuration")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
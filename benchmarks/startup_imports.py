@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Import time of the backend app, with a budget.
+
+Imports backend.backend in fresh interpreters under `python -X importtime` (what
+every worker pays before it can serve, and what a cold dev restart pays) and
+reports the cumulative import time, the slowest imports, and whether any
+of the stacks that are meant to load lazily on first use came in eagerly:
+
+    faiss, numpy                    vector store (backend.vector_store)
+    pdfplumber, pytesseract, ...    PDF text and OCR (backend.pdf_utilities)
+    langchain_openai, ...           LLM and embedding clients (backend.providers)
+
+Exits non-zero when the median import time is over --budget-ms, when a lazy stack
+is imported eagerly, or (with --compare) when it regressed by more than --tolerance
+against a saved baseline. Runs offline with the model stand-ins.
+
+    python benchmarks/startup_imports.py --budget-ms 1500
+    python benchmarks/startup_imports.py --save-baseline benchmarks/baselines/startup_imports.json
+    python benchmarks/startup_imports.py --compare benchmarks/baselines/startup_imports.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULE = "backend.backend"
+# Loaded on first use, never by importing the app
+LAZY_MODULES = [
+    "faiss", "numpy", "pdfplumber", "pytesseract", "pdf2image", "PyPDF2",
+    "langchain_text_splitters", "langchain_openai", "langchain_community", "sentence_transformers",
+]
+OFFLINE_ENV = {"LLM_PROVIDER": "fake", "EMBEDDINGS_PROVIDER": "hashed", "SEARCH_PROVIDER": "fixture"}
+
+
+def measure(module):
+    """{module: (self µs, cumulative µs, nesting depth)} of one cold import."""
+    env = {**os.environ, **OFFLINE_ENV, "PYTHONDONTWRITEBYTECODE": "1"}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"[ERROR] import {module} failed:\n{proc.stderr[-2000:]}")
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules[name] = (int(own), int(cumulative), depth)
+    return modules
+
+
+def compare(result, baseline, tolerance):
+    base, cur = baseline.get("import_ms", {}).get("median"), result["import_ms"]["median"]
+    # Ignore jitter on small baselines
+    if base is not None and cur > base * (1 + tolerance) and cur - base > 20:
+        return [f"import_ms.median: {cur} vs baseline {base}"]
+    return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Cold imports to take the median of")
+    parser.add_argument("--budget-ms", type=float, default=1500, help="Fail when the median import takes longer (0: no budget)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    parser.add_argument("--save-baseline", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare against a saved baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression vs. baseline")
+    args = parser.parse_args()
+
+    # The first run also warms the OS file cache; it is not counted
+    measure(MODULE)
+    runs = [measure(MODULE) for _ in range(max(1, args.runs))]
+    totals = [modules[MODULE][1] / 1000 for modules in runs]
+    modules = runs[-1]
+    median = round(statistics.median(totals), 1)
+
+    print(f"import {MODULE}: median {median} ms over {len(totals)} runs (min {min(totals):.1f}, max {max(totals):.1f})")
+    print("\nSlowest imports (cumulative ms, last run):")
+    slowest = sorted(((c, n) for n, (_, c, d) in modules.items() if n != MODULE and d <= 2), reverse=True)[:args.top]
+    for cumulative, name in slowest:
+        print(f"  {cumulative / 1000:>8.1f}  {name}")
+
+    failures = []
+    eager = [m for m in LAZY_MODULES if m in modules]
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    if args.budget_ms and median > args.budget_ms:
+        failures.append(f"median {median} ms is over the {args.budget_ms:g} ms budget")
+
+    result = {
+        "import_ms": {"median": median, "min": round(min(totals), 1), "max": round(max(totals), 1)},
+        "eager": eager,
+        "config": {"module": MODULE, "python": sys.version.split()[0]},
+    }
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != result["config"]:
+            print("\n[WARN] Baseline was recorded with a different configuration")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            failures.extend(f"regressed beyond {args.tolerance:.0%}: {line}" for line in regressions)
+        else:
+            print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+    if failures:
+        print("\nFailed:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,8 +21,16 @@ interface Chat {
 interface PDF {
   id: number;
   filename: string;
+  status?: string;
+  chat_id?: number | null;
 }
 
+// Bearer header for the axios PDF calls (fetchWithAuth covers the rest)
+const authHeaders = (): Record<string, string> => {
+  const token = localStorage.getItem("token");
+  return token ? { Authorization: `Bearer ${token}` } : {};
+};
+
 interface User {
   id: number;
   email: string;
@@ -47,7 +55,9 @@ export default function ChatUI() {
   const [showMembers, setShowMembers] = useState(false);
   const [showCreateChatModal, setShowCreateChatModal] = useState(false);
   const [chatMembers, setChatMembers] = useState<User[]>([]);
-  const [allUsers, setAllUsers] = useState<User[]>([]);
+  const [inviteQuery, setInviteQuery] = useState("");
+  const [inviteResults, setInviteResults] = useState<User[]>([]);
+  const [inviteCursor, setInviteCursor] = useState<string | null>(null);
   const [notification, setNotification] = useState<string | null>(null);
   const [chatToDelete, setChatToDelete] = useState<Chat | null>(null);
   const [isRenaming, setIsRenaming] = useState(false);
@@ -148,7 +158,8 @@ export default function ChatUI() {
   const loadPdfs = async () => {
     try {
       const response = await axios.get<{ pdfs: PDF[] }>(
-        "http://localhost:8000/pdfs"
+        "http://localhost:8000/pdfs",
+        { headers: authHeaders() }
       );
       setUploadedPdfs(response.data.pdfs);
     } catch (error) {
@@ -167,14 +178,20 @@ export default function ChatUI() {
     }
   };
 
-  const loadAllUsers = async () => {
+  // Invite picker: one page of prefix matches at a time (cursor: next page, null when done)
+  const searchUsers = async (query: string, cursor: string | null = null) => {
     try {
-      const res = await fetchWithAuth("/users");
+      const params = new URLSearchParams({ q: query, limit: "20" });
+      if (cursor) params.set("cursor", cursor);
+      const res = await fetchWithAuth(`/users/search?${params}`);
       if (!res.ok) return;
       const data = await res.json();
-      setAllUsers(data || []);
+      setInviteResults((prev) =>
+        cursor ? [...prev, ...(data.users || [])] : data.users || []
+      );
+      setInviteCursor(data.next_cursor || null);
     } catch (e) {
-      console.error("Error loading users:", e);
+      console.error("Error searching users:", e);
     }
   };
 
@@ -339,6 +356,7 @@ export default function ChatUI() {
     } finally {
       setShowInvite(false);
       setSelectedInviteEmails([]);
+      setInviteQuery("");
     }
   };
 
@@ -462,6 +480,8 @@ export default function ChatUI() {
     setIsUploading(true);
     const formData = new FormData();
     formData.append("file", file);
+    // Shared into the open chat only; without one it is available in all of the user's chats
+    if (currentChatId) formData.append("chat_id", String(currentChatId));
 
     try {
       // Use axios directly for file upload to handle FormData correctly
@@ -472,11 +492,12 @@ export default function ChatUI() {
         {
           headers: {
             "Content-Type": "multipart/form-data",
+            ...authHeaders(),
           },
         }
       );
 
-      setNotification(`PDF "${file.name}" uploaded successfully!`);
+      setNotification(`PDF "${file.name}" uploaded, processing in background.`);
       // Refresh the list of PDFs
       loadPdfs();
     } catch (error) {
@@ -491,7 +512,9 @@ export default function ChatUI() {
 
   const deletePdf = async (pdfId: number) => {
     try {
-      await axios.delete(`http://localhost:8000/pdfs/${pdfId}`);
+      await axios.delete(`http://localhost:8000/pdfs/${pdfId}`, {
+        headers: authHeaders(),
+      });
       setNotification("PDF deleted successfully.");
       loadPdfs();
     } catch (error) {
@@ -504,9 +527,21 @@ export default function ChatUI() {
   useEffect(() => {
     loadPdfs();
     loadChats();
-    loadAllUsers();
   }, []);
 
+  // Search as the invite query is typed, once typing pauses
+  useEffect(() => {
+    const query = inviteQuery.trim();
+    if (!showInvite || !query) {
+      setInviteResults([]);
+      setInviteCursor(null);
+      return;
+    }
+    const timer = setTimeout(() => searchUsers(query), 200);
+    return () => clearTimeout(timer);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [inviteQuery, showInvite]);
+
   useEffect(() => {
     if (notification) {
       const timer = setTimeout(() => setNotification(null), 3000);
@@ -514,7 +549,7 @@ export default function ChatUI() {
     }
   }, [notification]);
 
-  const inviteOptions = allUsers.filter(
+  const inviteOptions = inviteResults.filter(
     (u) => !chatMembers.some((m) => m.email === u.email)
   );
 
@@ -761,7 +796,10 @@ export default function ChatUI() {
                 ) : (
                   uploadedPdfs.map((pdf) => (
                     <div key={pdf.id} className="pdf-item">
-                      <span className="pdf-name">📄 {pdf.filename}</span>
+                      <span className="pdf-name">
+                        📄 {pdf.filename}
+                        {pdf.status && pdf.status !== "processed" && ` (${pdf.status})`}
+                      </span>
                       <button
                         className="delete-pdf"
                         onClick={() => deletePdf(pdf.id)}
@@ -934,8 +972,24 @@ export default function ChatUI() {
           <div className="popup-container" style={{ width: 360 }}>
             <h3 style={{ marginTop: 0 }}>Invite users</h3>
             <p style={{ fontSize: "0.8rem", color: "#555" }}>
-              Select users to add to this chat.
+              Search by username or email, then select users to add to this
+              chat.
             </p>
+            <input
+              type="text"
+              placeholder="Username or email"
+              value={inviteQuery}
+              onChange={(e) => setInviteQuery(e.target.value)}
+              autoFocus
+              style={{
+                width: "100%",
+                boxSizing: "border-box",
+                padding: 10,
+                marginBottom: 8,
+                borderRadius: 8,
+                border: "1px solid #ccc",
+              }}
+            />
             <select
               multiple
               style={{
@@ -946,11 +1000,14 @@ export default function ChatUI() {
                 border: "1px solid #ccc",
               }}
               value={selectedInviteEmails}
-              onChange={(e) =>
-                setSelectedInviteEmails(
-                  Array.from(e.target.selectedOptions, (option) => option.value)
-                )
-              }
+              onChange={(e) => {
+                // Keep selections made under earlier queries
+                const shown = new Set(inviteOptions.map((u) => u.email));
+                setSelectedInviteEmails((prev) => [
+                  ...prev.filter((email) => !shown.has(email)),
+                  ...Array.from(e.target.selectedOptions, (option) => option.value),
+                ]);
+              }}
             >
               {inviteOptions.map((user) => (
                 <option key={user.id} value={user.email}>
@@ -958,6 +1015,20 @@ export default function ChatUI() {
                 </option>
               ))}
             </select>
+            {inviteCursor && (
+              <button
+                className="popup-button"
+                style={{ width: "100%", marginTop: 8, background: "#94a3b8" }}
+                onClick={() => searchUsers(inviteQuery.trim(), inviteCursor)}
+              >
+                More results
+              </button>
+            )}
+            {selectedInviteEmails.length > 0 && (
+              <p style={{ fontSize: "0.8rem", color: "#555" }}>
+                Selected: {selectedInviteEmails.join(", ")}
+              </p>
+            )}
             <div style={{ display: "flex", gap: 8, marginTop: 12 }}>
               <button
                 className="popup-button"
@@ -972,6 +1043,7 @@ export default function ChatUI() {
                 onClick={() => {
                   setShowInvite(false);
                   setSelectedInviteEmails([]);
+                  setInviteQuery("");
                 }}
               >
                 Cancel
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Rebuild the vector index offline with a different FAISS index type.
+
+Merges the segments of every shard into a new base of the requested type (training IVF-PQ on
+the stored vectors), drops vectors of deleted PDFs and records the type in the
+manifest, so later compactions keep it. Stop the backend before running this.
+
+    python rebuild_index.py --type hnsw
+    python rebuild_index.py --type ivfpq --nlist 4096 --pq-m 64
+    python rebuild_index.py --type flat      # back to exact L2
+"""
+import argparse
+import os
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--type", required=True, choices=["flat", "flat_ip", "hnsw", "ivfpq", "sq16"])
+    parser.add_argument("--path", default=os.getenv("FAISS_INDEX_PATH", os.path.join("backend", "faiss_index")))
+    parser.add_argument("--hnsw-m", type=int, help="HNSW neighbours per node (VECTOR_HNSW_M)")
+    parser.add_argument("--nlist", type=int, help="IVF lists (VECTOR_IVF_NLIST; default 4 * sqrt(vectors))")
+    parser.add_argument("--pq-m", type=int, help="PQ sub-quantizers (VECTOR_PQ_M)")
+    args = parser.parse_args()
+
+    # Build parameters are read when backend.vector_store is imported
+    for env, value in (("VECTOR_HNSW_M", args.hnsw_m), ("VECTOR_IVF_NLIST", args.nlist), ("VECTOR_PQ_M", args.pq_m)):
+        if value is not None:
+            os.environ[env] = str(value)
+
+    from backend import database
+    from backend.vector_store import ShardedVectorStore, effective_index_type
+
+    database.init_db()
+    store = ShardedVectorStore(args.path).load()
+    count = len(store)
+    if not count:
+        print(f"No vectors in '{args.path}'; nothing to rebuild.")
+        return
+    built = effective_index_type(args.type, count)
+    if built != args.type:
+        print(f"Only {count} vectors: too few to train {args.type}; the base will be {built} until compaction sees enough.")
+
+    print(f"Rebuilding {count} vectors in {len(store.shard_names())} shard(s) of '{args.path}' as {args.type}...")
+    start = time.perf_counter()
+    store.compact(index_type=args.type)
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
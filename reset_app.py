@@ -14,6 +14,10 @@ def reset_app():
     items_to_remove = [
         "backend/chatbot.db",
         "backend/faiss_index/",
+        "backend/uploads/",
+        "backend/ocr_cache/",
+        os.getenv("EMBEDDING_CACHE_DIR") or os.path.join(
+            os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "foodchat", "embeddings"),
         "backend/__pycache__/",
         # "frontend/node_modules/",
         "frontend/build/"
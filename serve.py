@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Production entry point for the FastAPI backend (start_backend.py is the dev launcher).
+
+Runs SERVE_WORKERS processes on uvloop and httptools. With gunicorn installed the app
+is imported and warmed (backend.backend.preload) once in the master, then forked, so
+workers share the imported code and read-only tables copy-on-write; without it
+uvicorn's own supervisor spawns the workers, each importing the app itself.
+
+Workers relay websocket broadcasts to each other through FANOUT_DIR (see
+backend/fanout.py), share the vector index through its file locks, and one of them
+(the holder of <index>/.maintenance.lock) runs compaction and resumes interrupted
+ingestion. @recme single-flight and cooldown are claimed in the database, so they hold
+across workers. The model gateway's rate limiter stays per process: each worker gets
+1/SERVE_WORKERS of LLM_RPM and LLM_TPM, which leaves an idle worker's share unused but
+never exceeds the budget.
+
+On SIGTERM a worker's /ready answers 503 at once. The worker keeps serving for
+SHUTDOWN_PRESTOP_SECONDS so load balancers can take it out of rotation. Then it stops
+accepting connections and waits up to SHUTDOWN_DRAIN_SECONDS for in-flight requests.
+After that it waits up to as long again for queued and running @recme and ingestion
+jobs.
+
+    python serve.py                       # SERVE_WORKERS (default: CPU count) on 0.0.0.0:8000
+    python serve.py --workers 4 --port 8080
+"""
+import argparse
+import os
+import tempfile
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))  # 0: one per CPU
+SERVE_LOOP = os.getenv("SERVE_LOOP", "uvloop")
+SERVE_HTTP = os.getenv("SERVE_HTTP", "httptools")
+SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "30"))
+SHUTDOWN_PRESTOP_SECONDS = float(os.getenv("SHUTDOWN_PRESTOP_SECONDS", "5"))
+
+APP = "backend.backend:app"
+
+
+def _configure_environment(workers):
+    """Settings the workers read at import time; set before the app is imported."""
+    if workers > 1 and not os.getenv("FANOUT_DIR"):
+        os.environ["FANOUT_DIR"] = tempfile.mkdtemp(prefix="foodchat-fanout-")
+    if not os.getenv("INGEST_WORKERS"):
+        # Every worker has its own extraction pool; together they should not exceed the CPUs
+        os.environ["INGEST_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+    # Every worker has its own model gateway; LLM_RPM / LLM_TPM are the deployment's budgets, so each gets a share
+    for name, default in (("LLM_RPM", "500"), ("LLM_TPM", "800000")):  # llm_gateway's defaults
+        os.environ[name] = str(float(os.getenv(name, default)) / workers)
+
+
+def _serve_gunicorn(host, port, workers):
+    from gunicorn.app.base import BaseApplication
+    try:
+        from uvicorn_worker import UvicornWorker
+    except ImportError:
+        from uvicorn.workers import UvicornWorker
+
+    class Worker(UvicornWorker):
+        CONFIG_KWARGS = {
+            **UvicornWorker.CONFIG_KWARGS,
+            "loop": SERVE_LOOP,
+            "http": SERVE_HTTP,
+            "timeout_graceful_shutdown": SHUTDOWN_DRAIN_SECONDS,
+        }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": Worker,
+                "preload_app": True,
+                # Pre-stop, then connections, then jobs, may each take their budget before SIGKILL
+                "graceful_timeout": int(SHUTDOWN_PRESTOP_SECONDS + 2 * SHUTDOWN_DRAIN_SECONDS) + 5,
+                "timeout": 120,
+                "keepalive": 5,
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from backend.backend import app, preload
+            preload()
+            return app
+
+    print(f"[STARTUP] gunicorn: {workers} workers ({SERVE_LOOP}/{SERVE_HTTP}) on {host}:{port}, app preloaded")
+    Application().run()
+
+
+def _serve_uvicorn(host, port, workers):
+    import uvicorn
+    from backend.backend import preload
+
+    # Workers are spawned, not forked, so only the migrations are done once here
+    preload()
+    print(f"[STARTUP] uvicorn: {workers} workers ({SERVE_LOOP}/{SERVE_HTTP}) on {host}:{port}")
+    uvicorn.run(
+        APP,
+        host=host,
+        port=port,
+        workers=workers,
+        loop=SERVE_LOOP,
+        http=SERVE_HTTP,
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_SECONDS,
+        proxy_headers=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS or os.cpu_count() or 1)
+    parser.add_argument("--no-gunicorn", action="store_true", help="Use uvicorn's supervisor even if gunicorn is installed")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    _configure_environment(workers)
+    try:
+        import gunicorn  # noqa: F401
+        use_gunicorn = not args.no_gunicorn
+    except ImportError:
+        use_gunicorn = False
+    if use_gunicorn:
+        _serve_gunicorn(args.host, args.port, workers)
+    else:
+        _serve_uvicorn(args.host, args.port, workers)
+
+
+if __name__ == "__main__":
+    main()
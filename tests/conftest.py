@@ -0,0 +1,37 @@
+"""
+Shared test setup: offline model/search providers and throwaway state directories.
+
+The environment is set before any backend module is imported, since the backend reads
+its settings at import time.
+"""
+import os
+import tempfile
+
+_STATE = tempfile.mkdtemp(prefix="foodchat-tests-")
+os.environ.update({
+    "LLM_PROVIDER": "fake",
+    "EMBEDDINGS_PROVIDER": "hashed",
+    "SEARCH_PROVIDER": "fixture",
+    "FAKE_LLM_LATENCY_MS": "0",
+    "FAKE_SEARCH_LATENCY_MS": "0",
+    "CHATBOT_DB_PATH": os.path.join(_STATE, "chatbot.db"),
+    "FAISS_INDEX_PATH": os.path.join(_STATE, "faiss_index"),
+    "UPLOAD_DIR": os.path.join(_STATE, "uploads"),
+    "OCR_CACHE_DIR": os.path.join(_STATE, "ocr_cache"),
+    "EMBEDDING_CACHE_DIR": os.path.join(_STATE, "embedding_cache"),
+    "FANOUT_DIR": "",
+    "SHUTDOWN_PRESTOP_SECONDS": "0",
+    "LOG_LEVEL": "WARNING",
+})
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated SQLite database for one test."""
+    from backend import database
+
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "chatbot.db"))
+    database.init_db()
+    return database
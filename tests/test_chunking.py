@@ -0,0 +1,83 @@
+import pytest
+
+from backend.chunking import Tokenizer, chunk_text, is_heading, parse_blocks
+
+
+class WordTokenizer(Tokenizer):
+    """The fallback word tokenizer, whether or not tiktoken is installed."""
+
+    def __init__(self):
+        self.encoding = None
+
+
+TOK = WordTokenizer()
+
+
+def chunks(text, size=40, overlap=8):
+    return chunk_text(text, chunk_tokens=size, overlap_tokens=overlap, tokenizer=TOK)
+
+
+def sentences(n, word="simmer"):
+    return " ".join(f"Step {i} is to {word} the sauce gently until thick." for i in range(n))
+
+
+@pytest.mark.parametrize("line", ["Ingredients", "Directions:", "GRANDMA'S APPLE PIE", "Spicy Black Bean Soup", "Serves 4"])
+def test_heading_lines(line):
+    assert is_heading(line)
+
+
+@pytest.mark.parametrize("line", ["", "Add the flour and stir.", "flour | sugar | eggs", "a small note", "x" * 90])
+def test_non_heading_lines(line):
+    assert not is_heading(line)
+
+
+def test_parse_blocks_separates_headings_tables_and_paragraphs():
+    text = "Fluffy Pancakes\nMix the flour\nwith the milk.\nItem | Amount\nFlour | 200 g\n\nServe warm."
+    assert parse_blocks(text) == [
+        ("heading", "Fluffy Pancakes"),
+        ("paragraph", "Mix the flour with the milk."),
+        ("table", "Item | Amount\nFlour | 200 g"),
+        ("paragraph", "Serve warm."),
+    ]
+
+
+def test_short_text_is_a_single_chunk():
+    assert chunks("Tomato Soup\nBlend the tomatoes.") == ["Tomato Soup\nBlend the tomatoes."]
+
+
+def test_no_chunk_exceeds_the_token_budget():
+    text = "Method\n" + sentences(30) + "\n\n" + "word " * 300
+    result = chunks(text)
+    assert len(result) > 5
+    assert all(TOK.count(c) <= 40 for c in result)
+
+
+def test_every_chunk_of_a_section_repeats_its_heading():
+    result = chunks("Directions\n" + sentences(12))
+    assert len(result) > 1
+    assert all(c.startswith("Directions\n") for c in result)
+
+
+def test_split_paragraphs_overlap_by_the_last_tokens():
+    result = chunks(sentences(12), overlap=8)
+    for previous, current in zip(result, result[1:]):
+        head = " ".join(current.split()[:4])
+        assert head in previous
+
+
+def test_without_overlap_no_text_is_repeated():
+    text = sentences(12)
+    result = chunks(text, overlap=0)
+    assert " ".join(result).split() == text.split()
+
+
+def test_tables_split_between_rows_and_repeat_the_header():
+    rows = ["Ingredient | Grams"] + [f"Ingredient number {i} | {i * 10}" for i in range(20)]
+    result = chunks("\n".join(rows))
+    assert len(result) > 1
+    for chunk in result:
+        lines = chunk.split("\n")
+        assert lines[0] == "Ingredient | Grams"
+        assert all(line in rows for line in lines)
+    body = [line for chunk in result for line in chunk.split("\n")[1:]]
+    assert body == rows[1:]
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 0.5, -0.25] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_vectors_round_trip_across_reopen(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup", "bread"], [[0.1, 0.2, 0.3], [1.0, -1.0, 0.5]])
+    assert cache.get_many(["bread", "cake", "soup"])[1] is None
+
+    reopened = EmbeddingCache("test-model", root=str(tmp_path))
+    assert len(reopened) == 2
+    bread, soup = reopened.get_many(["bread", "soup"])
+    assert bread == [1.0, -1.0, 0.5]
+    np.testing.assert_allclose(soup, [0.1, 0.2, 0.3], atol=1e-3)
+
+
+def test_repeated_texts_are_stored_once(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup", "soup"], [[1, 2], [1, 2]])
+    cache.put_many(["soup"], [[1, 2]])
+    assert len(cache) == 1
+
+
+def test_a_vector_of_another_dimension_is_rejected(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup"], [[1, 2, 3]])
+    with pytest.raises(ValueError):
+        cache.put_many(["bread"], [[1, 2]])
+
+
+def test_vector_rows_without_keys_are_truncated_on_open(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup"], [[1, 2, 3]])
+    # A crash between writing vector rows and their keys
+    with open(cache._vectors_path, "ab") as f:
+        f.write(np.ones((2, 3), dtype=np.float16).tobytes())
+
+    reopened = EmbeddingCache("test-model", root=str(tmp_path))
+    assert os.path.getsize(reopened._vectors_path) == 3 * 2
+    reopened.put_many(["bread"], [[4, 5, 6]])
+    assert reopened.get_many(["soup", "bread"]) == [[1, 2, 3], [4, 5, 6]]
+
+
+
+def test_a_torn_key_record_is_truncated_on_open(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup"], [[1, 2, 3]])
+    # A crash halfway through appending the next batch: a full row but only part of its key
+    with open(cache._vectors_path, "ab") as f:
+        f.write(np.ones((1, 3), dtype=np.float16).tobytes())
+    with open(cache._keys_path, "ab") as f:
+        f.write(b"\x01" * 10)
+
+    reopened = EmbeddingCache("test-model", root=str(tmp_path))
+    assert os.path.getsize(reopened._keys_path) == 32
+    assert os.path.getsize(reopened._vectors_path) == 3 * 2
+    reopened.put_many(["bread"], [[4, 5, 6]])
+    assert EmbeddingCache("test-model", root=str(tmp_path)).get_many(["soup", "bread"]) == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_keys_without_their_vector_rows_are_truncated_on_open(tmp_path):
+    cache = EmbeddingCache("test-model", root=str(tmp_path))
+    cache.put_many(["soup", "bread"], [[1, 2, 3], [4, 5, 6]])
+    # The second row is torn
+    os.truncate(cache._vectors_path, 3 * 2 + 4)
+
+    reopened = EmbeddingCache("test-model", root=str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.get_many(["soup", "bread"]) == [[1, 2, 3], None]
+
+def test_only_misses_reach_the_model(tmp_path):
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache("test-model", root=str(tmp_path)))
+    first = embeddings.embed_documents(["soup", "bread", "soup"])
+    second = embeddings.embed_documents(["bread", "cake"])
+    assert inner.calls == [["soup", "bread"], ["cake"]]
+    assert first[0] == first[2] and second[0] == first[1]
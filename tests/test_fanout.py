@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import socket
+
+from backend import fanout
+from backend.fanout import Fanout
+
+
+class Peer:
+    """Another worker's fan-out socket, read by hand."""
+
+    def __init__(self, directory, rcvbuf=None):
+        self.path = os.path.join(directory, "peer.sock")
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        if rcvbuf:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.sock.bind(self.path)
+        self.sock.setblocking(False)
+
+    def received(self):
+        out = []
+        while True:
+            try:
+                payload = json.loads(self.sock.recv(1 << 20))
+            except BlockingIOError:
+                return out
+            if "spill" in payload:
+                with open(payload["spill"], "rb") as f:
+                    payload = json.loads(f.read())
+            out.append(payload)
+
+    def close(self):
+        self.sock.close()
+
+
+def run(tmp_path, scenario):
+    directory = str(tmp_path / "fanout")
+    os.makedirs(directory)
+    delivered = []
+
+    async def deliver(chat_id, message):
+        delivered.append((chat_id, message))
+
+    async def main():
+        hub = Fanout(deliver, directory)
+        await hub.start()
+        try:
+            return await scenario(hub, directory)
+        finally:
+            await hub.stop()
+
+    return delivered, asyncio.run(main())
+
+
+def test_broadcasts_reach_local_sockets_and_other_workers(tmp_path):
+    async def scenario(hub, directory):
+        peer = Peer(directory)
+        await hub.publish(7, "hello")
+        await asyncio.sleep(0.01)
+        return peer.received()
+
+    delivered, remote = run(tmp_path, scenario)
+    assert delivered == [(7, "hello")]
+    assert remote == [{"chat_id": 7, "message": "hello"}]
+
+
+def test_broadcasts_from_other_workers_are_delivered_here(tmp_path):
+    async def scenario(hub, directory):
+        peer = Peer(directory)
+        peer.sock.sendto(json.dumps({"chat_id": 3, "message": "from afar"}).encode(), hub._path)
+        await asyncio.sleep(0.05)
+
+    delivered, _ = run(tmp_path, scenario)
+    assert delivered == [(3, "from afar")]
+
+
+def test_large_broadcasts_are_spilled_to_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(fanout, "FANOUT_MAX_BYTES", 64)
+    big = "x" * 1000
+
+    async def scenario(hub, directory):
+        peer = Peer(directory)
+        await hub.publish(1, big)
+        received = peer.received()
+        # The peer read (and would remove) its spill file; the sender left nothing else behind
+        spills = [f for f in os.listdir(directory) if f.endswith(".spill")]
+        return received, spills
+
+    _, (received, spills) = run(tmp_path, scenario)
+    assert received == [{"chat_id": 1, "message": big}]
+    assert len(spills) == 1 and spills[0].startswith("peer.sock.")
+
+
+def test_a_busy_worker_gets_every_broadcast_in_order(tmp_path):
+    async def scenario(hub, directory):
+        peer = Peer(directory, rcvbuf=4096)
+        for n in range(200):
+            await hub.publish(1, f"message {n} " + "y" * 200)
+        assert hub._pending, "the peer's buffer should have filled up"
+        received = []
+        for _ in range(200):
+            received += peer.received()
+            if len(received) == 200:
+                break
+            await asyncio.sleep(0.01)
+        return [payload["message"].split()[1] for payload in received]
+
+    _, order = run(tmp_path, scenario)
+    assert order == [str(n) for n in range(200)]
+
+
+def test_a_dead_worker_is_forgotten(tmp_path):
+    async def scenario(hub, directory):
+        peer = Peer(directory)
+        peer.close()
+        await hub.publish(1, "anyone?")
+        return os.path.exists(peer.path)
+
+    delivered, still_there = run(tmp_path, scenario)
+    assert delivered == [(1, "anyone?")]
+    assert not still_there
+
+
+def test_a_failed_delivery_is_logged_and_later_broadcasts_still_arrive(tmp_path, monkeypatch):
+    directory = str(tmp_path / "fanout")
+    os.makedirs(directory)
+    delivered, failures = [], []
+
+    async def deliver(chat_id, message):
+        if message == "broken":
+            raise RuntimeError("socket closed")
+        delivered.append(message)
+
+    class Log:
+        def info(self, event, **fields):
+            pass
+
+        def exception(self, event, **fields):
+            failures.append((event, fields))
+
+    monkeypatch.setattr(fanout, "log", Log())
+
+    async def main():
+        hub = Fanout(deliver, directory)
+        await hub.start()
+        peer = Peer(directory)
+        for message in ("first", "broken", "last"):
+            peer.sock.sendto(json.dumps({"chat_id": 5, "message": message}).encode(), hub._path)
+        await asyncio.sleep(0.05)
+        # stop() waits for the received broadcasts to be delivered
+        await hub.stop()
+
+    asyncio.run(main())
+    assert delivered == ["first", "last"]
+    assert failures == [("fanout_delivery_failed", {"chat_id": 5})]
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import shutil
+
+import pytest
+from PyPDF2 import PdfWriter
+
+from backend import ingestion
+
+RECIPES_PDF = os.path.join(os.path.dirname(__file__), os.pardir, "backend", "pdfs", "Easy_recipes.pdf")
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    os.makedirs(ingestion.UPLOAD_DIR)
+    return ingestion.UPLOAD_DIR
+
+
+def store_upload(db, source=None):
+    """A queued PDF row with its upload in place; a blank one-page PDF without `source`."""
+    pdf_id = db.add_pdf("upload.pdf", 1, status=ingestion.STATUS_QUEUED)
+    if source:
+        shutil.copy(source, ingestion.upload_path(pdf_id))
+    else:
+        writer = PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        with open(ingestion.upload_path(pdf_id), "wb") as f:
+            writer.write(f)
+    return pdf_id
+
+
+def ingest(index_fn, *pdf_ids):
+    """Start a manager, which picks up the queued uploads, and wait for the jobs of `pdf_ids`."""
+    async def scenario():
+        manager = ingestion.IngestionManager(index_fn, workers=1)
+        await manager.start()
+        await manager.stop()
+        return [manager.get(pdf_id) for pdf_id in pdf_ids]
+
+    return asyncio.run(scenario())
+
+
+def test_a_pdf_is_extracted_chunked_and_indexed_in_the_background(db, uploads):
+    indexed = []
+
+    def index_fn(pdf_id, chunks, progress, replace):
+        indexed.extend(chunks)
+        progress(len(chunks), len(chunks))
+
+    pdf_id = store_upload(db, RECIPES_PDF)
+    (job,) = ingest(index_fn, pdf_id)
+    assert job.status == ingestion.STATUS_PROCESSED
+    assert indexed and job.chunks_total == job.chunks_done == len(indexed)
+    assert job.to_dict()["progress"] == 1.0
+    assert db.get_pdf(pdf_id)["status"] == ingestion.STATUS_PROCESSED
+
+
+def test_a_pdf_without_text_fails(db, uploads):
+    (job,) = ingest(lambda *args: pytest.fail("nothing to index"), store_upload(db))
+    assert job.status == ingestion.STATUS_FAILED
+    assert job.error == "No text could be extracted from the PDF"
+
+
+def test_an_indexing_error_fails_the_job(db, uploads):
+    def index_fn(pdf_id, chunks, progress, replace):
+        raise RuntimeError("embedding provider down")
+
+    pdf_id = store_upload(db, RECIPES_PDF)
+    (job,) = ingest(index_fn, pdf_id)
+    assert job.status == ingestion.STATUS_FAILED and "provider down" in job.error
+    assert db.get_pdf(pdf_id)["status"] == ingestion.STATUS_FAILED
+
+
+def test_jobs_without_their_upload_fail_on_start(db, uploads):
+    lost = db.add_pdf("lost.pdf", 1, status=ingestion.STATUS_EMBEDDING)
+    assert ingest(lambda *args: None, lost) == [None]
+    assert db.get_pdf(lost)["status"] == ingestion.STATUS_FAILED
+
+
+def test_a_broken_extraction_pool_is_replaced(db, monkeypatch):
+    from concurrent.futures.process import BrokenProcessPool
+
+    def extract_and_chunk(path, executor=None, progress=None):
+        if path == "crash.pdf":
+            raise BrokenProcessPool("a worker process died")
+        yield "chunk about a dish nobody has uploaded before"
+
+    monkeypatch.setattr(ingestion, "extract_and_chunk", extract_and_chunk)
+    crashed, healthy = (db.add_pdf(name, 1) for name in ("crash.pdf", "fine.pdf"))
+
+    async def scenario():
+        manager = ingestion.IngestionManager(lambda *args: None, workers=1)
+        await manager.start()
+        pool = manager._pool
+        first = manager.submit(crashed, "crash.pdf", "crash.pdf")
+        await asyncio.gather(*manager._tasks)
+        replaced = manager._pool is not pool
+        second = manager.submit(healthy, "fine.pdf", "fine.pdf")
+        await manager.stop()
+        return first, second, replaced
+
+    first, second, replaced = asyncio.run(scenario())
+    assert first.status == "failed" and replaced
+    assert second.status == "processed"
+
+
+def test_finished_jobs_are_evicted_after_their_ttl(db, monkeypatch):
+    monkeypatch.setattr(ingestion, "extract_and_chunk", lambda path, executor=None, progress=None: (chunk for chunk in []))
+    first, second = (db.add_pdf(name, 1) for name in ("a.pdf", "b.pdf"))
+
+    async def scenario():
+        manager = ingestion.IngestionManager(lambda *args: None, workers=1, job_ttl=60)
+        await manager.start()
+        job = manager.submit(first, "a.pdf", "a.pdf")
+        await asyncio.gather(*manager._tasks)
+        kept = manager.get(first) is job
+        job.updated_at -= 61
+        manager.submit(second, "b.pdf", "b.pdf")
+        await manager.stop()
+        return kept, manager.get(first), manager.get(second)
+
+    kept, evicted, current = asyncio.run(scenario())
+    assert kept and evicted is None
+    assert current.status == "failed"
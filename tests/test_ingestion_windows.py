@@ -0,0 +1,132 @@
+import pytest
+
+from backend.data_storage import iter_text_chunks
+from backend.ingestion import next_window
+
+
+def recipe_pages(count):
+    for n in range(count):
+        yield (
+            f"Recipe {n}\n"
+            f"Simmer the stock number {n} for twenty minutes. Season sauce {n} with salt and pepper. "
+            f"Serve dish {n} warm with bread.\n\n"
+        )
+
+
+def test_chunks_are_produced_before_the_whole_document_is_read():
+    consumed = []
+
+    def pages():
+        for n, page in enumerate(recipe_pages(400)):
+            consumed.append(n)
+            yield page
+
+    chunks = iter_text_chunks(pages(), chunk_size=200, chunk_overlap=20)
+    first = next(chunks)
+    assert first
+    assert len(consumed) < 400
+    chunks.close()
+
+
+def test_streamed_chunks_keep_every_page():
+    chunks = list(iter_text_chunks(recipe_pages(300), chunk_size=200, chunk_overlap=20))
+    text = "\n".join(chunks)
+    for n in range(300):
+        assert f"Serve dish {n} warm" in text
+
+
+
+def test_the_logged_chunk_count_matches_the_chunks_yielded(monkeypatch):
+    from backend import data_storage
+
+    logged = []
+
+    class Log:
+        def info(self, event, **fields):
+            logged.append((event, fields))
+
+    monkeypatch.setattr(data_storage, "log", Log())
+    # Whitespace-only windows split into no chunks at all
+    pages = [" " * 4000] * 3 + list(recipe_pages(30))
+    chunks = list(iter_text_chunks(pages, chunk_size=200, chunk_overlap=20))
+    assert chunks
+    assert logged == [("text_chunked", {"chunks": len(chunks)})]
+
+def test_next_window_yields_bounded_windows_until_exhausted():
+    chunks = iter(range(10))
+    windows = []
+    while True:
+        window = next_window(chunks, size=4)
+        if not window:
+            break
+        windows.append(window)
+    assert windows == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def run_job(db, monkeypatch, chunks, index_fn, discard_fn=None, window=3):
+    import asyncio
+    from backend import ingestion
+
+    monkeypatch.setattr(ingestion, "extract_and_chunk", lambda path, executor=None, progress=None: (chunk for chunk in chunks))
+    monkeypatch.setattr(ingestion, "next_window", lambda it, size=window: next_window(it, size))
+    pdf_id = db.add_pdf("menu.pdf", 1, status=ingestion.STATUS_PROCESSED)
+
+    async def scenario():
+        manager = ingestion.IngestionManager(index_fn, discard_fn, workers=1)
+        await manager.start()
+        job = manager.submit(pdf_id, "menu.pdf", "unused.pdf")
+        await manager.stop()
+        return job
+
+    return pdf_id, asyncio.run(scenario())
+
+
+def test_each_window_is_indexed_and_only_the_first_replaces(db, monkeypatch):
+    calls = []
+
+    def index_fn(pdf_id, window, progress, replace):
+        calls.append((list(window), replace))
+        progress(len(window), len(window))
+
+    chunks = [f"chunk number {n} about a different dish entirely {n * 7919}" for n in range(7)]
+    _, job = run_job(db, monkeypatch, chunks, index_fn)
+    assert job.status == "processed"
+    assert calls == [(chunks[:3], True), (chunks[3:6], False), (chunks[6:], False)]
+    assert job.chunks_total == job.chunks_done == 7
+
+
+def test_a_failed_window_discards_what_earlier_windows_indexed(db, monkeypatch):
+    discarded = []
+
+    def index_fn(pdf_id, window, progress, replace):
+        if not replace:
+            raise RuntimeError("embedding provider down")
+
+    chunks = [f"chunk number {n} about a different dish entirely {n * 7919}" for n in range(7)]
+    pdf_id, job = run_job(db, monkeypatch, chunks, index_fn, discarded.append)
+    assert job.status == "failed" and "provider down" in job.error
+    assert discarded == [pdf_id]
+    assert db.get_pdf(pdf_id)["status"] == "failed"
+
+
+def test_a_pdf_with_only_known_content_is_processed_without_indexing(db, monkeypatch):
+    from backend.data_storage import filter_near_duplicates
+
+    chunks = [f"chunk number {n} about a different dish entirely {n * 7919}" for n in range(4)]
+    filter_near_duplicates(db.add_pdf("original.pdf", 1), chunks)
+    _, job = run_job(db, monkeypatch, chunks, lambda *args: pytest.fail("nothing new to index"))
+    assert job.status == "processed" and job.chunks_done == job.chunks_total == 4
+
+
+def test_an_extraction_error_fails_the_job_and_discards_its_chunks(db, monkeypatch):
+    discarded = []
+
+    def pages_then_error():
+        yield from [f"chunk number {n} about a different dish entirely {n * 7919}" for n in range(4)]
+        raise RuntimeError("corrupt page")
+
+    pdf_id, job = run_job(db, monkeypatch, pages_then_error(), lambda *args: None, discarded.append)
+    assert job.status == "failed" and "corrupt page" in job.error
+    assert discarded == [pdf_id]
+    assert db.get_pdf(pdf_id)["status"] == "failed"
+
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pytest
+
+from backend import lexical_index, vector_store
+from backend.lexical_index import (
+    CorpusStats, Lexicon, bm25, query_terms, reciprocal_rank_fusion, terms,
+)
+from backend.vector_store import ShardedVectorStore
+
+TEXTS = [
+    "Eggs, flour and milk whisked into pancakes",
+    "Crème brûlée: cream, eggs and sugar",
+    "Lentil soup with carrots",
+]
+
+
+def test_terms_drop_stop_words_and_plural_s():
+    assert terms("The Eggs and the TOMATOES, please!") == ["egg", "tomatoe"]
+    assert terms("glass of bass") == ["glass", "bass"]
+    assert terms("a b cd") == ["cd"]
+
+
+def test_query_terms_are_distinct_in_order():
+    assert query_terms("eggs egg Egg milk eggs") == ["egg", "milk"]
+
+
+def test_lexicon_postings_and_lengths():
+    lexicon = Lexicon.build([10, 11, 12], TEXTS)
+    assert lexicon.df("egg") == 2
+    assert lexicon.df("missing") == 0
+    ids, tfs, lengths = lexicon.postings("egg")
+    assert ids.tolist() == [10, 11]
+    assert tfs.tolist() == [1, 1]
+    assert lengths.tolist() == [5, 5]
+    assert [lexicon.term(n) for n in range(len(lexicon))] == sorted(
+        (lexicon.term(n) for n in range(len(lexicon))), key=lambda t: t.encode("utf-8"))
+
+
+def test_lexicon_round_trips_unicode_and_long_terms(tmp_path):
+    long_term = "x" * 500
+    lexicon = Lexicon.build([1, 2], [TEXTS[1], f"{long_term} soup"])
+    path = tmp_path / "seg.lex.npz"
+    with open(path, "wb") as f:
+        lexicon.save(f)
+    loaded = Lexicon.load(path)
+    assert loaded.df("crème") == 1
+    assert loaded.df("brûlée") == 1
+    assert loaded.postings(long_term)[0].tolist() == [2]
+    assert loaded.df("x" * 499) == 0
+
+
+def test_bm25_favours_frequent_terms_in_short_chunks():
+    weights = bm25(np.array([1, 3, 1]), np.array([10, 10, 40]), idf=1.0, avg_length=20)
+    assert weights[1] > weights[0] > weights[2]
+    assert (weights < 1.0 * (lexical_index.BM25_K1 + 1)).all()
+
+
+def test_max_score_bounds_every_chunk():
+    stats = CorpusStats(docs=3, total_length=15, df={"egg": 2, "milk": 1})
+    bound = stats.max_score(["egg", "milk", "egg"])
+    tfs, lengths = np.array([50]), np.array([1])
+    best = sum(bm25(tfs, lengths, stats.idf(t), stats.avg_length())[0] for t in ("egg", "milk"))
+    assert best < bound
+    # A term no chunk contains cannot raise the bound
+    assert stats.max_score(["egg", "milk", "saffron"]) == bound
+    assert stats.matches()
+    assert not CorpusStats(df={"egg": 0}).matches()
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c"]], k=60) == ["b", "c", "a"]
+    assert reciprocal_rank_fusion([["a"], []]) == ["a"]
+
+
+def index_texts(db, store, texts):
+    pdf_id = db.add_pdf("recipes.pdf", 1)
+    embed = store._embeddings.embed_query
+    store.add(pdf_id, [(text, embed(text)) for text in texts])
+
+
+@pytest.fixture
+def lexical_only(db, tmp_path, monkeypatch):
+    """A store whose dense search finds nothing, so results come from BM25 alone."""
+    store = ShardedVectorStore(str(tmp_path / "index")).load()
+    index_texts(db, store, [
+        "Vegan lentil curry with coconut milk and spinach",
+        "Thai green curry paste",
+        "Chicken soup with noodles",
+        "Beef stew with potatoes",
+    ])
+    monkeypatch.setattr(store, "similarity_search_with_score", lambda *args, **kwargs: [])
+    return store
+
+
+def hits(store, query):
+    return [doc.page_content for doc, _ in store.hybrid_search_with_score(query, k=4)]
+
+
+def test_segments_get_a_lexicon_file(lexical_only):
+    files = os.listdir(os.path.join(lexical_only.path, "global"))
+    assert "seg-000001.lex.npz" in files
+
+
+def test_weak_lexical_only_hits_are_dropped(lexical_only, monkeypatch):
+    assert hits(lexical_only, "lentil coconut curry") == ["Vegan lentil curry with coconut milk and spinach"]
+    monkeypatch.setattr(vector_store, "LEXICAL_MIN_SCORE", 0.0)
+    assert "Thai green curry paste" in hits(lexical_only, "lentil coconut curry")
+
+
+def test_queries_without_indexed_terms_skip_dense_search(lexical_only, monkeypatch):
+    monkeypatch.setattr(lexical_only, "similarity_search_with_score", pytest.fail)
+    assert lexical_only.hybrid_search_with_score("pizza margherita") == []
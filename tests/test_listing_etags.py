@@ -0,0 +1,122 @@
+import pytest
+
+
+def test_triggers_bump_the_versions_of_what_changed(db):
+    before = db.get_versions(["pdfs", "users", "usernames"])
+    db.create_user("bob@example.com", "bob", "hash")
+    after = db.get_versions(["pdfs", "users", "usernames"])
+    assert after["users"] == before["users"] + 1
+    assert after["pdfs"] == before["pdfs"] and after["usernames"] == before["usernames"]
+
+    pdf_id = db.add_pdf("menu.pdf", 1)
+    db.update_pdf_status(pdf_id, "failed")
+    db.delete_pdf(pdf_id)
+    assert db.get_versions(["pdfs"])["pdfs"] == before["pdfs"] + 3
+
+
+def test_membership_and_chat_updates_bump_each_members_chat_list(db):
+    alice = db.create_user("alice@example.com", "alice", "hash")
+    bob = db.create_user("bob@example.com", "bob", "hash")
+    chat_id = db.create_chat("dinner", owner_user_id=alice)
+    keys = [f"chats:{alice}", f"chats:{bob}", f"members:{chat_id}"]
+    start = db.get_versions(keys)
+
+    db.add_chat_member(chat_id, bob)
+    joined = db.get_versions(keys)
+    assert joined[f"chats:{bob}"] == start[f"chats:{bob}"] + 1
+    assert joined[f"members:{chat_id}"] == start[f"members:{chat_id}"] + 1
+    assert joined[f"chats:{alice}"] == start[f"chats:{alice}"]
+
+    db.add_message(chat_id, "hi", "user", user_id=alice)
+    messaged = db.get_versions(keys)
+    assert messaged[f"chats:{alice}"] > joined[f"chats:{alice}"]
+    assert messaged[f"chats:{bob}"] > joined[f"chats:{bob}"]
+    assert messaged[f"members:{chat_id}"] == joined[f"members:{chat_id}"]
+
+
+def test_unknown_keys_read_as_zero_and_the_epoch_is_set(db):
+    versions = db.get_versions(["never-bumped"])
+    assert versions["never-bumped"] == 0
+    assert versions["epoch"] > 0
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    with TestClient(backend.app) as client:
+        yield client
+
+
+def register(client, name):
+    body = {"username": name, "email": f"{name}@example.com", "password": "secret123"}
+    token = client.post("/auth/register", json=body).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def revalidate(client, path, etag, headers=None):
+    return client.get(path, headers={**(headers or {}), "If-None-Match": etag})
+
+
+def test_chat_list_is_not_modified_until_it_changes(client):
+    alice = register(client, "alice")
+    first = client.get("/chats", headers=alice)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    cached = revalidate(client, "/chats", etag, alice)
+    assert cached.status_code == 304 and cached.headers["ETag"] == etag and not cached.content
+
+    client.post("/chats", json={"title": "dinner"}, headers=alice)
+    changed = revalidate(client, "/chats", etag, alice)
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert [chat["title"] for chat in changed.json()["chats"]] == ["dinner"]
+
+
+def test_etags_are_per_user(client):
+    alice, bob = register(client, "alice"), register(client, "bob")
+    etag = client.get("/chats", headers=alice).headers["ETag"]
+    assert revalidate(client, "/chats", etag, bob).status_code == 200
+
+
+def test_if_none_match_lists_and_strong_form(client):
+    alice = register(client, "alice")
+    etag = client.get("/users", headers=alice).headers["ETag"]
+    assert revalidate(client, "/users", f'"other", {etag.removeprefix("W/")}', alice).status_code == 304
+    assert revalidate(client, "/users", "*", alice).status_code == 304
+    assert revalidate(client, "/users", '"other"', alice).status_code == 200
+
+    register(client, "carol")
+    assert revalidate(client, "/users", etag, alice).status_code == 200
+
+
+def test_pdf_list_changes_with_uploads(client, db):
+    etag = client.get("/pdfs").headers["ETag"]
+    assert revalidate(client, "/pdfs", etag).status_code == 304
+    db.add_pdf("menu.pdf", 1)
+    fresh = revalidate(client, "/pdfs", etag)
+    assert fresh.status_code == 200
+    assert [pdf["filename"] for pdf in fresh.json()["pdfs"]] == ["menu.pdf"]
+
+
+def test_members_listing_checks_membership_before_revalidating(client):
+    alice, bob = register(client, "alice"), register(client, "bob")
+    chat_id = client.post("/chats", json={"title": "dinner"}, headers=alice).json()["chat_id"]
+    etag = client.get(f"/chats/{chat_id}/members", headers=alice).headers["ETag"]
+    assert revalidate(client, f"/chats/{chat_id}/members", etag, alice).status_code == 304
+    assert revalidate(client, f"/chats/{chat_id}/members", "*", bob).status_code == 403
+    assert revalidate(client, f"/chats/{chat_id}/members", etag, bob).status_code == 403
+
+
+def test_pdf_list_etag_follows_memberships_not_messages(client, db):
+    alice, bob = register(client, "alice"), register(client, "bob")
+    chat_id = client.post("/chats", json={"title": "dinner"}, headers=alice).json()["chat_id"]
+    etag = client.get("/pdfs", headers=bob).headers["ETag"]
+
+    db.add_message(chat_id, "hi", "user", user_id=db.get_user_by_email("alice@example.com")["id"])
+    assert revalidate(client, "/pdfs", etag, bob).status_code == 304
+
+    client.post(f"/chats/{chat_id}/invite", json={"emails": ["bob@example.com"]}, headers=alice)
+    assert revalidate(client, "/pdfs", etag, bob).status_code == 200
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+from backend.llm_gateway import PRIORITY_BULK, PRIORITY_INTERACTIVE, ModelGateway, TokenBucket
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def fast_gateway(**kwargs):
+    settings = {"rpm": 100000, "tpm": 10 ** 9, "base_delay": 0.0, "max_delay": 0.0}
+    return ModelGateway(**{**settings, **kwargs})
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)  # one token per second
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.consume(60, now)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.wait_time(1, now + 1.0) == 0.0
+
+
+def test_token_bucket_lets_oversized_requests_through_when_full():
+    bucket = TokenBucket(per_minute=100)
+    now = bucket.updated
+    assert bucket.wait_time(1000, now) == 0.0
+    bucket.consume(1000, now)
+    assert bucket.tokens == 0.0
+
+
+def test_successful_calls_raise_the_concurrency_limit_additively():
+    gateway = fast_gateway(initial_concurrency=4, max_concurrency=32)
+    expected = 4.0
+    for _ in range(4):
+        gateway.call(lambda: None, kind="test")
+        expected += 1.0 / expected
+    assert gateway.stats()["concurrency_limit"] == pytest.approx(expected)
+
+
+def test_throttling_halves_the_limit_and_is_retried():
+    gateway = fast_gateway(initial_concurrency=8, min_concurrency=1, max_retries=3)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ProviderError(429)
+        return "ok"
+
+    assert gateway.call(flaky, kind="test") == "ok"
+    stats = gateway.stats()
+    assert len(attempts) == 2
+    assert stats["throttled"] == 1 and stats["retries"] == 1
+    # Halved by the 429, then one additive step from the successful retry
+    assert stats["concurrency_limit"] == pytest.approx(4.25)
+
+
+def test_limit_never_drops_below_the_minimum():
+    gateway = fast_gateway(initial_concurrency=2, min_concurrency=2)
+    gateway._decrease(time.monotonic(), "test")
+    assert gateway.stats()["concurrency_limit"] == 2.0
+
+
+def test_client_errors_are_not_retried():
+    gateway = fast_gateway(max_retries=5)
+    attempts = []
+
+    def bad_request():
+        attempts.append(1)
+        raise ProviderError(400)
+
+    with pytest.raises(ProviderError):
+        gateway.call(bad_request, kind="test")
+    assert len(attempts) == 1
+    assert gateway.stats()["errors"] == 1
+
+
+def test_retries_give_up_after_max_retries():
+    gateway = fast_gateway(max_retries=2)
+    attempts = []
+
+    def down():
+        attempts.append(1)
+        raise ProviderError(503)
+
+    with pytest.raises(ProviderError):
+        gateway.call(down, kind="test")
+    assert len(attempts) == 3
+
+
+def test_interactive_calls_are_admitted_before_queued_bulk_calls():
+    gateway = fast_gateway(initial_concurrency=1, min_concurrency=1, max_concurrency=1)
+    holding = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def hold():
+        holding.set()
+        release.wait(5)
+
+    def wait_for_waiters(count):
+        deadline = time.monotonic() + 5
+        while gateway.stats()["waiting"] < count and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    first = threading.Thread(target=gateway.call, args=(hold,), kwargs={"kind": "test"})
+    first.start()
+    holding.wait(5)
+    bulk = threading.Thread(target=gateway.call, args=(lambda: order.append("bulk"),), kwargs={"priority": PRIORITY_BULK, "kind": "test"})
+    bulk.start()
+    wait_for_waiters(1)
+    interactive = threading.Thread(target=gateway.call, args=(lambda: order.append("interactive"),), kwargs={"priority": PRIORITY_INTERACTIVE, "kind": "test"})
+    interactive.start()
+    wait_for_waiters(2)
+    release.set()
+    for thread in (first, bulk, interactive):
+        thread.join(5)
+    assert order == ["interactive", "bulk"]
+
+
+@pytest.fixture
+def word_tokens(monkeypatch):
+    from backend import llm_gateway
+    monkeypatch.setattr(llm_gateway, "count_tokens", lambda text: len(text.split()))
+
+
+def test_batches_are_packed_by_item_and_token_limits(word_tokens):
+    from backend.llm_gateway import pack_batches
+
+    texts = ["a b", "c d e", "f", "g h i j", "k", "l"]
+    assert pack_batches(texts, max_items=10, max_tokens=5) == [(0, 2), (2, 4), (4, 6)]
+    assert pack_batches(texts, max_items=2, max_tokens=100) == [(0, 2), (2, 4), (4, 6)]
+    assert pack_batches([], max_items=2, max_tokens=5) == []
+
+
+def test_an_oversized_text_gets_a_batch_of_its_own(word_tokens):
+    from backend.llm_gateway import pack_batches
+
+    texts = ["a", "b c d e f g h", "i"]
+    assert pack_batches(texts, max_items=10, max_tokens=3) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_chunks_are_embedded_in_concurrent_batches_and_keep_their_order(monkeypatch):
+    from backend import data_storage
+
+    seen = []
+
+    class Embeddings:
+        def embed_documents(self, texts):
+            seen.append(len(texts))
+            return [[float(t.split()[-1])] for t in texts]
+
+    monkeypatch.setattr(data_storage, "get_embeddings", Embeddings)
+    monkeypatch.setattr(data_storage, "pack_batches", lambda texts: [(i, min(i + 3, len(texts))) for i in range(0, len(texts), 3)])
+    chunks = [f"chunk {n}" for n in range(10)]
+    progress = []
+    result = data_storage.embed_chunks(chunks, lambda done, total: progress.append((done, total)), max_in_flight=4)
+    assert result == [(chunk, [float(n)]) for n, chunk in enumerate(chunks)]
+    assert sorted(seen) == [1, 3, 3, 3]
+    assert progress[-1] == (10, 10)
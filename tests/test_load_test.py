@@ -0,0 +1,27 @@
+from benchmarks.load_test import compare, summarize
+
+
+def test_summarize_reports_percentiles_in_milliseconds():
+    stats = summarize([i / 1000 for i in range(1, 101)])
+    assert stats == {"count": 100, "p50": 51.0, "p95": 96.0, "p99": 100.0, "max": 100.0}
+    assert summarize([])["count"] == 0
+
+
+def test_compare_flags_regressions_beyond_the_tolerance():
+    baseline = {
+        "broadcast_latency_ms": {"p50": 10.0, "p95": 20.0, "p99": 30.0},
+        "throughput": {"delivered_per_second": 1000.0},
+    }
+    result = {
+        "broadcast_latency_ms": {"p50": 11.5, "p95": 30.0, "p99": 30.5},
+        "throughput": {"delivered_per_second": 700.0},
+    }
+    assert compare(result, baseline, tolerance=0.2) == [
+        "broadcast_latency_ms.p95: 30.0 vs baseline 20.0",
+        "throughput.delivered_per_second: 700.0 vs baseline 1000.0",
+    ]
+
+
+def test_compare_ignores_sub_millisecond_jitter():
+    baseline = {"recme_latency_ms": {"p50": 0.2}}
+    assert compare({"recme_latency_ms": {"p50": 0.9}}, baseline, tolerance=0.2) == []
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from backend import vector_store
+from backend.local_embeddings import LocalEmbeddings, load_model, parse_cpus
+
+
+class FakeModel:
+    """Records the size of every forward pass; vectors encode the text length."""
+
+    def __init__(self, release=None):
+        self.batches = []
+        self.release = release
+        self.started = threading.Event()
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy, show_progress_bar):
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        self.batches.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_parse_cpus():
+    assert parse_cpus("") == set()
+    assert parse_cpus("0-3, 8") == {0, 1, 2, 3, 8}
+
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(ValueError):
+        load_model("any-model", "tensorrt")
+
+
+def test_vectors_come_back_in_order_across_batches():
+    model = FakeModel()
+    embeddings = LocalEmbeddings(model=model, batch_size=2, max_wait_ms=0)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    assert [vec[0] for vec in embeddings.embed_documents(texts)] == [1, 2, 3, 4, 5]
+    assert embeddings.embed_query("soup") == [4.0, 1.0]
+    assert all(len(batch) <= 2 for batch in model.batches)
+
+
+def test_waiting_requests_share_a_forward_pass_and_queries_go_first():
+    release = threading.Event()
+    model = FakeModel(release)
+    embeddings = LocalEmbeddings(model=model, batch_size=8, max_wait_ms=0)
+    # The first request occupies the inference thread while the others queue up
+    threads = [threading.Thread(target=embeddings.embed_documents, args=(["first"],))]
+    threads[0].start()
+    model.started.wait(5)
+    threads += [threading.Thread(target=embeddings.embed_documents, args=([f"doc {n}"],)) for n in range(3)]
+    threads.append(threading.Thread(target=embeddings.embed_query, args=("query",)))
+    for thread in threads[1:]:
+        thread.start()
+    while embeddings._queue.qsize() < 4:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert model.batches[0] == ["first"]
+    assert len(model.batches) == 2
+    assert model.batches[1][0] == "query"
+
+
+def test_a_model_that_fails_to_load_fails_every_request(monkeypatch):
+    def broken(*args):
+        raise RuntimeError("no such model")
+
+    monkeypatch.setattr("backend.local_embeddings.load_model", broken)
+    with pytest.raises(RuntimeError, match="no such model"):
+        LocalEmbeddings().embed_query("soup")
+
+
+def test_an_index_built_with_another_model_is_refused(db, tmp_path, monkeypatch):
+    store = vector_store.VectorStore(str(tmp_path / "global")).load()
+    pdf = db.add_pdf("menu.pdf", 1)
+    store.add(pdf, [("soup", store._embeddings.embed_query("soup"))])
+
+    monkeypatch.setattr(vector_store, "embedding_model_name", lambda: "other-model")
+    with pytest.raises(vector_store.EmbeddingModelMismatch):
+        vector_store.VectorStore(store.path).load()
+
+
+
+def test_startup_fails_with_a_readable_error_on_a_model_mismatch(db, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    index = tmp_path / "index"
+    store = vector_store.VectorStore(str(index / "global")).load()
+    store.add(db.add_pdf("menu.pdf", 1), [("soup", store._embeddings.embed_query("soup"))])
+    # The configured model passes
+    assert vector_store.check_embedding_model(str(index)) is None
+
+    monkeypatch.setattr(vector_store, "embedding_model_name", lambda: "other-model")
+    monkeypatch.setattr(backend, "index_path", str(index))
+    with pytest.raises(vector_store.EmbeddingModelMismatch, match="built with embedding model 'hashed"):
+        with TestClient(backend.app):
+            pass
+
+def test_an_index_without_a_recorded_model_adopts_the_current_one(db, tmp_path):
+    store = vector_store.VectorStore(str(tmp_path / "global")).load()
+    store.add(db.add_pdf("menu.pdf", 1), [("soup", store._embeddings.embed_query("soup"))])
+    manifest_path = os.path.join(store.path, vector_store.MANIFEST)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    del manifest["embedding_model"]
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    reopened = vector_store.VectorStore(store.path).load()
+    assert reopened._manifest["embedding_model"] == vector_store.embedding_model_name()
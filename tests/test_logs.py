@@ -0,0 +1,89 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from backend import logs
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    """(Logger "tests", its records), at DEBUG and kept away from the stdout writer."""
+    stdlib = logging.getLogger(f"{logs.ROOT}.tests")
+    handler = Records()
+    stdlib.addHandler(handler)
+    stdlib.setLevel(logging.DEBUG)
+    monkeypatch.setattr(stdlib, "propagate", False)
+    yield logs.get_logger("backend.tests"), handler.records
+    stdlib.removeHandler(handler)
+    stdlib.setLevel(logging.NOTSET)
+
+
+def test_logger_names_drop_the_package_prefix():
+    assert logs.get_logger("backend.ingestion").name == "ingestion"
+    assert logs.get_logger("serve").name == "serve"
+
+
+def test_string_fields_and_payloads_are_capped(captured, monkeypatch):
+    log, records = captured
+    monkeypatch.setattr(logs, "LOG_FIELD_MAX_CHARS", 10)
+    monkeypatch.setattr(logs, "LOG_PAYLOAD_MAX_CHARS", 4)
+    log.info("capped", text="x" * 25, raw=logs.payload({"q": "pizza"}), count=12345678901234)
+    fields = records[0].fields
+    assert fields["text"] == "x" * 10 + "...[+15 chars]"
+    assert fields["raw"] == '{"q"...[+10 chars]'
+    assert fields["count"] == 12345678901234
+
+
+def test_debug_events_are_sampled(captured, monkeypatch):
+    log, records = captured
+    monkeypatch.setattr(logs, "LOG_DEBUG_SAMPLE", 0.25)
+    draws = iter([0.1, 0.3, 0.9, 0.2])
+    monkeypatch.setattr(logs.random, "random", lambda: next(draws))
+    for n in range(4):
+        log.debug("sampled", n=n)
+    log.info("kept")
+    assert [(r.getMessage(), r.fields.get("n")) for r in records] == [("sampled", 0), ("sampled", 3), ("kept", None)]
+    assert records[0].fields["sample_rate"] == 0.25
+
+
+def test_disabled_levels_do_no_work(captured, monkeypatch):
+    log, records = captured
+    logging.getLogger(f"{logs.ROOT}.tests").setLevel(logging.WARNING)
+    monkeypatch.setattr(logs, "_cap", pytest.fail)
+    log.info("ignored", text="x")
+    assert records == []
+
+
+def test_a_full_queue_drops_and_counts_records():
+    handler = logs._QueueHandler(queue.Queue(1))
+    record = logging.LogRecord("foodchat.tests", logging.INFO, __file__, 1, "event", None, None)
+    before = logs.LOG_DROPPED._values.get(("info",), 0.0)
+    handler.enqueue(record)
+    handler.enqueue(record)
+    assert handler.queue.qsize() == 1
+    assert logs.LOG_DROPPED._values[("info",)] == before + 1
+
+
+def test_json_lines(captured):
+    log, records = captured
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("failed", chat_id=3, pid="clash", tags=["a", "b"])
+    entry = json.loads(logs.JsonFormatter().format(records[0]))
+    assert entry["logger"] == "tests" and entry["level"] == "error" and entry["event"] == "failed"
+    assert entry["chat_id"] == 3 and entry["field_pid"] == "clash" and entry["tags"] == '["a", "b"]'
+    assert entry["ts"].endswith("Z") and "ValueError: boom" in entry["exc"]
+    line = logs.TextFormatter().format(records[0])
+    assert " ERROR   " in line and "tests: failed chat_id=3" in line
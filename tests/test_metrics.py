@@ -0,0 +1,69 @@
+import pytest
+
+from backend import metrics
+from backend.metrics import Counter, Gauge, Histogram
+
+
+def test_counter_renders_labelled_samples():
+    counter = Counter("demo_total", "Demo counter", ["kind"])
+    counter.inc(kind="a")
+    counter.inc(2, kind='say "hi"\n')
+    assert counter.render() == [
+        "# HELP demo_total Demo counter",
+        "# TYPE demo_total counter",
+        'demo_total{kind="a"} 1.0',
+        'demo_total{kind="say \\"hi\\"\\n"} 2.0',
+    ]
+    with pytest.raises(ValueError):
+        counter.inc(other="x")
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("demo_seconds", "Demo histogram", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    lines = histogram.render()[2:]
+    assert lines == [
+        'demo_seconds_bucket{le="0.1"} 1',
+        'demo_seconds_bucket{le="1.0"} 3',
+        'demo_seconds_bucket{le="+Inf"} 4',
+        "demo_seconds_sum 4.25",
+        "demo_seconds_count 4",
+    ]
+
+
+def test_gauge_reads_its_function_at_scrape_time():
+    depth = [3]
+    gauge = Gauge("demo_depth", "Demo gauge")
+    gauge.set_function(lambda: depth[0])
+    depth[0] = 7
+    assert gauge.render()[-1] == "demo_depth 7.0"
+    gauge.set_function(lambda: 1 / 0)
+    assert gauge.render()[2:] == []
+
+
+def test_span_observes_the_stage_and_fills_timings():
+    timings = {}
+    with metrics.span("test.stage", timings):
+        pass
+    assert timings["test.stage"] >= 0
+    assert 'foodchat_stage_seconds_count{stage="test.stage"}' in metrics.render_prometheus()
+
+
+def test_sql_statements_are_counted_by_kind(db):
+    before = metrics.SQL_STATEMENTS._values.get(("INSERT",), 0.0)
+    db.create_chat("dinner")
+    assert metrics.SQL_STATEMENTS._values[("INSERT",)] > before
+    assert metrics.sql_op("  select 1") == "SELECT"
+
+
+def test_metrics_endpoint_serves_prometheus_text(db):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    with TestClient(backend.app) as client:
+        response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE foodchat_recme_queue_depth gauge" in response.text
+    assert "foodchat_sql_seconds_bucket" in response.text
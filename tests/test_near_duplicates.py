@@ -0,0 +1,44 @@
+from backend.data_storage import filter_near_duplicates, simhash
+
+RECIPE = (
+    "Preheat the oven to 200 degrees. Toss the potatoes with olive oil, rosemary and salt, "
+    "then roast them for forty minutes until golden and crisp, turning them once halfway."
+)
+
+
+def bits(a, b):
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_ignores_case_spacing_and_punctuation():
+    reformatted = "  " + RECIPE.upper().replace(",", " ,")
+    assert bits(simhash(RECIPE), simhash(reformatted)) == 0
+
+
+def test_simhash_separates_different_text():
+    other = "Whisk eggs with sugar until pale, fold in flour and bake the sponge for twenty five minutes."
+    assert bits(simhash(RECIPE), simhash(other)) > 3
+
+
+def test_duplicates_of_indexed_and_earlier_chunks_are_dropped(db):
+    first = db.add_pdf("a.pdf", 1)
+    second = db.add_pdf("b.pdf", 1)
+    assert filter_near_duplicates(first, [RECIPE, RECIPE]) == [RECIPE]
+    assert filter_near_duplicates(second, [RECIPE.lower()]) == []
+
+
+def test_replacing_a_pdfs_fingerprints_lets_a_retry_claim_its_chunks_again(db):
+    pdf = db.add_pdf("a.pdf", 1)
+    assert filter_near_duplicates(pdf, [RECIPE]) == [RECIPE]
+    # A resumed job starts over with replace=True
+    assert filter_near_duplicates(pdf, [RECIPE]) == [RECIPE]
+    # Later windows of the same job keep the first window's fingerprints
+    assert filter_near_duplicates(pdf, [RECIPE], replace=False) == []
+
+
+def test_deleting_a_pdf_frees_its_content(db):
+    first = db.add_pdf("a.pdf", 1)
+    filter_near_duplicates(first, [RECIPE])
+    db.delete_pdf(first)
+    second = db.add_pdf("b.pdf", 1)
+    assert filter_near_duplicates(second, [RECIPE]) == [RECIPE]
@@ -0,0 +1,88 @@
+import os
+
+import pdf2image
+import pytesseract
+import pytest
+from PyPDF2 import PdfWriter
+
+from backend import pdf_utilities
+
+RECIPES_PDF = os.path.join(os.path.dirname(__file__), os.pardir, "backend", "pdfs", "Easy_recipes.pdf")
+
+
+@pytest.fixture
+def fake_ocr(tmp_path, monkeypatch):
+    """Counts page rasterizations; every OCR'd page reads as a scanned recipe."""
+    calls = []
+
+    def convert_from_path(path, dpi, first_page, last_page):
+        calls.append((first_page, last_page))
+        return ["image"]
+
+    monkeypatch.setattr(pdf_utilities, "OCR_CACHE_DIR", str(tmp_path / "ocr_cache"))
+    monkeypatch.setattr(pdf2image, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda img, lang: "Scanned tomato soup recipe with basil")
+    return calls
+
+
+def blank_pdf(tmp_path, pages=2):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    path = str(tmp_path / "scan.pdf")
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("", True),
+    ("short", True),
+    ("(cid:12)(cid:40)(cid:7)(cid:3)(cid:19)(cid:22)(cid:8) " * 4, True),
+    ("~~~ ^^^ ``` ~~~ ^^^ ``` ~~~ ^^^ ``` ~~~", True),
+    ("Whisk the eggs with sugar, then fold in the flour and bake for 20 minutes.", False),
+])
+def test_needs_ocr(text, expected):
+    assert pdf_utilities.needs_ocr(text) is expected
+
+
+def test_only_pages_without_a_text_layer_are_ocrd(tmp_path, fake_ocr):
+    pages = pdf_utilities.extract_page_range(blank_pdf(tmp_path), 0, 2)
+    # Identical blank pages share one cache entry
+    assert fake_ocr == [(1, 1)]
+    assert len(pages) == 2 and all("tomato soup" in page for page in pages)
+
+    fake_ocr.clear()
+    pages = pdf_utilities.extract_page_range(RECIPES_PDF, 0, 1)
+    assert fake_ocr == []
+    assert pages[0].strip()
+
+
+def test_ocr_results_are_cached_by_page_content(tmp_path, fake_ocr):
+    path = blank_pdf(tmp_path)
+    first = pdf_utilities.extract_page_range(path, 0, 1)
+    assert pdf_utilities.extract_page_range(path, 0, 1) == first
+    assert fake_ocr == [(1, 1)]
+    assert os.listdir(pdf_utilities.OCR_CACHE_DIR)
+
+
+def test_ocr_errors_keep_the_text_layer(tmp_path, monkeypatch, fake_ocr):
+    def broken(*args, **kwargs):
+        raise RuntimeError("tesseract missing")
+
+    monkeypatch.setattr(pdf2image, "convert_from_path", broken)
+    assert pdf_utilities.extract_page_range(blank_pdf(tmp_path), 0, 1) == ["\n"]
+
+
+def test_extraction_errors_propagate_after_the_pages_already_read(tmp_path, monkeypatch):
+    def extract(path, start, stop):
+        if start:
+            raise RuntimeError("corrupt page")
+        return ["page one\n"]
+
+    monkeypatch.setattr(pdf_utilities, "PAGES_PER_TASK", 1)
+    monkeypatch.setattr(pdf_utilities, "extract_page_range", extract)
+    pages = pdf_utilities.iter_pdf_pages([blank_pdf(tmp_path)])
+    assert next(pages) == "page one\n"
+    with pytest.raises(RuntimeError, match="corrupt page"):
+        next(pages)
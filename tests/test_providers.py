@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from backend import providers
+from backend.providers import FakeChatModel, FixtureSearch, HashedEmbeddings
+
+INTENT_PROMPT = "Return a JSON object with keys 'cuisine' and 'location'."
+LIST_PROMPT = "Extract exactly 2 restaurants as a JSON array of objects with name and website."
+
+
+def test_hashed_embeddings_are_deterministic_unit_vectors():
+    embeddings = HashedEmbeddings(dim=256)
+    first, again = embeddings.embed_documents(["Spicy ramen broth", "Spicy ramen broth"])
+    assert first == again == embeddings.embed_query("spicy RAMEN broth")
+    assert len(first) == 256
+    assert np.linalg.norm(first) == pytest.approx(1.0)
+    assert embeddings.embed_query("") == [0.0] * 256
+
+
+def test_hashed_embeddings_place_overlapping_texts_closer():
+    embeddings = HashedEmbeddings(dim=1024)
+    query, near, far = map(np.asarray, embeddings.embed_documents([
+        "lentil curry with coconut milk", "red lentil curry with spinach", "grilled salmon with asparagus",
+    ]))
+    assert query @ near > query @ far
+
+
+def test_fake_chat_model_extracts_intent_from_the_conversation():
+    model = FakeChatModel(latency_ms=0)
+    reply = model.invoke([SystemMessage(content=INTENT_PROMPT), HumanMessage(content="sushi in Seattle tonight?")])
+    assert json.loads(reply.content) == {"cuisine": "Sushi", "location": "Seattle"}
+    reply = model.invoke([SystemMessage(content=INTENT_PROMPT), HumanMessage(content="anything")])
+    assert json.loads(reply.content) == {"cuisine": None, "location": None}
+
+
+def test_fake_chat_model_lists_restaurants_from_search_results():
+    results = FixtureSearch(latency_ms=0).run("best italian restaurants")
+    reply = FakeChatModel(latency_ms=0).invoke([SystemMessage(content=LIST_PROMPT), HumanMessage(content=results)])
+    restaurants = json.loads(reply.content)
+    assert [r["name"] for r in restaurants] == ["Trattoria Contadina", "Tony's Pizza Napoletana"]
+    assert all(r["website"].startswith("https://") for r in restaurants)
+
+
+def test_fixture_search_falls_back_to_the_default_results():
+    search = FixtureSearch(latency_ms=0)
+    assert "Ramen" in search.run("RAMEN near me")
+    assert search.run("restaurants on the moon") == search.fixtures["default"]
+
+
+@pytest.mark.parametrize("factory, setting", [
+    (providers.get_chat_model, "LLM_PROVIDER"),
+    (providers.get_embeddings, "EMBEDDINGS_PROVIDER"),
+    (providers.get_search, "SEARCH_PROVIDER"),
+])
+def test_unknown_providers_are_rejected(monkeypatch, factory, setting):
+    monkeypatch.setattr(providers, setting, "carrier-pigeon")
+    factory.cache_clear()
+    try:
+        with pytest.raises(ValueError, match="carrier-pigeon"):
+            factory()
+    finally:
+        factory.cache_clear()
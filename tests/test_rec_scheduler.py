@@ -0,0 +1,193 @@
+import asyncio
+import json
+import time
+
+from backend.rec_scheduler import RecommendationScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_triggers_attach_to_the_chats_queued_job():
+    async def scenario():
+        calls = []
+        release = asyncio.Event()
+
+        async def handler(chat_id, text):
+            calls.append((chat_id, text))
+            await release.wait()
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=0)
+        await scheduler.start()
+        status, future = scheduler.submit(1, "@recme pizza")
+        assert status == "queued"
+        await asyncio.sleep(0)  # the worker picks the job up
+        second, attached = scheduler.submit(1, "@recme pasta")
+        assert second == "attached" and attached is future
+        release.set()
+        assert await future is True
+        await scheduler.stop()
+        return calls, scheduler.stats()
+
+    calls, stats = run(scenario())
+    assert calls == [(1, "@recme pizza")]
+    assert stats["submitted"] == 1 and stats["attached"] == 1 and stats["completed"] == 1
+
+
+def test_attached_trigger_replaces_the_text_of_a_job_not_started_yet():
+    async def scenario():
+        seen = []
+        release = asyncio.Event()
+
+        async def handler(chat_id, text):
+            seen.append((chat_id, text))
+            await release.wait()
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=0)
+        await scheduler.start()
+        scheduler.submit(1, "first")
+        await asyncio.sleep(0)
+        scheduler.submit(2, "old")  # queued behind chat 1
+        assert scheduler.submit(2, "new")[0] == "attached"
+        release.set()
+        await scheduler.stop()
+        return seen
+
+    assert run(scenario()) == [(1, "first"), (2, "new")]
+
+
+def test_cooldown_after_a_finished_job():
+    async def scenario():
+        async def handler(chat_id, text):
+            pass
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=60)
+        await scheduler.start()
+        _, future = scheduler.submit(1, "@recme")
+        await future
+        statuses = [scheduler.submit(1, "@recme")[0], scheduler.submit(2, "@recme")[0]]
+        await scheduler.stop()
+        return statuses, scheduler.stats()
+
+    statuses, stats = run(scenario())
+    assert statuses == ["cooldown", "queued"]
+    assert stats["cooldown"] == 1
+
+
+def test_finishing_a_job_forgets_chats_whose_cooldown_ran_out():
+    async def scenario():
+        async def handler(chat_id, text):
+            pass
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=60)
+        scheduler._last_finished.update({7: time.monotonic() - 120, 8: time.monotonic() - 30})
+        await scheduler.start()
+        _, future = scheduler.submit(1, "@recme")
+        await future
+        await scheduler.stop()
+        return scheduler._last_finished
+
+    assert sorted(run(scenario())) == [1, 8]
+
+
+def test_triggers_are_rejected_when_the_queue_is_full():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def handler(chat_id, text):
+            await release.wait()
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=1, cooldown=0)
+        await scheduler.start()
+        assert scheduler.submit(1, "a")[0] == "queued"
+        await asyncio.sleep(0)  # chat 1 is running, the queue is empty again
+        assert scheduler.submit(2, "b")[0] == "queued"
+        status, future = scheduler.submit(3, "c")
+        release.set()
+        await scheduler.stop()
+        return status, future, scheduler.stats()
+
+    status, future, stats = run(scenario())
+    assert status == "rejected" and future is None
+    assert stats["rejected"] == 1 and stats["completed"] == 2
+
+
+def test_failed_jobs_are_counted_and_resolve_false():
+    async def scenario():
+        async def handler(chat_id, text):
+            raise RuntimeError("model down")
+
+        scheduler = RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=0)
+        await scheduler.start()
+        _, future = scheduler.submit(1, "@recme")
+        result = await future
+        await scheduler.stop()
+        return result, scheduler.stats()
+
+    result, stats = run(scenario())
+    assert result is False
+    assert stats["failed"] == 1 and stats["completed"] == 0
+
+
+
+def test_claims_hold_single_flight_and_cooldown_across_workers(db):
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def handler(chat_id, text):
+            calls.append(chat_id)
+            await release.wait()
+
+        # Two worker processes sharing one database
+        first, second = (
+            RecommendationScheduler(handler, workers=1, max_queue=10, cooldown=60,
+                                    claim_fn=db.claim_recme, finish_fn=db.finish_recme)
+            for _ in range(2)
+        )
+        await first.start()
+        await second.start()
+        status, future = first.submit(1, "@recme")
+        busy = second.submit(1, "@recme")
+        release.set()
+        await future
+        after = second.submit(1, "@recme")[0]
+        other_chat = second.submit(2, "@recme")[0]
+        await first.stop()
+        await second.stop()
+        return status, busy, after, other_chat, calls
+
+    status, busy, after, other_chat, calls = run(scenario())
+    assert status == "queued"
+    assert busy == ("attached", None)
+    assert after == "cooldown" and other_chat == "queued"
+    assert calls == [1, 2]
+
+
+def test_a_claim_older_than_the_lease_is_taken_over(db):
+    assert db.claim_recme(1, cooldown=0, lease=60) == "claimed"
+    assert db.claim_recme(1, cooldown=0, lease=60) == "running"
+    # Its worker died before finishing
+    assert db.claim_recme(1, cooldown=0, lease=0) == "claimed"
+    db.finish_recme(1)
+    assert db.claim_recme(1, cooldown=60, lease=60) == "cooldown"
+    assert db.claim_recme(1, cooldown=0, lease=60) == "claimed"
+
+def test_recme_in_cooldown_gets_a_notice_on_the_senders_socket(db, monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    with TestClient(backend.app) as client:
+        token = client.post("/auth/register", json={"username": "alice", "email": "alice@example.com", "password": "secret123"}).json()["access_token"]
+        chat_id = client.post("/chats", json={"title": "dinner"}, headers={"Authorization": f"Bearer {token}"}).json()["chat_id"]
+        # As if a recommendation had just been sent to this chat
+        monkeypatch.setitem(backend.rec_scheduler._last_finished, chat_id, float("inf"))
+        with client.websocket_connect(f"/ws/{chat_id}?token={token}") as ws:
+            ws.send_text("@recme tacos")
+            echo = json.loads(ws.receive_text())
+            notice = json.loads(ws.receive_text())
+
+    assert echo["sender"] == "user"
+    assert notice["sender"] == "bot" and notice["ephemeral"] is True and notice["id"] < 0
+    assert "again" in notice["content"]
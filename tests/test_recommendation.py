@@ -0,0 +1,52 @@
+import asyncio
+
+from backend import recommendation
+
+
+def recommend(db, *messages):
+    chat_id = db.create_chat("dinner")
+    for text in messages:
+        db.add_message(chat_id, text, "user")
+    return asyncio.run(recommendation.generate_recommendation(chat_id, messages[-1], None))
+
+
+def test_sponsored_restaurants_come_before_web_results(db):
+    db.create_restaurant("Pasta Palace", "owner@pasta.example", "hash", "https://pasta.example", "Italian", "Boston")
+    reply = recommend(db, "craving italian food", "we're in Boston @recme")
+    assert reply.startswith("Here are some Italian recommendations in Boston")
+    assert reply.index("Pasta Palace") < reply.index("Trattoria Contadina")
+
+
+def test_missing_location_asks_for_details(db):
+    reply = recommend(db, "something italian @recme")
+    assert "specify cuisine and location" in reply
+
+
+def test_each_run_records_its_stage_timings(db):
+    recommendation.stage_timings.clear()
+    recommend(db, "ramen in Seattle @recme")
+    (timings,) = recommendation.stage_timings
+    stages = {"history", "intent_llm", "registered_search", "web_search", "parse_llm", "total"}
+    assert {f"recme.{stage}" for stage in stages} <= set(timings)
+    assert timings["recme.total"] >= timings["recme.intent_llm"] >= 0
+
+
+def test_rag_drops_chunks_beyond_the_distance_cutoff(monkeypatch):
+    from langchain_core.documents import Document
+    from backend import data_storage
+
+    class Store:
+        def hybrid_search_with_score(self, question, k):
+            return [
+                (Document(page_content="close"), 0.5),
+                (Document(page_content="far"), 1.5),
+                (Document(page_content="lexical only"), None),
+            ]
+
+    monkeypatch.setattr(data_storage, "RAG_MAX_DISTANCE", 1.2)
+    result = data_storage.generate_rag_response(Store(), "soup?", [], return_docs=True)
+    assert [doc.page_content for doc in result["documents"]] == ["close", "lexical only"]
+
+    monkeypatch.setattr(data_storage, "RAG_MAX_DISTANCE", 0.4)
+    result = data_storage.generate_rag_response(Store(), "soup?", [], return_docs=True)
+    assert [doc.page_content for doc in result["documents"]] == ["lexical only"]
@@ -0,0 +1,86 @@
+import pytest
+
+from backend.vector_store import LRUCache, ShardedVectorStore, normalize_query
+
+DISHES = [
+    "Chicken soup with carrots, celery and noodles",
+    "Beef stew slowly braised with potatoes and red wine",
+    "Vegan lentil curry with coconut milk and spinach",
+]
+
+
+class CountingEmbeddings:
+    def __init__(self, inner):
+        self.inner = inner
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.inner.embed_query(text)
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    store = ShardedVectorStore(str(tmp_path / "index")).load()
+    store._embeddings = CountingEmbeddings(store._embeddings)
+    return store
+
+
+def index_pdf(db, store, texts, name="menu.pdf"):
+    pdf_id = db.add_pdf(name, 1)
+    embed = store._embeddings.inner.embed_query
+    store.add(pdf_id, [(text, embed(text)) for text in texts])
+    return pdf_id
+
+
+def test_queries_are_normalized_for_caching():
+    assert normalize_query("  Vegan\tCURRY  near\nme ") == "vegan curry near me"
+    assert normalize_query("ｃａｆé") == normalize_query("CAFÉ")
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    cache = LRUCache("test", 2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c"), len(cache)) == (1, 3, 2)
+
+
+def test_repeated_queries_are_served_from_the_cache(db, store):
+    index_pdf(db, store, DISHES)
+    first = store.similarity_search_with_score("Lentil curry", k=2)
+    again = store.similarity_search_with_score("  lentil   CURRY ", k=2)
+    assert again == first
+    assert store._embeddings.queries == ["Lentil curry"]
+
+
+def test_uploads_and_deletes_invalidate_cached_results(db, store):
+    soup = index_pdf(db, store, DISHES[:1], "soup.pdf")
+    assert [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[2], k=3)] == DISHES[:1]
+
+    index_pdf(db, store, DISHES[1:], "more.pdf")
+    assert [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[2], k=1)] == [DISHES[2]]
+
+    db.delete_pdf(soup)
+    store.delete_pdf(soup)
+    results = [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[2], k=3)]
+    assert DISHES[0] not in results
+    # The query embedding itself stays cached throughout
+    assert store._embeddings.queries == [DISHES[2]]
+
+
+def test_a_delete_in_another_worker_invalidates_cached_results(db, store):
+    soup = index_pdf(db, store, DISHES[:1], "soup.pdf")
+    index_pdf(db, store, DISHES[1:], "more.pdf")
+    assert DISHES[0] in [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[0], k=3)]
+
+    # Another worker process, with its own store and cache over the same directory
+    other = ShardedVectorStore(store.path).load()
+    db.delete_pdf(soup)
+    other.delete_pdf(soup)
+    results = [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[0], k=3)]
+    assert results and DISHES[0] not in results
+    # Results are keyed by the manifest version, which every worker reads alike
+    assert [shard.version for shard in store._stores()] == [shard.version for shard in other._stores()]
@@ -0,0 +1,49 @@
+import os
+
+
+def test_ready_reports_ok_then_draining(db, monkeypatch):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    # A worker drains once and exits; earlier TestClient shutdowns in this process left the flag set
+    monkeypatch.setitem(backend.server_state, "draining", False)
+    with TestClient(backend.app) as client:
+        response = client.get("/ready")
+        assert response.status_code == 200, response.json()
+        assert response.json()["status"] == "ready"
+
+        monkeypatch.setitem(backend.server_state, "draining", True)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "draining"
+        # Liveness is unaffected by draining
+        assert client.get("/health").status_code == 200
+
+
+def test_configure_environment_splits_ingest_workers(monkeypatch):
+    import serve
+
+    monkeypatch.delenv("INGEST_WORKERS", raising=False)
+    monkeypatch.delenv("FANOUT_DIR", raising=False)
+    monkeypatch.delenv("LLM_RPM", raising=False)
+    monkeypatch.setenv("LLM_TPM", "1000")
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    serve._configure_environment(4)
+    assert os.environ["INGEST_WORKERS"] == "2"
+    assert os.path.isdir(os.environ["FANOUT_DIR"])
+    # The rate budgets are the deployment's; each worker's gateway gets its share
+    assert float(os.environ["LLM_RPM"]) == 125
+    assert float(os.environ["LLM_TPM"]) == 250
+
+
+def test_configure_environment_keeps_explicit_settings(monkeypatch):
+    import serve
+
+    monkeypatch.setenv("INGEST_WORKERS", "3")
+    monkeypatch.setenv("FANOUT_DIR", "")
+    monkeypatch.setenv("LLM_RPM", "60")
+    monkeypatch.delenv("LLM_TPM", raising=False)
+    serve._configure_environment(1)
+    assert os.environ["INGEST_WORKERS"] == "3"
+    assert os.environ["FANOUT_DIR"] == ""
+    assert float(os.environ["LLM_RPM"]) == 60
@@ -0,0 +1,83 @@
+import pytest
+
+from backend.data_storage import filter_near_duplicates
+from backend.vector_store import ShardedVectorStore, shard_for, shards_for_chat, shards_for_user
+
+DISHES = [
+    "Chicken soup with carrots, celery and noodles",
+    "Beef stew slowly braised with potatoes and red wine",
+    "Vegan lentil curry with coconut milk and spinach",
+    "Grilled salmon with lemon butter and asparagus",
+]
+
+
+def user(db, name):
+    db.create_user(f"{name}@example.com", name, "x")
+    return db.get_user_by_email(f"{name}@example.com")
+
+
+def test_pdfs_are_sharded_by_chat_then_owner():
+    assert shard_for() == "global"
+    assert shard_for(owner_user_id=7) == "user-7"
+    assert shard_for(owner_user_id=7, chat_id=3) == "chat-3"
+
+
+def test_chats_and_users_see_their_own_shards_only(db):
+    alice, bob, carol = user(db, "alice"), user(db, "bob"), user(db, "carol")
+    chat = db.create_chat("Dinner", owner_user_id=alice["id"])
+    db.add_chat_member(chat, bob["id"])
+    assert set(shards_for_chat(chat)) >= {"global", f"chat-{chat}", f"user-{alice['id']}", f"user-{bob['id']}"}
+    assert f"user-{carol['id']}" not in shards_for_chat(chat)
+    assert set(shards_for_user(bob["id"])) == {"global", f"user-{bob['id']}", f"chat-{chat}"}
+    assert f"chat-{chat}" not in shards_for_user(carol["id"])
+
+
+def test_searches_stay_within_the_requested_shards(db, tmp_path):
+    store = ShardedVectorStore(str(tmp_path / "index")).load()
+    embed = store._embeddings.embed_query
+    public = db.add_pdf("public.pdf", 1)
+    private = db.add_pdf("private.pdf", 1, owner_user_id=7, shard="user-7")
+    store.add(public, [(text, embed(text)) for text in DISHES[:2]])
+    store.add(private, [(text, embed(text)) for text in DISHES[2:]])
+
+    def top(shards, k=4):
+        return [doc.page_content for doc, _ in store.similarity_search_with_score(DISHES[3], k=k, shards=shards)]
+
+    assert sorted(top(["global"])) == sorted(DISHES[:2])
+    assert top(["global", "user-7"], k=1) == [DISHES[3]]
+    assert sorted(ShardedVectorStore(store.path).load().shard_names()) == ["global", "user-7"]
+
+
+def test_near_duplicates_are_only_dropped_within_a_shard(db):
+    text = DISHES[0] + " simmered for an hour"
+    first = db.add_pdf("a.pdf", 1)
+    private = db.add_pdf("b.pdf", 1, owner_user_id=1, shard="user-1")
+    assert filter_near_duplicates(first, [text]) == [text]
+    assert filter_near_duplicates(private, [text]) == [text]
+
+
+@pytest.fixture
+def client(db):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    with TestClient(backend.app) as client:
+        yield client
+
+
+def auth(person):
+    from backend.auth import create_access_token
+    return {"Authorization": f"Bearer {create_access_token(person['email'])}"}
+
+
+def test_private_pdfs_are_hidden_from_other_users(db, client):
+    owner, stranger = user(db, "owner"), user(db, "stranger")
+    pdf = db.add_pdf("secret.pdf", 1, owner_user_id=owner["id"], shard=shard_for(owner_user_id=owner["id"]))
+
+    assert client.get(f"/pdfs/{pdf}/job", headers=auth(owner)).status_code == 200
+    assert client.get(f"/pdfs/{pdf}/job", headers=auth(stranger)).status_code == 404
+    assert client.get(f"/pdfs/{pdf}/job").status_code == 404
+    assert client.delete(f"/pdfs/{pdf}", headers=auth(stranger)).status_code == 403
+    assert db.get_pdf(pdf) is not None
+    assert client.delete(f"/pdfs/{pdf}", headers=auth(owner)).status_code == 200
+    assert db.get_pdf(pdf) is None
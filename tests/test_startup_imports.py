@@ -0,0 +1,16 @@
+from benchmarks.startup_imports import LAZY_MODULES, MODULE, compare, measure
+
+
+def test_importing_the_app_leaves_the_heavy_stacks_unloaded():
+    modules = measure(MODULE)
+    assert MODULE in modules
+    assert [m for m in LAZY_MODULES if m in modules] == []
+
+
+def test_compare_ignores_jitter_on_small_baselines():
+    baseline = {"import_ms": {"median": 50.0}}
+    assert compare({"import_ms": {"median": 65.0}}, baseline, tolerance=0.2) == []
+    assert compare({"import_ms": {"median": 75.0}}, baseline, tolerance=0.2) == [
+        "import_ms.median: 75.0 vs baseline 50.0"
+    ]
+    assert compare({"import_ms": {"median": 75.0}}, {}, tolerance=0.2) == []
@@ -0,0 +1,97 @@
+import pytest
+
+# (email, username): five usernames start with "ma", two more users match "ma" by email only
+USERS = [
+    ("zed@example.com", "Mary"),
+    ("a1@example.com", "marco"),
+    ("a2@example.com", "Malik"),
+    ("a3@example.com", "MAX_power"),
+    ("a4@example.com", "mango"),
+    ("mario@example.com", "plumber"),
+    ("MAe@example.com", "quinn"),
+    ("other@example.com", "olive"),
+]
+EXPECTED = ["Malik", "mango", "marco", "Mary", "MAX_power", "quinn", "plumber"]
+
+
+@pytest.fixture
+def users(db):
+    for email, username in USERS:
+        db.create_user(email, username, "hash")
+    return db
+
+
+def all_pages(db, prefix, limit):
+    pages, after = [], None
+    while True:
+        page, after = db.search_users(prefix, limit, after)
+        pages.append([user["username"] for user in page])
+        if after is None:
+            return pages
+
+
+def test_username_matches_come_first_then_email_only_matches(users):
+    page, after = users.search_users("MA", 20)
+    assert [user["username"] for user in page] == EXPECTED
+    assert after is None
+    assert set(page[0]) == {"id", "email", "username"}
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 6, 7])
+def test_pages_cover_every_match_once(users, limit):
+    pages = all_pages(users, "ma", limit)
+    assert [name for page in pages for name in page] == EXPECTED
+    assert all(0 < len(page) <= limit for page in pages[:-1])
+
+
+def test_no_match_and_blank_prefix(users):
+    assert users.search_users("xyz", 5) == ([], None)
+    assert users.search_users("   ", 5) == ([], None)
+
+
+def test_prefix_is_case_and_width_insensitive(users):
+    page, _ = users.search_users("ＭＡＲ", 5)  # full-width letters
+    assert [user["username"] for user in page] == ["marco", "Mary", "plumber"]
+
+
+@pytest.fixture
+def client(users):
+    from fastapi.testclient import TestClient
+    from backend import backend
+
+    with TestClient(backend.app) as client:
+        body = {"username": "searcher", "email": "searcher@example.com", "password": "secret123"}
+        token = client.post("/auth/register", json=body).json()["access_token"]
+        client.headers["Authorization"] = f"Bearer {token}"
+        yield client
+
+
+def test_endpoint_pages_with_an_opaque_cursor(client):
+    names, cursor = [], None
+    while True:
+        params = {"q": "ma", "limit": 3, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/users/search", params=params).json()
+        names += [user["username"] for user in body["users"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+        assert "=" not in cursor
+    assert names == EXPECTED
+
+
+def test_endpoint_caps_the_page_size(client, monkeypatch):
+    from backend import backend
+
+    monkeypatch.setattr(backend, "USER_SEARCH_MAX_LIMIT", 2)
+    body = client.get("/users/search", params={"q": "ma", "limit": 100}).json()
+    assert len(body["users"]) == 2 and body["next_cursor"]
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "WyJwaG9uZSIsICJ4IiwgMV0"])
+def test_endpoint_rejects_bad_cursors(client, cursor):
+    response = client.get("/users/search", params={"q": "ma", "cursor": cursor})
+    assert response.status_code == 400
+
+
+def test_endpoint_requires_a_query(client):
+    assert client.get("/users/search", params={"q": ""}).status_code == 422
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from backend import vector_store
+from backend.vector_store import VectorStore
+
+DISHES = [
+    "Chicken soup with carrots, celery and noodles",
+    "Beef stew slowly braised with potatoes and red wine",
+    "Vegan lentil curry with coconut milk and spinach",
+    "Grilled salmon with lemon butter and asparagus",
+]
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    return VectorStore(str(tmp_path / "index")).load()
+
+
+def embedded(store, texts):
+    return [(text, store._embeddings.embed_query(text)) for text in texts]
+
+
+def index_pdf(db, store, texts, name="menu.pdf", **pdf):
+    pdf_id = db.add_pdf(name, 1, **pdf)
+    store.add(pdf_id, embedded(store, texts))
+    return pdf_id
+
+
+def top(store, query, k=1):
+    return [doc.page_content for doc, _ in store.similarity_search_with_score(query, k=k)]
+
+
+def segment_files(store):
+    return sorted(f for f in os.listdir(store.path) if f.startswith("seg-"))
+
+
+def test_added_chunks_are_searchable_and_survive_a_reopen(db, store):
+    index_pdf(db, store, DISHES)
+    assert top(store, DISHES[2]) == [DISHES[2]]
+    reopened = VectorStore(store.path).load()
+    assert len(reopened) == len(DISHES)
+    assert top(reopened, DISHES[3]) == [DISHES[3]]
+
+
+def test_each_upload_appends_a_segment(db, store):
+    index_pdf(db, store, DISHES[:2], "a.pdf")
+    index_pdf(db, store, DISHES[2:], "b.pdf")
+    names = {f.split(".")[0] for f in segment_files(store)}
+    assert names == {"seg-000001", "seg-000002"}
+
+
+def test_deleted_pdfs_stop_matching_and_are_compacted_away(db, store):
+    keep = index_pdf(db, store, DISHES[:2], "a.pdf")
+    gone = index_pdf(db, store, DISHES[2:], "b.pdf")
+    db.delete_pdf(gone)
+    store.delete_pdf(gone)
+    assert DISHES[2] not in top(store, DISHES[2], k=4)
+    assert len(store) == 2
+
+    dropped = store.compact()
+    assert dropped == 2
+    assert {f.split(".")[0] for f in segment_files(store)} == {"seg-000003"}
+    assert sorted(top(store, DISHES[0], k=4)) == sorted(DISHES[:2])
+    assert db.get_pdf_vector_ids(keep)
+
+
+def test_windows_append_and_a_retry_replaces_earlier_vectors(db, store):
+    pdf = db.add_pdf("menu.pdf", 1)
+    store.add(pdf, embedded(store, DISHES[:1]))
+    store.add(pdf, embedded(store, DISHES[1:2]), replace=False)
+    assert len(store) == 2
+
+    # A failed attempt is discarded, then the retry starts over
+    store.delete_pdf(pdf)
+    assert len(store) == 0
+    store.add(pdf, embedded(store, DISHES[2:3]))
+    assert top(store, DISHES[2], k=4) == [DISHES[2]]
+
+
+def test_vectors_of_a_pdf_deleted_during_ingestion_never_match(db, store):
+    pdf = db.add_pdf("soup.pdf", 1)
+    db.delete_pdf(pdf)
+    store.add(pdf, embedded(store, DISHES[:1]))
+    assert top(store, DISHES[0]) == []
+
+
+@pytest.mark.parametrize("mode", ["mmap", "memory"])
+def test_segments_open_on_first_search_in_either_load_mode(db, store, monkeypatch, mode):
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_LOAD", mode)
+    texts = DISHES + ["Crème brûlée with vanilla — served cold"]
+    index_pdf(db, store, texts)
+    reopened = VectorStore(store.path).load()
+    assert len(reopened) == len(texts)
+    assert all(segment._index is None for segment in reopened._segments)
+    assert top(reopened, texts[-1]) == [texts[-1]]
+    assert all(segment._index is not None for segment in reopened._segments)
+
+
+def scores(store, query, k=4):
+    return sorted(round(score, 4) for _, score in store.similarity_search_with_score(query, k=k))
+
+
+def test_inner_product_scores_map_to_squared_l2(db, store, tmp_path, monkeypatch):
+    index_pdf(db, store, DISHES)
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", "flat_ip")
+    ip_store = VectorStore(str(tmp_path / "ip_index")).load()
+    index_pdf(db, ip_store, DISHES, "ip.pdf")
+    assert ip_store._manifest["metric"] == "ip"
+    assert scores(ip_store, DISHES[1]) == pytest.approx(scores(store, DISHES[1]), abs=1e-3)
+    assert scores(ip_store, DISHES[1])[0] == pytest.approx(0.0, abs=1e-3)
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "sq16", "flat_ip"])
+def test_compaction_writes_the_configured_base_type(db, tmp_path, monkeypatch, index_type):
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", index_type)
+    store = VectorStore(str(tmp_path / "index")).load()
+    index_pdf(db, store, DISHES[:2], "a.pdf")
+    index_pdf(db, store, DISHES[2:], "b.pdf")
+    store.compact()
+    (base,) = store._segments
+    assert vector_store.index_type_of(base.index) == index_type
+    assert top(store, DISHES[3]) == [DISHES[3]]
+
+
+def test_build_index_rejects_unknown_types():
+    with pytest.raises(ValueError):
+        vector_store.build_index("annoy", 8)
+
+
+def test_refresh_picks_up_segments_and_deletes_from_another_worker(db, store):
+    other = VectorStore(store.path).load()
+    pdf_id = index_pdf(db, other, DISHES)
+    assert len(store) == 0
+    store.refresh()
+    assert top(store, DISHES[1]) == [DISHES[1]]
+
+    other.delete_pdf(pdf_id)
+    store.refresh()
+    assert len(store) == 0